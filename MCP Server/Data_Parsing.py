@@ -1,48 +1,301 @@
+import base64
+import csv
+import io
+import itertools
 import json
+import time
+
+import armor_optimizer
+import metrics
+
+# The query, duplicate and search modules are imported by the functions that use
+# them, so they stay off the startup path until a tool needs them
+
+DEFAULT_PAGE_SIZE = 100
+
+OUTPUT_FORMATS = ("json", "pretty", "table", "csv")
+
+def _columns(rows):
+    columns = {}
+    for row in rows:
+        for key in row:
+            columns.setdefault(key, None)
+    return list(columns)
+
+def _to_table(rows):
+    """
+    Columnar encoding: one header plus a list per row. String columns that repeat
+    (owner, type, tier...) are stored once in "values" and referenced by index.
+    """
+    columns = _columns(rows)
+    values = {}
+    for col in columns:
+        col_values = [row.get(col) for row in rows]
+        if all(v is None or isinstance(v, str) for v in col_values):
+            distinct = list(dict.fromkeys(col_values))
+            if len(distinct) * 2 <= len(col_values):
+                values[col] = distinct
+    lookups = {col: {v: i for i, v in enumerate(vals)} for col, vals in values.items()}
+    table_rows = [
+        [lookups[col][row.get(col)] if col in lookups else row.get(col) for col in columns]
+        for row in rows
+    ]
+    return {"columns": columns, "values": values, "rows": table_rows}
+
+def _to_csv(rows):
+    out = io.StringIO()
+    columns = _columns(rows)
+    writer = csv.writer(out, lineterminator="\n")
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow([
+            json.dumps(v, separators=(",", ":")) if isinstance(v, (dict, list)) else ("" if v is None else v)
+            for v in (row.get(col) for col in columns)
+        ])
+    return out.getvalue()
+
+def render(rows, output_format="json", size_report=False):
+    """
+    Serialize a list of item dicts for a tool response.
+
+    Args:
+        rows: List of dicts to encode
+        output_format: "json" (compact), "pretty" (indented JSON), "table"
+            (columnar with deduplicated strings) or "csv"
+        size_report: Append a line comparing the encoded size to pretty JSON
+
+    Returns:
+        str: The encoded rows
+    """
+    with metrics.span("serialize", format=output_format):
+        if output_format == "json":
+            text = json.dumps(rows, separators=(",", ":"))
+        elif output_format == "pretty":
+            text = json.dumps(rows, indent=2)
+        elif output_format == "table":
+            text = json.dumps(_to_table(rows), separators=(",", ":"))
+        elif output_format == "csv":
+            text = _to_csv(rows)
+        else:
+            raise ValueError(f"Unknown output format {output_format!r}, expected one of {', '.join(OUTPUT_FORMATS)}")
+
+    if size_report:
+        size = len(text.encode("utf-8"))
+        baseline = len(json.dumps(rows, indent=2).encode("utf-8"))
+        text += f"\n# {len(rows)} items, {size} bytes as {output_format} ({baseline} bytes as pretty JSON, {100 * size // max(baseline, 1)}%)"
+    return text
 
 #with open("dim_inventory_response.json", "r") as f:
   # full_data = json.load(f)
 
-def get_weapons_current_character(full_data, current_character):
-    weapons_data = full_data.get("weapons", {}).get("data", [])
-    filtered_weapons = [w for w in weapons_data if w.get("owner") == current_character]
-    return json.dumps(filtered_weapons, indent=2)
+def _encode_cursor(offset, context, revision):
+    payload = json.dumps({"o": offset, "c": context, "v": revision}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+def _decode_cursor(cursor, context, revision):
+    """Return the offset stored in a cursor issued for the same listing, account and inventory revision."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        offset = int(payload["o"])
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Invalid cursor, start again without one") from None
+    if payload.get("c") != context:
+        raise ValueError("Cursor belongs to a different listing, start again without one")
+    if payload.get("v") != revision:
+        raise ValueError("Inventory changed since this cursor was issued, start again without one")
+    return offset
+
+def sort_items(items, sort_by):
+    """
+    Sort items by a query field such as "name", "power" or "-stats.Total".
+
+    A leading "-" sorts descending. Items missing the field always sort last.
+    """
+    from inventory_query import item_field
+
+    descending = sort_by.startswith("-")
+    field = sort_by.lstrip("-+")
+    keyed = [(item_field(item, field), item) for item in items]
+    present = [pair for pair in keyed if pair[0] is not None]
+    missing = [item for value, item in keyed if value is None]
+    present.sort(key=lambda pair: pair[0].casefold() if isinstance(pair[0], str) else pair[0], reverse=descending)
+    return [item for _, item in present] + missing
+
+def _iter_items(inventory, sort_by=None, **criteria):
+    items = inventory.iter_select(**criteria)
+    return iter(sort_items(items, sort_by)) if sort_by else items
+
+def snapshot_note(inventory):
+    """Return a "# ..." line flagging an offline snapshot and its age, or "" for live data."""
+    if inventory.saved_at is None:
+        return ""
+    age_minutes = max(0, int(time.time() - inventory.saved_at) // 60)
+    saved = time.strftime("%Y-%m-%d %H:%M", time.localtime(inventory.saved_at))
+    return f"\n# DIM is unavailable: answered from the snapshot saved {saved} ({age_minutes} min old)"
+
+def render_page(rows, inventory, context, limit=DEFAULT_PAGE_SIZE, cursor=None, output_format="json", size_report=False):
+    """
+    Render one page from a row generator, pulling only as many rows as the page needs.
+
+    Args:
+        rows: Iterator of row dicts in listing order
+        inventory: Inventory the rows came from (its account and content revision pin the cursor)
+        context: String identifying the listing, so cursors can't be replayed elsewhere
+        limit: Page size
+        cursor: Cursor from a previous page, or None for the first page
+
+    Returns:
+        str: Rendered rows, followed by a "# next cursor" line if more remain
+    """
+    if limit < 1:
+        raise ValueError("limit must be at least 1")
+    context = f"{inventory.account_id}|{context}"
+    offset = _decode_cursor(cursor, context, inventory.revision) if cursor else 0
+    # Fetch one extra row to learn whether another page exists
+    with metrics.span("filter"):
+        page = list(itertools.islice(rows, offset, offset + limit + 1))
+    has_more = len(page) > limit
+    page = page[:limit]
+
+    text = render(page, output_format, size_report)
+    if has_more:
+        next_cursor = _encode_cursor(offset + limit, context, inventory.revision)
+        text += f"\n# showing {offset + 1}-{offset + len(page)}, more available: cursor={next_cursor}"
+    elif not page and offset == 0:
+        text += "\n# no items matched"
+    return text + snapshot_note(inventory)
+
+def iter_weapons_current_character(inventory, current_character, sort_by=None):
+    for w in _iter_items(inventory, sort_by, kind="weapon", owner=current_character):
+        yield w.to_dict()
+
+def iter_armor_current_character(inventory, current_character, sort_by=None):
+    for a in _iter_items(inventory, sort_by, kind="armor", owner=current_character):
+        yield a.to_dict()
 
-def get_armor_current_character(full_data, current_character):
-    armor_data = full_data.get("armor", {}).get("data", [])
-    filtered_armor = [w for w in armor_data if w.get("owner") == current_character]
-    return json.dumps(filtered_armor, indent=2)
+def iter_weapons_all(inventory, sort_by=None):
+    for w in _iter_items(inventory, sort_by, kind="weapon"):
+        yield {"id": w.id, "name": w.name, "owner": w.owner, "gear_tier": w.tier, "type": w.type, "element": w.element}
 
-def get_weapons_all(full_data):
-    weapons_data = full_data.get("weapons", {}).get("data", [])
-    stripped_weapons = [{"id": w.get("id"), "name": w.get("name"), "owner": w.get("owner"), "gear_tier": w.get("gearTier"), "type": w.get("type"), "element": w.get("element")} for w in weapons_data]
-    return json.dumps(stripped_weapons, indent=2)
+def iter_armor_all(inventory, sort_by=None):
+    for a in _iter_items(inventory, sort_by, kind="armor"):
+        yield {"id": a.id, "name": a.name, "owner": a.owner, "gear_tier": a.tier, "type": a.type, "stat_total": a.stats.get("Total")}
 
-def get_armor_all(full_data):
-    armor_data = full_data.get("armor", {}).get("data", [])
-    stripped_armor = [{"id": w.get("id"), "name": w.get("name"), "owner": w.get("owner"), "gear_tier": w.get("gearTier"), "type": w.get("type"), "stat_total": w.get("stats", {}).get("Total")} for w in armor_data]
-    return json.dumps(stripped_armor, indent=2)
+def get_weapons_current_character(inventory, current_character, output_format="json", size_report=False, limit=DEFAULT_PAGE_SIZE, cursor=None, sort_by=None):
+    rows = iter_weapons_current_character(inventory, current_character, sort_by)
+    return render_page(rows, inventory, f"weapons|{current_character}|{sort_by}", limit, cursor, output_format, size_report)
 
-def get_most_recent_character_id(full_data):
-    stores = full_data["stores"]["data"]
-    characters = [s for s in stores if not s["isVault"]]
-    return max(characters, key=lambda c: c["lastPlayed"])["id"]
+def get_armor_current_character(inventory, current_character, output_format="json", size_report=False, limit=DEFAULT_PAGE_SIZE, cursor=None, sort_by=None):
+    rows = iter_armor_current_character(inventory, current_character, sort_by)
+    return render_page(rows, inventory, f"armor|{current_character}|{sort_by}", limit, cursor, output_format, size_report)
 
-def get_most_recent_character_name(full_data):
-    stores = full_data["stores"]["data"]
-    characters = [s for s in stores if not s["isVault"]]
-    return max(characters, key=lambda c: c["lastPlayed"])["name"]
+def get_weapons_all(inventory, output_format="json", size_report=False, limit=DEFAULT_PAGE_SIZE, cursor=None, sort_by=None):
+    rows = iter_weapons_all(inventory, sort_by)
+    return render_page(rows, inventory, f"weapons_all|{sort_by}", limit, cursor, output_format, size_report)
 
+def get_armor_all(inventory, output_format="json", size_report=False, limit=DEFAULT_PAGE_SIZE, cursor=None, sort_by=None):
+    rows = iter_armor_all(inventory, sort_by)
+    return render_page(rows, inventory, f"armor_all|{sort_by}", limit, cursor, output_format, size_report)
 
-def get_items_by_hash(item_hashes, full_data):
+def get_most_recent_character_id(inventory):
+    return inventory.current_character["id"]
+
+def get_most_recent_character_name(inventory):
+    return inventory.current_character["name"]
+
+
+def get_items_by_hash(item_hashes, inventory, output_format="json", size_report=False, limit=DEFAULT_PAGE_SIZE, cursor=None):
     """
     item_hashes: list of item hash strings or integers
-    full_data: loaded JSON object from dim_inventory_response.json
+    inventory: Inventory built from the current snapshot
+    """
+    wanted = list(dict.fromkeys(str(h) for h in item_hashes))
+    rows = (item.to_dict() for item in (inventory.get(h) for h in wanted) if item is not None)
+    return render_page(rows, inventory, f"hashes|{','.join(wanted)}", limit, cursor, output_format, size_report)
+
+def query_items(inventory, query, output_format="json", size_report=False, limit=DEFAULT_PAGE_SIZE, cursor=None, sort_by=None):
+    """
+    Run an inventory query and return one page of matching items.
+
+    Args:
+        inventory: Inventory built from the current snapshot
+        query: Query expression, see inventory_query for the syntax
+    """
+    from inventory_query import iter_query
+
+    matches = iter_query(query, inventory)
+    if sort_by:
+        matches = iter(sort_items(matches, sort_by))
+    rows = (item.to_dict() for item in matches)
+    return render_page(rows, inventory, f"query|{query}|{sort_by}", limit, cursor, output_format, size_report)
+
+def get_armor_sets(inventory, stat_targets=None, character_class=None, exotic=None, top_k=5, output_format="json"):
+    """
+    Return the best armor sets for stat targets, see armor_optimizer.optimize().
+
+    Args:
+        inventory: Inventory built from the current snapshot
+        stat_targets: Minimum value per stat name
+        character_class: "titan", "hunter" or "warlock"; defaults to the current character's class
+        exotic: Exotic armor (name or part of one) every set must include
+    """
+    class_type = None
+    if character_class:
+        class_type = armor_optimizer.CLASS_NAMES.get(character_class.casefold())
+        if class_type is None:
+            raise ValueError(f"Unknown class {character_class!r}, expected titan, hunter or warlock")
+    sets, searched, total = armor_optimizer.optimize(inventory, stat_targets, class_type, exotic, top_k)
+    text = render(sets, output_format)
+    if not sets:
+        text += "\n# no armor set meets these targets"
+    if searched < total:
+        text += f"\n# searched {searched} of {total} combinations, using the pieces with the most targeted stats"
+    return text + snapshot_note(inventory)
+
+def iter_duplicate_weapons(inventory, min_similarity=0.5):
+    import duplicates
+
+    for group in duplicates.find_duplicates(inventory, min_similarity):
+        keep = group["keep"]
+        for weapon, similarity in group["shard"]:
+            yield {
+                "id": weapon.id,
+                "name": weapon.name,
+                "owner": weapon.owner,
+                "tag": weapon.tag,
+                "perks": weapon.perk_names(equipped_only=True),
+                "similarity": round(similarity, 2),
+                "keep_id": keep.id,
+                "keep_perks": keep.perk_names(equipped_only=True),
+            }
+
+def get_duplicate_weapons(inventory, min_similarity=0.5, output_format="json", size_report=False, limit=DEFAULT_PAGE_SIZE, cursor=None):
+    """
+    Return shard candidates: duplicate weapon copies, each with the copy to keep instead.
+
+    Args:
+        inventory: Inventory built from the current snapshot
+        min_similarity: Jaccard similarity over equipped perks for copies to count as duplicates
+    """
+    rows = iter_duplicate_weapons(inventory, min_similarity)
+    return render_page(rows, inventory, f"duplicates|{min_similarity}", limit, cursor, output_format, size_report)
+
+def search_items(inventory, text, kind=None, output_format="json", size_report=False, limit=DEFAULT_PAGE_SIZE, cursor=None):
+    """
+    Full-text search over item names, types, perks, mods, tags and notes, best matches first.
+
+    Args:
+        inventory: Inventory built from the current snapshot
+        text: Words to find; every word must match, typos allowed
+        kind: "weapon" or "armor" to search only one kind
     """
-    gear = full_data.get("weapons", {}).get("data", [])
-    item_hashes_str = set(str(h) for h in item_hashes)
-    matched_items = [item for item in gear if str(item.get("id")) in item_hashes_str]
-    return json.dumps(matched_items, indent=2)
+    import search_index
+
+    with metrics.span("search"):
+        results = search_index.search(inventory, text, kind)
+    rows = ({"kind": item.kind, **item.to_dict(), "score": round(score, 2)} for item, score in results)
+    return render_page(rows, inventory, f"search|{text}|{kind}", limit, cursor, output_format, size_report)
 
 def process_transfer_response(response):
     """
@@ -66,6 +319,11 @@ def process_transfer_response(response):
             return f"Transferred {success_count} items successfully. Failed to transfer {fail_count} items: {', '.join(failed_items[:3])}{'...' if len(failed_items) > 3 else ''}"
     else:
         error_msg = response.get("error", "Unknown error")
+        results = response.get("results", [])
+        if results:
+            # Partial results streamed before the failure
+            success_count = len([r for r in results if r.get("success")])
+            return f"Transfer failed: {error_msg}. {success_count} of the reported items transferred successfully."
         return f"Transfer failed: {error_msg}"
 
 
@@ -9,37 +9,98 @@ listed dependencies before running the server.
 
 import asyncio
 import contextlib
+import functools
+import json
 import os
-from typing import List, Union
+import sys
+import weakref
+from typing import Dict, List, Literal, Optional, Union
+from urllib.parse import unquote
+
+# Imported first: startup stages are timed from here
+import metrics
 
 from fastmcp import FastMCP
+from fastmcp.server.middleware import Middleware
+from pydantic import AnyUrl
 
-from Data_Parsing import (
-    get_armor_all,
-    get_armor_current_character,
-    get_items_by_hash,
-    get_weapons_all,
-    get_weapons_current_character,
-    get_most_recent_character_id,
-    get_most_recent_character_name,
-    process_transfer_response,
+# Everything else (parsing, analysis, storage, the websocket server) is imported
+# by the tools and main() on first use, so the MCP handshake doesn't wait for it
 
-)
-from websocket_server import request_inventory, transfer_items, start_websocket_server
+metrics.mark_startup("imports")
 
 
 # FastMCP will ensure required packages are installed before start-up.
-mcp = FastMCP("Destiny_Inventory_Server", dependencies=["websockets"])
+mcp = FastMCP("Destiny_Inventory_Server", dependencies=["websockets", "numpy"])
+
+
+class _StartupTimer(Middleware):
+    """Marks when the client first lists tools, the end of startup as Claude sees it."""
+
+    async def on_list_tools(self, context, call_next):
+        metrics.mark_startup("tools_listed")
+        return await call_next(context)
+
+
+mcp.add_middleware(_StartupTimer())
+
+# "json" is compact JSON, "table" is a header plus rows with repeated strings stored once
+OutputFormat = Literal["json", "pretty", "table", "csv"]
+
+# List tools return `limit` items per call. When more remain the output ends with a
+# "# ... cursor=<token>" line; pass that token back as `cursor` for the next page.
+# `sort_by` takes a field such as "name", "power" or "-stats.Total" (descending).
+# `account` picks which connected DIM account to ask (see list_accounts); it can be
+# left out when only one account is connected.
+
+
+async def _load_inventory(account=None):
+    """The Inventory for an account's current snapshot, indexed on a worker thread."""
+    import workers
+    from inventory_model import inventory_for
+    from websocket_server import get_inventory
+
+    return await workers.run(inventory_for, await get_inventory(account=account))
+
+
+async def _cached(inventory, tool, args, render):
+    """Rendered output of a tool call, from the result cache (see result_cache)."""
+    from result_cache import results
+
+    return await results.get_or_render(inventory, tool, args, render)
+
+
+def reports_connect_wait(fn):
+    """Append how long a tool call waited for DIM to (re)connect to its text output. Apply below @metrics.timed_tool."""
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        from websocket_server import connect_wait
+
+        token = connect_wait.set(0.0)
+        try:
+            result = await fn(*args, **kwargs)
+            waited = connect_wait.get()
+            if waited >= 0.5:
+                result += f"\n# waited {waited:.1f}s for DIM to connect"
+            return result
+        finally:
+            connect_wait.reset(token)
+    return wrapper
 
 
 @mcp.tool
-async def weapons_for_current_character() -> str:
+@metrics.timed_tool
+@reports_connect_wait
+async def weapons_for_current_character(output_format: OutputFormat = "json", size_report: bool = False, limit: int = 100, cursor: Optional[str] = None, sort_by: Optional[str] = None, account: Optional[str] = None) -> str:
     """Return all weapon items owned by the current character, only use if user is requesting armor for current character. Otherwise default to account wide."""
 
-    full_data = await request_inventory()
-    return get_weapons_current_character(full_data, "Human Warlock")
+    from Data_Parsing import get_weapons_current_character
+
+    inventory = await _load_inventory(account)
+    return await _cached(inventory, "weapons_for_current_character", ["Human Warlock", output_format, size_report, limit, cursor, sort_by], lambda: get_weapons_current_character(inventory, "Human Warlock", output_format, size_report, limit, cursor, sort_by))
 
 @mcp.tool
+@metrics.timed_tool
 async def get_important_destiny_rules() -> str:
     """
     Returns important information about Destiny 2 loadouts. No input required. Safe to cache for the session.
@@ -51,74 +112,379 @@ async def get_important_destiny_rules() -> str:
     )
 
 @mcp.tool
-async def armor_for_current_character()-> str:
+@metrics.timed_tool
+@reports_connect_wait
+async def armor_for_current_character(output_format: OutputFormat = "json", size_report: bool = False, limit: int = 100, cursor: Optional[str] = None, sort_by: Optional[str] = None, account: Optional[str] = None) -> str:
     """Return all armor items owned by the current character, only use if user is requesting armor for current character. Otherwise default to account wide."""
 
-    full_data = await request_inventory()
-    return get_armor_current_character(full_data, "Human Warlock")
+    from Data_Parsing import get_armor_current_character
+
+    inventory = await _load_inventory(account)
+    return await _cached(inventory, "armor_for_current_character", ["Human Warlock", output_format, size_report, limit, cursor, sort_by], lambda: get_armor_current_character(inventory, "Human Warlock", output_format, size_report, limit, cursor, sort_by))
 
 
 @mcp.tool
-async def get_weapons_account_wide() -> str:
+@metrics.timed_tool
+@reports_connect_wait
+async def get_weapons_account_wide(output_format: OutputFormat = "json", size_report: bool = False, limit: int = 100, cursor: Optional[str] = None, sort_by: Optional[str] = None, account: Optional[str] = None) -> str:
     """Return stripped info for all weapons on account (including vault)."""
 
-    full_data = await request_inventory()
-    return get_weapons_all(full_data)
+    from Data_Parsing import get_weapons_all
+
+    inventory = await _load_inventory(account)
+    return await _cached(inventory, "get_weapons_account_wide", [output_format, size_report, limit, cursor, sort_by], lambda: get_weapons_all(inventory, output_format, size_report, limit, cursor, sort_by))
 
 
 @mcp.tool
-async def get_armor_account_wide() -> str:
+@metrics.timed_tool
+@reports_connect_wait
+async def get_armor_account_wide(output_format: OutputFormat = "json", size_report: bool = False, limit: int = 100, cursor: Optional[str] = None, sort_by: Optional[str] = None, account: Optional[str] = None) -> str:
     """Return stripped info for all armor on account (including vault)."""
 
-    full_data = await request_inventory()
-    return get_armor_all(full_data)
+    from Data_Parsing import get_armor_all
+
+    inventory = await _load_inventory(account)
+    return await _cached(inventory, "get_armor_account_wide", [output_format, size_report, limit, cursor, sort_by], lambda: get_armor_all(inventory, output_format, size_report, limit, cursor, sort_by))
+
+@mcp.tool
+@metrics.timed_tool
+@reports_connect_wait
+async def optimize_armor(stat_targets: Optional[Dict[str, int]] = None, character_class: Optional[str] = None, exotic: Optional[str] = None, top_k: int = 5, output_format: OutputFormat = "json", account: Optional[str] = None) -> str:
+    """
+    Return the best full armor sets (helmet, arms, chest, legs, class item) meeting minimum stat targets. Use this for "best armor for X stats" instead of reasoning over get_armor_account_wide.
+
+    Sets have at most one exotic and are ranked by stat tiers (10 points each, up to 100 per stat), then total stats.
+    stat_targets: e.g. {"Resilience": 100, "Discipline": 70}. character_class: titan/hunter/warlock, defaults to the current character.
+    exotic: require this exotic armor piece (name or part of one).
+    """
+    from Data_Parsing import get_armor_sets
+
+    inventory = await _load_inventory(account)
+    return await _cached(inventory, "optimize_armor", [stat_targets, character_class, exotic, top_k, output_format], lambda: get_armor_sets(inventory, stat_targets, character_class, exotic, top_k, output_format))
+
+@mcp.tool
+@metrics.timed_tool
+@reports_connect_wait
+async def find_duplicate_weapons(min_similarity: float = 0.5, output_format: OutputFormat = "json", size_report: bool = False, limit: int = 100, cursor: Optional[str] = None, account: Optional[str] = None) -> str:
+    """
+    Return duplicate weapons to shard, for vault cleanup: copies of the same weapon whose equipped perks overlap by at least min_similarity (Jaccard, 1.0 = identical roll).
+
+    Each row is a shard candidate with keep_id, the better copy to keep instead; copies tagged favorite or keep are never candidates. Junk-tagged and most redundant copies come first.
+    Candidate ids can be passed to transfer_items_to_vault.
+    """
+    from Data_Parsing import get_duplicate_weapons
+
+    inventory = await _load_inventory(account)
+    return await _cached(inventory, "find_duplicate_weapons", [min_similarity, output_format, size_report, limit, cursor], lambda: get_duplicate_weapons(inventory, min_similarity, output_format, size_report, limit, cursor))
 
 @mcp.tool
-async def items_by_hashes(item_hashes: List[Union[int, str]]) -> str:
+@metrics.timed_tool
+@reports_connect_wait
+async def items_by_hashes(item_hashes: List[Union[int, str]], output_format: OutputFormat = "json", size_report: bool = False, limit: int = 100, cursor: Optional[str] = None, account: Optional[str] = None) -> str:
     """Return items whose ID/hash matches any provided value."""
 
-    full_data = await request_inventory()
-    return get_items_by_hash(item_hashes, full_data)
+    from Data_Parsing import get_items_by_hash
+
+    inventory = await _load_inventory(account)
+    return await _cached(inventory, "items_by_hashes", [item_hashes, output_format, size_report, limit, cursor], lambda: get_items_by_hash(item_hashes, inventory, output_format, size_report, limit, cursor))
+
+@mcp.tool
+@metrics.timed_tool
+@reports_connect_wait
+async def query_inventory(query: str, output_format: OutputFormat = "json", size_report: bool = False, limit: int = 100, cursor: Optional[str] = None, sort_by: Optional[str] = None, account: Optional[str] = None) -> str:
+    """
+    Return only the weapons and armor matching a filter expression. Prefer this over the account-wide tools when the user asks about a subset of items.
+
+    Terms are ANDed by default; "or", "not" and parentheses are supported. Operators: ":"/"=" equals, "!=" not equals, "~" contains, ">", ">=", "<", "<=".
+    Fields: kind (weapon/armor), name, type, element, tier, owner, tag, notes, perk, mod, crafted (crafted level), power, stats.<Stat> (use _ for spaces).
+
+    Examples:
+      kind:armor stats.Total>=65 owner=vault
+      kind:weapon element:solar (perk~outlaw or perk~"kill clip") not tag:junk
+    """
+    from Data_Parsing import query_items
+
+    inventory = await _load_inventory(account)
+    return await _cached(inventory, "query_inventory", [query, output_format, size_report, limit, cursor, sort_by], lambda: query_items(inventory, query, output_format, size_report, limit, cursor, sort_by))
+
+@mcp.tool
+@metrics.timed_tool
+@reports_connect_wait
+async def search_inventory(text: str, kind: Optional[Literal["weapon", "armor"]] = None, output_format: OutputFormat = "json", size_report: bool = False, limit: int = 100, cursor: Optional[str] = None, account: Optional[str] = None) -> str:
+    """
+    Free-text search across weapons and armor by name, type, perks, mods, tag and notes, best matches first. Tolerates typos and partial words.
+
+    Use for "anything with Incandescent" or "items I noted as pvp"; use query_inventory for exact field filters and comparisons.
+    """
+    from Data_Parsing import search_items
+
+    inventory = await _load_inventory(account)
+    return await _cached(inventory, "search_inventory", [text, kind, output_format, size_report, limit, cursor], lambda: search_items(inventory, text, kind, output_format, size_report, limit, cursor))
 
 @mcp.tool
-async def transfer_items_to_character(item_hashes: List[Union[int, str]]) -> str:
+@metrics.timed_tool
+@reports_connect_wait
+async def transfer_items_to_character(item_hashes: List[Union[int, str]], account: Optional[str] = None) -> str:
     """Transfer items whose ID/hash matches any provided value to the user's current character."""
-    full_data = await request_inventory()
-    character_id = get_most_recent_character_id(full_data)
+    from Data_Parsing import get_most_recent_character_id, process_transfer_response
+    from websocket_server import transfer_items
 
-    response = await transfer_items(item_hashes, character_id)
+    inventory = await _load_inventory(account)
+    character_id = get_most_recent_character_id(inventory)
+
+    response = await transfer_items(item_hashes, character_id, account)
     return process_transfer_response(response)
 
 @mcp.tool
-async def transfer_items_to_vault(item_hashes: List[Union[int, str]]) -> str:
+@metrics.timed_tool
+@reports_connect_wait
+async def transfer_items_to_vault(item_hashes: List[Union[int, str]], account: Optional[str] = None) -> str:
     """Transfer items whose ID/hash matches any provided value to the user's vault."""
+    from Data_Parsing import process_transfer_response
+    from websocket_server import transfer_items
 
-    response = await transfer_items(item_hashes, "vault")
+    response = await transfer_items(item_hashes, "vault", account)
     return process_transfer_response(response)
 
 @mcp.tool
-async def get_current_character() -> str:
+@metrics.timed_tool
+@reports_connect_wait
+async def get_current_character(account: Optional[str] = None) -> str:
     """Return the race and class of the user's current character."""
-    full_data = await request_inventory()
+    from Data_Parsing import get_most_recent_character_name
+
+    inventory = await _load_inventory(account)
+
+    return get_most_recent_character_name(inventory)
+
+@mcp.tool
+@metrics.timed_tool
+async def list_accounts() -> str:
+    """Return the Destiny accounts with a DIM tab connected. Only needed when several players share this server; pass one as `account` to the other tools."""
+    from websocket_server import connected_accounts
+
+    return json.dumps(connected_accounts(), separators=(",", ":"))
+
+@mcp.tool
+async def server_stats() -> str:
+    """Return server performance metrics: per-tool and per-stage latency (p50/p95/p99), bytes in/out, snapshot and result cache hit rates, timeouts, reconnects and transfer outcomes. For diagnosing slowness, not for inventory questions."""
+    from result_cache import results
+
+    return json.dumps({**metrics.snapshot(), "result_cache": results.stats()}, separators=(",", ":"))
+
+# Live inventory resources. Once DIM pushes its changes, reading these is a dict
+# lookup, and clients that subscribe get notifications/resources/updated when
+# DIM pushes a change to that account. dim://inventory/<account>/... names the
+# account (as the tools' `account` argument does); the short forms read the only
+# connected account.
+
+RESOURCE_PREFIX = "dim://inventory/"
+
+# Resource URI -> MCP sessions subscribed to it
+_resource_subscribers = {}
+
+
+async def _weapons_json(account=None):
+    import workers
+    from Data_Parsing import iter_weapons_all
+
+    inventory = await _load_inventory(account)
+    return await workers.run(lambda: json.dumps(list(iter_weapons_all(inventory)), separators=(",", ":")))
+
+
+async def _armor_json(account=None):
+    import workers
+    from Data_Parsing import iter_armor_all
+
+    inventory = await _load_inventory(account)
+    return await workers.run(lambda: json.dumps(list(iter_armor_all(inventory)), separators=(",", ":")))
+
+
+async def _characters_json(account=None):
+    inventory = await _load_inventory(account)
+    return json.dumps(inventory.stores, separators=(",", ":"))
+
+
+@mcp.resource("dim://inventory/weapons", mime_type="application/json")
+async def weapons_resource() -> str:
+    """Every weapon on the account (including vault): id, name, owner, gear tier, type and element."""
+    return await _weapons_json()
+
+
+@mcp.resource("dim://inventory/armor", mime_type="application/json")
+async def armor_resource() -> str:
+    """Every armor piece on the account (including vault): id, name, owner, gear tier, type and stat total."""
+    return await _armor_json()
+
+
+@mcp.resource("dim://inventory/characters", mime_type="application/json")
+async def characters_resource() -> str:
+    """The account's characters and vault."""
+    return await _characters_json()
+
+
+@mcp.resource("dim://inventory/{account}/weapons", mime_type="application/json")
+async def account_weapons_resource(account: str) -> str:
+    """Every weapon on one account (see list_accounts), including vault."""
+    return await _weapons_json(account)
+
+
+@mcp.resource("dim://inventory/{account}/armor", mime_type="application/json")
+async def account_armor_resource(account: str) -> str:
+    """Every armor piece on one account (see list_accounts), including vault."""
+    return await _armor_json(account)
+
+
+@mcp.resource("dim://inventory/{account}/characters", mime_type="application/json")
+async def account_characters_resource(account: str) -> str:
+    """One account's characters and vault (see list_accounts)."""
+    return await _characters_json(account)
+
+
+def _enable_resource_subscriptions(server, on_subscribe, on_unsubscribe):
+    """
+    Register resources/subscribe handlers and advertise the capability.
+
+    FastMCP (2.11) has no public hook for resource subscriptions, so this reaches
+    into the low-level MCP SDK server it wraps (server._mcp_server, mcp 1.x): its
+    subscribe_resource()/unsubscribe_resource() decorators and request_context,
+    plus get_capabilities(), which never advertises subscribe itself and is
+    wrapped here. Everything this depends on is checked first.
+
+    Returns:
+        bool: Whether subscriptions are enabled; if the SDK no longer looks as
+        expected, an error is logged and resources are served without them
+    """
+    lowlevel = getattr(server, "_mcp_server", None)
+    missing = [
+        name for name in ("subscribe_resource", "unsubscribe_resource", "get_capabilities", "request_context")
+        if not hasattr(type(lowlevel), name)
+    ]
+    if lowlevel is None or missing:
+        print(
+            "❌ Resource subscriptions disabled: the MCP SDK no longer has "
+            f"{', '.join(missing) or '_mcp_server'} (written against fastmcp 2.11 / mcp 1.x)",
+            file=sys.stderr,
+        )
+        return False
+
+    @lowlevel.subscribe_resource()
+    async def _subscribe(uri):
+        on_subscribe(str(uri), lowlevel.request_context.session)
+
+    @lowlevel.unsubscribe_resource()
+    async def _unsubscribe(uri):
+        on_unsubscribe(str(uri), lowlevel.request_context.session)
+
+    get_capabilities = lowlevel.get_capabilities
+
+    @functools.wraps(get_capabilities)
+    def get_capabilities_with_subscribe(*args, **kwargs):
+        capabilities = get_capabilities(*args, **kwargs)
+        if capabilities.resources is not None:
+            capabilities.resources.subscribe = True
+        return capabilities
+
+    lowlevel.get_capabilities = get_capabilities_with_subscribe
+    return True
+
+
+def _subscribe_resource(uri, session):
+    if not _resource_subscribers:
+        # Nothing listens for inventory changes until someone subscribes
+        from websocket_server import add_inventory_listener
+
+        add_inventory_listener(_on_inventory_change)
+    _resource_subscribers.setdefault(uri, weakref.WeakSet()).add(session)
+
+
+def _unsubscribe_resource(uri, session):
+    subscribers = _resource_subscribers.get(uri)
+    if subscribers is not None:
+        subscribers.discard(session)
+
+
+_enable_resource_subscriptions(mcp, _subscribe_resource, _unsubscribe_resource)
+
+
+def _resource_account(uri):
+    """Account key a resource URI reads, or None if it names no single known account."""
+    from websocket_server import resolve_account
+
+    parts = uri.removeprefix(RESOURCE_PREFIX).split("/")
+    selector = unquote(parts[0]) if len(parts) == 2 else None
+    try:
+        return resolve_account(selector)
+    except LookupError:
+        return None
+
+
+async def _notify_resource_subscribers(account_key):
+    for uri, sessions in list(_resource_subscribers.items()):
+        if not sessions or _resource_account(uri) != account_key:
+            continue
+        for session in list(sessions):
+            try:
+                await session.send_resource_updated(AnyUrl(uri))
+            except Exception:
+                # The client has gone away
+                sessions.discard(session)
+
+
+def _on_inventory_change(account_key):
+    if any(_resource_subscribers.values()):
+        asyncio.get_running_loop().create_task(_notify_resource_subscribers(account_key))
+
+
+metrics.mark_startup("tools_registered")
+
+
+async def _start_websocket_server():
+    # A task of its own, so the import runs after the MCP server has started reading
+    from websocket_server import start_websocket_server
+
+    await start_websocket_server()
+
+
+async def _warm_up():
+    """Load what the first tool calls need once the MCP server is up."""
+    import armor_optimizer
+    import workers
+    from snapshot_store import load_latest
+
+    # Warm the offline snapshot so the first tool call doesn't pay for the disk read
+    await load_latest()
+    # Likewise NumPy for the first optimize_armor call
+    await workers.run(armor_optimizer.load_numpy)
 
-    return get_most_recent_character_name(full_data)
 
 async def main() -> None:
-    """Run both the WebSocket server and the MCP server."""
+    """
+    Run both the WebSocket server and the MCP server.
+
+    The MCP server starts first so the client's handshake and tool list don't
+    wait on anything else; the TLS setup, websocket bind and other warm-ups
+    follow in the background. Startup stages are timed in server_stats.
+    """
 
-    print("🚀 Starting DIM MCP Server...")
-    print(f"🔧 Working directory: {__file__}")
+    # stdout carries the MCP protocol, so progress goes to stderr
+    print("🚀 Starting DIM MCP Server...", file=sys.stderr)
+    print(f"🔧 Working directory: {__file__}", file=sys.stderr)
 
     websocket_task = None
     mcp_task = None
 
     try:
-        print("📡 Starting websocket server...")
-        websocket_task = asyncio.create_task(start_websocket_server(), name="websocket-server")
-
-        print("🤖 Starting MCP server...")
+        print("🤖 Starting MCP server...", file=sys.stderr)
         mcp_task = asyncio.create_task(mcp.run_async(), name="mcp-server")
 
+        print("📡 Starting websocket server...", file=sys.stderr)
+        websocket_task = asyncio.create_task(_start_websocket_server(), name="websocket-server")
+        asyncio.create_task(_warm_up(), name="warm-up")
+
+        if metrics.METRICS_PORT:
+            asyncio.create_task(metrics.start_http_server(), name="metrics-http")
+
         # --- Orphan guard: exit if launcher disappears (PPID becomes 1) ---
         async def _orphan_guard():
             while True:
@@ -134,18 +500,18 @@ async def main() -> None:
         # -----------------------------------------------------------------
 
         # Run both tasks concurrently
-        print("⚡ Running both servers concurrently...")
+        print("⚡ Running both servers concurrently...", file=sys.stderr)
         await asyncio.gather(websocket_task, mcp_task, return_exceptions=True)
 
     except KeyboardInterrupt:
-        print("\n⚠️ Keyboard interrupt received, shutting down...")
+        print("\n⚠️ Keyboard interrupt received, shutting down...", file=sys.stderr)
     except Exception as e:
-        print(f"❌ Error running servers: {e}")
+        print(f"❌ Error running servers: {e}", file=sys.stderr)
         import traceback
         traceback.print_exc()
     finally:
         # Cancel both tasks if one fails or we're shutting down
-        print("🛑 Shutting down servers...")
+        print("🛑 Shutting down servers...", file=sys.stderr)
 
         if websocket_task and not websocket_task.done():
             websocket_task.cancel()
@@ -165,4 +531,4 @@ if __name__ == "__main__":
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
-        print("\n👋 Shutting down...")
+        print("\n👋 Shutting down...", file=sys.stderr)
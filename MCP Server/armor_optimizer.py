@@ -0,0 +1,236 @@
+"""Search armor combinations for the best sets that meet stat targets.
+
+Armor for one class is loaded into NumPy arrays grouped by slot (helmet, arms,
+chest, legs, class item). Pieces that can't appear in the top k are pruned, then
+every remaining helmet x arms pair is summed against every chest x legs x class
+item triple in vectorized chunks. A set counts if it meets every target and has
+at most one exotic. Sets are ranked by stat tiers (each stat counts up to
+STAT_CAP in steps of TIER_SIZE), then by total clipped stats. The search works
+on arrays alone, so workers.call_shared can run it in a separate process.
+
+NumPy is optional for the server as a whole; only this module needs it, and
+imports it on first use (see load_numpy) so it stays off the startup path.
+"""
+
+from __future__ import annotations
+
+from math import prod
+
+import metrics
+import workers
+
+STAT_CAP = 100
+TIER_SIZE = 10
+EXOTIC_TIER = "Exotic"
+# DestinyClass value for armor any class can wear
+ANY_CLASS = 3
+CLASS_NAMES = {"titan": 0, "hunter": 1, "warlock": 2}
+
+# Slot order in results; DIM's bucket names
+SLOT_ORDER = ("Helmet", "Gauntlets", "Chest Armor", "Leg Armor", "Class Armor")
+# Class item types, for armor from DIM builds that didn't send slot/classType
+_CLASS_ITEM_TYPES = {"Titan Mark": 0, "Hunter Cloak": 1, "Warlock Bond": 2}
+# Stats in the armor summary that are derived from the others
+_DERIVED_STATS = {"Total", "Custom"}
+
+# NumPy, once load_numpy has imported it
+np = None
+
+# Combinations searched exhaustively. Above this, slots keep only their most
+# relevant pieces (by targeted stats) until the product fits.
+MAX_COMBINATIONS = 3_000_000
+# Summed stat values held in memory per vectorized step
+_CHUNK_VALUES = 4_000_000
+
+
+def load_numpy():
+    """
+    Import NumPy for the optimizer.
+
+    Returns:
+        bool: Whether NumPy is installed; the other tools work without it
+    """
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            return False
+        np = numpy
+    return True
+
+
+def _slot(item):
+    if item.slot:
+        return item.slot
+    return SLOT_ORDER[-1] if item.type in _CLASS_ITEM_TYPES else item.type
+
+
+def _class_type(item):
+    if item.class_type is not None:
+        return item.class_type
+    return _CLASS_ITEM_TYPES.get(item.type, ANY_CLASS)
+
+
+def _stat_names(pieces):
+    names = {}
+    for item in pieces:
+        for name in item.stats:
+            if name not in _DERIVED_STATS:
+                names.setdefault(name, None)
+    return list(names)
+
+
+def _resolve_targets(targets, stat_names):
+    by_key = {name.casefold().replace("_", " "): i for i, name in enumerate(stat_names)}
+    minimums = np.zeros(len(stat_names), dtype=np.int16)
+    for name, value in (targets or {}).items():
+        index = by_key.get(name.casefold().replace("_", " "))
+        if index is None:
+            raise ValueError(f"Unknown armor stat {name!r}. Expected one of: {', '.join(stat_names)}")
+        minimums[index] = min(int(value), STAT_CAP)
+    return minimums
+
+
+def _prune(stats, exotic, keep):
+    """
+    Mask of pieces dominated (no better in any stat, worse in one) by fewer than
+    `keep` pieces of the same exotic status; the rest can't reach the top `keep`.
+    """
+    at_least = (stats[:, None, :] >= stats[None, :, :]).all(axis=2)
+    better = (stats[:, None, :] > stats[None, :, :]).any(axis=2)
+    same_kind = exotic[:, None] == exotic[None, :]
+    dominated_by = (at_least & better & same_kind).sum(axis=0)
+    return dominated_by < keep
+
+
+def _pairwise(a_stats, a_exotic, b_stats, b_exotic):
+    """Every a + b combination, flattened in row-major (a, b) order."""
+    stats = (a_stats[:, None, :] + b_stats[None, :, :]).reshape(-1, a_stats.shape[1])
+    exotic = (a_exotic[:, None] + b_exotic[None, :]).reshape(-1)
+    return stats, exotic
+
+
+def _search(h_stats, g_stats, c_stats, l_stats, k_stats, h_ex, g_ex, c_ex, l_ex, k_ex, minimums, exotics_required, top_k):
+    """
+    Score every helmet x arms x chest x legs x class item combination.
+
+    Takes only arrays and numbers, so it can run in a worker process.
+
+    Returns:
+        list: (score, (helmet, arms, chest, legs, class item) indexes) for the
+        top_k valid sets, best first
+    """
+    load_numpy()   # a fresh worker process hasn't imported it yet
+    left_stats, left_ex = _pairwise(h_stats, h_ex, g_stats, g_ex)
+    right_stats, right_ex = _pairwise(*_pairwise(c_stats, c_ex, l_stats, l_ex), k_stats, k_ex)
+    step = max(1, _CHUNK_VALUES // max(1, right_stats.size))
+    best = []   # (score, left index, right index)
+    for start in range(0, len(left_stats), step):
+        sums = left_stats[start:start + step, None, :] + right_stats[None, :, :]
+        exotics = left_ex[start:start + step, None] + right_ex[None, :]
+        clipped = np.minimum(sums, STAT_CAP)
+        score = (clipped // TIER_SIZE).sum(axis=2, dtype=np.int32) * 1000 + clipped.sum(axis=2, dtype=np.int32)
+        valid = (sums >= minimums).all(axis=2) & (exotics <= 1) & (exotics >= exotics_required)
+        score = np.where(valid, score, -1).reshape(-1)
+        count = min(top_k, score.size)
+        top = np.argpartition(score, -count)[-count:]
+        for flat in top:
+            if score[flat] >= 0:
+                row, col = divmod(int(flat), right_stats.shape[0])
+                best.append((int(score[flat]), start + row, col))
+        best = sorted(best, reverse=True)[:top_k]
+
+    results = []
+    for score, left, right in best:
+        h, g = np.unravel_index(left, (len(h_stats), len(g_stats)))
+        c, l, k = np.unravel_index(right, (len(c_stats), len(l_stats), len(k_stats)))
+        results.append((score, (int(h), int(g), int(c), int(l), int(k))))
+    return results
+
+
+def optimize(inventory, targets=None, class_type=None, exotic=None, top_k=5):
+    """
+    Find the top_k armor sets for a class that meet stat targets.
+
+    Args:
+        inventory: Inventory built from the current snapshot
+        targets: Minimum value per stat name, e.g. {"Resilience": 100}
+        class_type: DestinyClass (0 Titan, 1 Hunter, 2 Warlock); defaults to the
+            current character's class
+        exotic: Name (or part of one) of an exotic every set must include; by
+            default sets have at most one exotic of any kind
+        top_k: Number of sets to return
+
+    Returns:
+        tuple: (sets, searched, total) - sets as dicts, best first, and how many
+        combinations were searched out of how many there were
+
+    Raises:
+        RuntimeError: If NumPy isn't installed
+        ValueError: For unknown stats, classes or exotics, or a missing slot
+    """
+    if not load_numpy():
+        raise RuntimeError("The armor optimizer needs NumPy: pip install numpy")
+    if top_k < 1:
+        raise ValueError("top_k must be at least 1")
+    if class_type is None:
+        character = inventory.current_character
+        if character is None:
+            raise ValueError("No character found; pass a class")
+        class_type = character.get("classType")
+
+    pieces = [a for a in inventory.iter_select(kind="armor") if _class_type(a) in (class_type, ANY_CLASS)]
+    if exotic is not None:
+        wanted = exotic.casefold()
+        pieces = [a for a in pieces if a.tier != EXOTIC_TIER or wanted in (a.name or "").casefold()]
+        if not any(a.tier == EXOTIC_TIER for a in pieces):
+            raise ValueError(f"No exotic armor matching {exotic!r} for this class")
+    stat_names = _stat_names(pieces)
+    minimums = _resolve_targets(targets, stat_names)
+
+    by_slot = {}
+    for item in pieces:
+        by_slot.setdefault(_slot(item), []).append(item)
+    missing = [slot for slot in SLOT_ORDER if slot not in by_slot]
+    if missing:
+        raise ValueError(f"No armor for this class in: {', '.join(missing)}")
+
+    with metrics.span("optimize_load"):
+        slots = []
+        weights = np.where(minimums > 0, 2, 1)
+        for slot in SLOT_ORDER:
+            items = by_slot[slot]
+            stats = np.array([[a.stats.get(name) or 0 for name in stat_names] for a in items], dtype=np.int16)
+            stats = np.minimum(stats, STAT_CAP)
+            is_exotic = np.array([a.tier == EXOTIC_TIER for a in items], dtype=np.int8)
+            keep = _prune(stats, is_exotic, top_k)
+            items = [a for a, k in zip(items, keep) if k]
+            stats, is_exotic = stats[keep], is_exotic[keep]
+            # Most relevant first, so trimming to the budget drops the least useful pieces
+            order = np.argsort(-(stats * weights).sum(axis=1), kind="stable")
+            slots.append([[items[i] for i in order], stats[order], is_exotic[order]])
+
+    total = prod(len(items) for items, _, _ in slots)
+    while prod(len(items) for items, _, _ in slots) > MAX_COMBINATIONS:
+        largest = max(slots, key=lambda s: len(s[0]))
+        count = max(1, len(largest[0]) * 9 // 10)
+        largest[:] = [largest[0][:count], largest[1][:count], largest[2][:count]]
+    searched = prod(len(items) for items, _, _ in slots)
+
+    exotics_required = 1 if exotic is not None else 0
+    arrays = [stats for _, stats, _ in slots] + [is_exotic for _, _, is_exotic in slots] + [minimums]
+    with metrics.span("optimize_search"):
+        best = workers.call_shared(_search, arrays, exotics_required, top_k)
+
+    sets = []
+    for score, indexes in best:
+        chosen = [items[i] for (items, _, _), i in zip(slots, indexes)]
+        stats = sum(slot_stats[i] for (_, slot_stats, _), i in zip(slots, indexes))
+        sets.append({
+            "tiers": score // 1000,
+            "stats": {name: int(value) for name, value in zip(stat_names, stats)},
+            "exotic": next((a.name for a in chosen if a.tier == EXOTIC_TIER), None),
+            "items": [{"id": a.id, "name": a.name, "slot": slot, "owner": a.owner} for slot, a in zip(SLOT_ORDER, chosen)],
+        })
+    return sets, searched, total
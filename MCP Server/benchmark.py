@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+Benchmark the MCP server end to end against a scripted fake DIM.
+
+Starts start_websocket_server() with a throwaway self-signed certificate,
+connects a FakeDim serving a synthetic inventory, then calls every FastMCP
+tool through an in-process MCP client with N concurrent callers. Reports
+p50/p95/p99 latency, response bytes, websocket bytes and throughput, and the
+server's memory per scenario: RSS before and after, and how far it rose while
+the tools ran. The FakeDim runs in its own process so its memory isn't counted.
+
+With --startup N it instead launches MCP_server.py N times over stdio, as
+Claude Desktop does, and reports how long the initialize handshake and the tool
+list took, with the server's own startup breakdown from server_stats.
+
+Usage:
+    python benchmark.py --items 100 600 5000 --latency 20 --concurrency 1 8
+    python benchmark.py --items 600 --ttl 0 --json results.json
+    python benchmark.py --startup 5
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+# Keep benchmark snapshots away from the real Desktop files and snapshot store
+_scratch_dir = tempfile.mkdtemp(prefix="dim-mcp-bench-")
+os.environ.setdefault("DIM_MCP_DATA_DIR", _scratch_dir)
+
+# Arguments for tools with required parameters, built from the synthetic inventory
+TOOL_ARGS = {
+    "items_by_hashes": lambda inv: {"item_hashes": [i["id"] for i in inv["weapons"][:5] + inv["armor"][:5]]},
+    "query_inventory": lambda inv: {"query": "kind:armor stats.Total>=65 not tag:junk"},
+    "search_inventory": lambda inv: {"text": "incandecent pvp"},
+    "transfer_items_to_vault": lambda inv: {"item_hashes": [i["id"] for i in inv["weapons"][:3]]},
+    "transfer_items_to_character": lambda inv: {"item_hashes": [i["id"] for i in inv["weapons"][:3]]},
+}
+
+
+def make_certificate(directory):
+    """Create a self-signed localhost certificate with openssl; returns (cert, key) paths."""
+    cert_path = os.path.join(directory, "cert.pem")
+    key_path = os.path.join(directory, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-subj", "/CN=localhost", "-keyout", key_path, "-out", cert_path],
+        check=True,
+        capture_output=True,
+    )
+    return cert_path, key_path
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100 * len(ordered))))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def rss_mb():
+    """
+    This process's resident set size in MB. Without /proc (macOS) it is the peak
+    so far instead, so the growth MemorySampler reports is how far a run raised it.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except OSError:
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is bytes on macOS and kilobytes on Linux
+        return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+class MemorySampler:
+    """Samples RSS while a run is in progress: its value before and after, and its peak."""
+
+    def __init__(self, interval=0.02):
+        self.interval = interval
+        self.start_mb = self.end_mb = self.peak_mb = None
+        self._task = None
+
+    async def __aenter__(self):
+        self.start_mb = self.peak_mb = rss_mb()
+        self._task = asyncio.create_task(self._sample(), name="rss-sampler")
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self.end_mb = rss_mb()
+        self.peak_mb = max(self.peak_mb, self.end_mb)
+
+    async def _sample(self):
+        while True:
+            self.peak_mb = max(self.peak_mb, rss_mb())
+            await asyncio.sleep(self.interval)
+
+    def report(self):
+        """{"rss_start_mb", "rss_end_mb", "rss_growth_mb"}; growth is the peak minus the start."""
+        return {
+            "rss_start_mb": round(self.start_mb, 1),
+            "rss_end_mb": round(self.end_mb, 1),
+            "rss_growth_mb": round(self.peak_mb - self.start_mb, 1),
+        }
+
+
+def format_memory(report):
+    return (
+        f"RSS {report['rss_start_mb']:.1f} -> {report['rss_end_mb']:.1f} MB, "
+        f"peak +{report['rss_growth_mb']:.1f} MB"
+    )
+
+
+def _ws_bytes():
+    """Bytes the websocket server has received from and sent to DIM so far."""
+    import metrics
+
+    counters = metrics.snapshot()["counters"]
+    return tuple(sum(counters.get(name, {}).values()) for name in ("ws_bytes_in", "ws_bytes_out"))
+
+
+async def _wait_for_port(port, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection("localhost", port)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Websocket server did not start on port {port}")
+            await asyncio.sleep(0.05)
+
+
+async def _wait_for_connection(websocket_server, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not websocket_server.connected_accounts():
+        if time.monotonic() > deadline:
+            raise RuntimeError("Fake DIM did not connect")
+        await asyncio.sleep(0.01)
+
+
+async def bench_tool(client, name, args, concurrency, iterations):
+    """Run `iterations` calls on each of `concurrency` callers; returns per-call stats."""
+    latencies, sizes, errors = [], [], 0
+
+    async def caller():
+        nonlocal errors
+        for _ in range(iterations):
+            start = time.perf_counter()
+            result = await client.call_tool(name, args, raise_on_error=False)
+            latencies.append(time.perf_counter() - start)
+            text = "".join(getattr(c, "text", "") for c in result.content)
+            sizes.append(len(text.encode("utf-8")))
+            errors += bool(result.is_error)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(caller() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "tool": name,
+        "calls": len(latencies),
+        "errors": errors,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "mean_bytes": sum(sizes) / len(sizes),
+        "calls_per_s": len(latencies) / elapsed,
+    }
+
+
+async def run_scenario(args, size, concurrency, port):
+    import websocket_server
+    from fake_dim import make_inventory
+    from fastmcp import Client
+    from MCP_server import mcp
+
+    # The same inventory the fake DIM process serves, for building tool arguments
+    inventory = make_inventory(size)
+    websocket_server.invalidate_inventory()
+    bytes_in, bytes_out = _ws_bytes()
+    fake = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_dim.py"),
+        "--url", f"wss://localhost:{port}", "--items", str(size), "--latency", str(args.latency),
+    )
+    try:
+        await _wait_for_connection(websocket_server)
+        rows = []
+        async with MemorySampler() as memory, Client(mcp) as client:
+            tools = await client.list_tools()
+            for tool in tools:
+                required = tool.inputSchema.get("required", [])
+                if tool.name in TOOL_ARGS:
+                    tool_args = TOOL_ARGS[tool.name](inventory)
+                elif not required:
+                    tool_args = {}
+                else:
+                    print(f"  skipping {tool.name}: no benchmark arguments for {required}")
+                    continue
+                rows.append(await bench_tool(client, tool.name, tool_args, concurrency, args.iterations))
+        total_in, total_out = _ws_bytes()
+        return {
+            "items": size,
+            "concurrency": concurrency,
+            "latency_ms": args.latency,
+            "ws_bytes_in": total_in - bytes_in,
+            "ws_bytes_out": total_out - bytes_out,
+            **memory.report(),
+            "tools": rows,
+        }
+    finally:
+        if fake.returncode is None:
+            fake.terminate()
+        await fake.wait()
+        # Let the server notice the disconnect before the next scenario connects
+        await asyncio.sleep(0.1)
+
+
+async def _rpc(process, request_id, method, params=None):
+    """Send a JSON-RPC request over the server's stdio and return its result."""
+    message = {"jsonrpc": "2.0", "id": request_id, "method": method, "params": params or {}}
+    process.stdin.write(json.dumps(message).encode() + b"\n")
+    await process.stdin.drain()
+    while True:
+        line = await process.stdout.readline()
+        if not line:
+            raise RuntimeError(f"Server exited before answering {method}")
+        reply = json.loads(line)
+        if reply.get("id") == request_id:
+            if "error" in reply:
+                raise RuntimeError(f"{method} failed: {reply['error']}")
+            return reply["result"]
+
+
+async def bench_startup(launch, cert_path, key_path, port):
+    """Launch MCP_server.py over stdio and time the handshake, tool list and background startup."""
+    env = {**os.environ, "DIM_MCP_CERT_PATH": cert_path, "DIM_MCP_KEY_PATH": key_path, "DIM_MCP_PORT": str(port)}
+    start = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, "MCP_server.py",
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        await _rpc(process, 1, "initialize", {
+            "protocolVersion": "2025-06-18",
+            "capabilities": {},
+            "clientInfo": {"name": "dim-mcp-benchmark", "version": "1"},
+        })
+        initialized = time.perf_counter() - start
+        process.stdin.write(json.dumps({"jsonrpc": "2.0", "method": "notifications/initialized"}).encode() + b"\n")
+        tools = await _rpc(process, 2, "tools/list")
+        listed = time.perf_counter() - start
+        # The websocket server comes up in the background; wait for it to report in
+        for attempt in range(50):
+            result = await _rpc(process, 3 + attempt, "tools/call", {"name": "server_stats", "arguments": {}})
+            stages = json.loads(result["content"][0]["text"])["startup_s"]
+            if "websocket_listening" in stages:
+                break
+            await asyncio.sleep(0.1)
+        return {
+            "launch": launch,
+            "initialize_ms": initialized * 1000,
+            "tools_list_ms": listed * 1000,
+            "tools": len(tools["tools"]),
+            "stages_ms": {stage: seconds * 1000 for stage, seconds in stages.items()},
+        }
+    finally:
+        process.terminate()
+        await process.wait()
+
+
+def print_startup(results):
+    print("\n=== startup over stdio (server stages are timed from its first import) ===")
+    print(f"{'launch':<8}{'initialize ms':>15}{'tools/list ms':>15}  server stages (ms)")
+    for row in results:
+        stages = ", ".join(f"{stage} {ms:.0f}" for stage, ms in row["stages_ms"].items())
+        print(f"{row['launch']:<8}{row['initialize_ms']:>15.0f}{row['tools_list_ms']:>15.0f}  {stages}")
+
+
+def print_scenario(result):
+    print(
+        f"\n=== {result['items']} items, {result['concurrency']} concurrent callers, "
+        f"{result['latency_ms']} ms DIM latency ==="
+    )
+    print(f"{'tool':<32}{'calls':>7}{'err':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'bytes':>10}{'calls/s':>10}")
+    for row in result["tools"]:
+        print(
+            f"{row['tool']:<32}{row['calls']:>7}{row['errors']:>5}{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}"
+            f"{row['p99_ms']:>10.1f}{row['mean_bytes']:>10.0f}{row['calls_per_s']:>10.1f}"
+        )
+    print(
+        f"websocket: {result['ws_bytes_in']} bytes in, {result['ws_bytes_out']} bytes out; "
+        f"{format_memory(result)}"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, nargs="+", default=[100, 600, 5000], help="inventory sizes to test")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8], help="concurrent callers per tool")
+    parser.add_argument("--iterations", type=int, default=10, help="calls per caller per tool")
+    parser.add_argument("--latency", type=float, default=20.0, help="fake DIM response latency in ms")
+    parser.add_argument("--ttl", type=float, default=None, help="override the snapshot cache TTL in seconds (0 disables it)")
+    parser.add_argument("--port", type=int, default=9131, help="websocket port for the benchmark server")
+    parser.add_argument("--json", help="also write results to this JSON file")
+    parser.add_argument("--verbose", action="store_true", help="keep the server's INFO logging")
+    parser.add_argument("--startup", type=int, metavar="N", help="time N server launches over stdio instead")
+    args = parser.parse_args()
+
+    if args.startup:
+        cert_path, key_path = make_certificate(_scratch_dir)
+        results = [await bench_startup(i + 1, cert_path, key_path, args.port) for i in range(args.startup)]
+        print_startup(results)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(results, f, indent=2)
+            print(f"\n📁 Results written to {args.json}")
+        return
+
+    import websocket_server
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+    if args.ttl is not None:
+        websocket_server.SNAPSHOT_TTL = args.ttl
+
+    cert_path, key_path = make_certificate(_scratch_dir)
+    server_task = asyncio.create_task(
+        websocket_server.start_websocket_server(cert_path, key_path, args.port), name="websocket-server"
+    )
+    results = []
+    try:
+        await _wait_for_port(args.port)
+        for size in args.items:
+            for concurrency in args.concurrency:
+                result = await run_scenario(args, size, concurrency, args.port)
+                print_scenario(result)
+                results.append(result)
+    finally:
+        server_task.cancel()
+        await asyncio.gather(server_task, return_exceptions=True)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n📁 Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
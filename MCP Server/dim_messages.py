@@ -0,0 +1,289 @@
+"""Schema-driven decoding of the messages DIM sends over the websocket.
+
+decode() parses a frame and checks its shape once, at the boundary. Weapons and
+armor come back as slotted Item records rather than nested dicts, with their
+repeated strings (names, types, owners, perks) interned. Fields that no tool
+reads (store emblems, anything DIM adds later) are dropped. Everything
+downstream can then use attributes instead of .get() chains.
+
+When the ping asks for it, DIM sends pongs with the "strings" encoding: every
+repeated name is sent once in a "strings" table and items refer to it by index.
+
+Large pongs can also arrive in pieces: numbered pong_chunk messages carrying
+items (and the strings they add to the table), then the pong itself with a
+"chunks" count and no items. ChunkedPong decodes each chunk as it arrives and
+hands back the complete pong on commit.
+
+Messages of types with no schema here (hello, ...) pass through as parsed.
+"""
+
+import json
+import sys
+
+from inventory_model import Item
+
+# Store fields the tools use; the rest of DIM's store summary is dropped
+STORE_FIELDS = ("id", "name", "isVault", "classType", "className", "powerLevel", "lastPlayed")
+
+# Summary/pong container name -> Item.kind
+_ITEM_KINDS = {"weapons": "weapon", "armor": "armor"}
+
+# Value of a pong's "encoding" field when names are sent through a string table
+STRING_TABLE_ENCODING = "strings"
+
+
+class MessageError(ValueError):
+    """A DIM message that doesn't match its schema."""
+
+    def __init__(self, message, message_type=None, request_id=None):
+        super().__init__(message)
+        self.message_type = message_type
+        self.request_id = request_id
+
+
+def _expect(condition, path, expected):
+    if not condition:
+        raise MessageError(f"{path}: expected {expected}")
+
+
+def _list(value, path):
+    _expect(isinstance(value, list), path, "a list")
+    return value
+
+
+def _item(kind, data, path, strings=None):
+    _expect(isinstance(data, dict), path, "an object")
+    _expect(isinstance(data.get("id"), (str, int)), f"{path}.id", "a string id")
+    _expect(isinstance(data.get("stats") or {}, dict), f"{path}.stats", "an object")
+    perks = data.get("perks") or []
+    _expect(
+        isinstance(perks, list) and all(isinstance(column, list) for column in perks),
+        f"{path}.perks",
+        "a list of perk columns",
+    )
+    _expect(isinstance(data.get("mods") or [], list), f"{path}.mods", "a list")
+    try:
+        return Item(kind, data, strings)
+    except (TypeError, KeyError):
+        # sys.intern() rejects non-string names; table lookups reject bad indexes
+        expected = "string table indexes" if strings is not None else "string perk and mod names"
+        raise MessageError(f"{path}: expected {expected}") from None
+
+
+def _items(kind, values, path, strings=None):
+    return [_item(kind, data, f"{path}[{i}]", strings) for i, data in enumerate(_list(values, path))]
+
+
+def _extend_table(table, msg):
+    """Add a message's "strings" to a string table; returns the table, or None for plain encoding."""
+    encoding = msg.get("encoding")
+    if encoding is None:
+        return None
+    _expect(encoding == STRING_TABLE_ENCODING, "encoding", f"{STRING_TABLE_ENCODING!r}")
+    strings = _list(msg.get("strings", []), "strings")
+    _expect(all(isinstance(value, str) for value in strings), "strings", "a list of strings")
+    # Interned so names are shared with earlier snapshots, like plain-encoded ones
+    start = len(table) - 1
+    for offset, value in enumerate(strings):
+        table[start + offset] = sys.intern(value)
+    return table
+
+
+def _string_table(msg):
+    # A dict rather than a list so None (an unset field) maps to itself
+    return _extend_table({None: None}, msg)
+
+
+def _store(data, path):
+    _expect(isinstance(data, dict), path, "an object")
+    _expect(isinstance(data.get("id"), str), f"{path}.id", "a string id")
+    return {field: data.get(field) for field in STORE_FIELDS}
+
+
+def _stores(values, path):
+    return [_store(data, f"{path}[{i}]") for i, data in enumerate(_list(values, path))]
+
+
+def _section(msg, name):
+    section = msg.get(name)
+    _expect(isinstance(section, dict), name, "an object")
+    return section
+
+
+def _decode_summary(msg):
+    mtype = msg["type"]
+    if mtype == "stores":
+        data = _stores(msg.get("data"), "data")
+    else:
+        data = _items(_ITEM_KINDS[mtype], msg.get("data"), "data")
+    return {"type": mtype, "data": data}
+
+
+def _decode_pong(msg):
+    strings = _string_table(msg)
+    pong = {"type": "pong", "requestId": msg.get("requestId"), "version": msg.get("version")}
+    if msg.get("push"):
+        # Sent by DIM on its own when the inventory changed, not in reply to a ping
+        pong["push"] = True
+    # A committing pong's items came in chunks, so its own item lists are absent
+    chunked = "chunks" in msg
+    if chunked:
+        _expect(isinstance(msg["chunks"], int), "chunks", "a chunk count")
+        pong["chunks"] = msg["chunks"]
+    missing = [] if chunked else None
+    if msg.get("delta"):
+        pong["delta"] = True
+        pong["baseVersion"] = msg.get("baseVersion")
+        for name, kind in _ITEM_KINDS.items():
+            section = _section(msg, name)
+            removed = _list(section.get("removed", []), f"{name}.removed")
+            pong[name] = {
+                "changed": _items(kind, section.get("changed", []), f"{name}.changed", strings),
+                "removed": [str(item_id) for item_id in removed],
+            }
+    else:
+        for name, kind in _ITEM_KINDS.items():
+            pong[name] = {"type": name, "data": _items(kind, _section(msg, name).get("data", missing), f"{name}.data", strings)}
+    pong["stores"] = {"type": "stores", "data": _stores(_section(msg, "stores").get("data"), "stores.data")}
+    return pong
+
+
+def _decode_pong_chunk(msg):
+    _expect(isinstance(msg.get("seq"), int), "seq", "a sequence number")
+    _expect(msg.get("kind") in _ITEM_KINDS, "kind", "weapons or armor")
+    _list(msg.get("items"), "items")
+    # Items are decoded by ChunkedPong, which holds the string table built so far
+    return msg
+
+
+def _transfer_result(data, path):
+    _expect(isinstance(data, dict), path, "an object")
+    _expect(isinstance(data.get("success"), bool), f"{path}.success", "a boolean")
+    return {
+        "instanceId": str(data.get("instanceId")),
+        "success": data["success"],
+        "error": data.get("error"),
+    }
+
+
+def _decode_transfer_response(msg):
+    _expect(isinstance(msg.get("success"), bool), "success", "a boolean")
+    results = msg.get("results", [])
+    return {
+        "type": "transfer_items_response",
+        "requestId": msg.get("requestId"),
+        "success": msg["success"],
+        "error": msg.get("error"),
+        "results": [_transfer_result(r, f"results[{i}]") for i, r in enumerate(_list(results, "results"))],
+    }
+
+
+def _decode_transfer_progress(msg):
+    return {
+        "type": "transfer_items_progress",
+        "requestId": msg.get("requestId"),
+        **_transfer_result(msg, "progress"),
+        "completed": msg.get("completed"),
+        "total": msg.get("total"),
+    }
+
+
+_DECODERS = {
+    "weapons": _decode_summary,
+    "armor": _decode_summary,
+    "stores": _decode_summary,
+    "pong": _decode_pong,
+    "pong_chunk": _decode_pong_chunk,
+    "transfer_items_response": _decode_transfer_response,
+    "transfer_items_progress": _decode_transfer_progress,
+}
+
+
+def decode_object(msg):
+    """
+    Validate an already-parsed message and convert it to records.
+
+    Raises:
+        MessageError: If the message doesn't match its type's schema
+    """
+    _expect(isinstance(msg, dict), "message", "an object")
+    decoder = _DECODERS.get(msg.get("type"))
+    if decoder is None:
+        return msg
+    try:
+        return decoder(msg)
+    except MessageError as e:
+        raise MessageError(f"{msg.get('type')} {e}", msg.get("type"), msg.get("requestId")) from None
+
+
+def decode(message):
+    """
+    Parse a websocket frame from DIM into a validated message.
+
+    Raises:
+        json.JSONDecodeError: If the frame isn't JSON
+        MessageError: If the message doesn't match its type's schema
+    """
+    return decode_object(json.loads(message))
+
+
+class ChunkedPong:
+    """
+    Reassembles a pong that DIM sent as pong_chunk messages followed by a committing pong.
+
+    Chunks must arrive in sequence. Their items are decoded into Items straight
+    away, so at most one chunk's JSON is held at a time, and the upload is
+    aborted once it passes max_bytes.
+    """
+
+    def __init__(self, request_id, max_bytes):
+        self.request_id = request_id
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._items = {name: [] for name in _ITEM_KINDS}
+        self._table = {None: None}
+        self._next_seq = 0
+
+    def _error(self, message):
+        return MessageError(f"chunked pong {message}", "pong", self.request_id)
+
+    def add(self, chunk, size):
+        """
+        Decode one pong_chunk (already checked by decode()) of `size` bytes.
+
+        Raises:
+            MessageError: If the chunk is out of sequence, malformed, or over the size limit
+        """
+        if chunk["seq"] != self._next_seq:
+            raise self._error(f"got chunk {chunk['seq']}, expected {self._next_seq}")
+        self.bytes += size
+        if self.bytes > self.max_bytes:
+            raise self._error(f"exceeds {self.max_bytes} bytes")
+        try:
+            strings = _extend_table(self._table, chunk)
+            kind = chunk["kind"]
+            self._items[kind].extend(_items(_ITEM_KINDS[kind], chunk["items"], f"chunk {chunk['seq']} items", strings))
+        except MessageError as e:
+            raise self._error(str(e)) from None
+        self._next_seq += 1
+
+    def commit(self, pong):
+        """
+        Fill a decoded committing pong with the items from the chunks.
+
+        Raises:
+            MessageError: If chunks are missing
+        """
+        if pong["chunks"] != self._next_seq:
+            raise self._error(f"committed {pong['chunks']} chunks but {self._next_seq} arrived")
+        key = "changed" if pong.get("delta") else "data"
+        for name in _ITEM_KINDS:
+            pong[name][key] = self._items[name]
+        return pong
+
+
+def encode_record(obj):
+    """json.dumps default= hook that turns decoded records back into DIM's summary shape."""
+    if isinstance(obj, Item):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
@@ -0,0 +1,128 @@
+"""Duplicate and near-duplicate weapon detection for vault cleanup.
+
+Weapons are grouped through an inverted index from name to instances. Within a
+group, a second inverted index from equipped perk to instances yields every
+pair of copies sharing a perk, with the size of their overlap; only those pairs
+get a Jaccard similarity, so copies with nothing in common are never compared.
+Copies are then grouped around the best copy not yet grouped: a copy becomes a
+shard candidate only if it is at least the similarity threshold alike to the
+copy kept in its place.
+"""
+
+from __future__ import annotations
+
+from collections import defaultdict
+from itertools import combinations
+
+# Tags that mean the player is keeping the item, whatever its roll
+PROTECTED_TAGS = {"favorite", "keep"}
+
+
+def _equipped_perks(item):
+    return frozenset(item.perk_names(equipped_only=True))
+
+
+def _keep_score(item):
+    """Sort key for the copy worth keeping: tagged, crafted, enhanced, masterworked, then power."""
+    enhanced = sum(1 for column in item.perks for perk in column if "(Equipped)" in perk and "(Enhanced)" in perk)
+    return (
+        item.tag in PROTECTED_TAGS,
+        item.crafted_level is not None,
+        enhanced,
+        item.masterwork_tier or 0,
+        item.power or 0,
+        item.kill_tracker or 0,
+    )
+
+
+def _jaccard(a, b, shared=None):
+    if shared is None:
+        shared = len(a & b)
+    union = len(a) + len(b) - shared
+    return shared / union if union else 1.0
+
+
+def similar_pairs(perk_sets, min_similarity):
+    """
+    Yield (i, j, similarity) for the perk sets at least min_similarity alike.
+
+    Overlaps are counted from a perk -> sets inverted index, so only pairs
+    sharing a perk are scored.
+    """
+    postings = defaultdict(list)
+    for i, perks in enumerate(perk_sets):
+        for perk in perks:
+            postings[perk].append(i)
+    shared = defaultdict(int)
+    for members in postings.values():
+        for pair in combinations(members, 2):
+            shared[pair] += 1
+    for (i, j), count in shared.items():
+        similarity = _jaccard(perk_sets[i], perk_sets[j], count)
+        if similarity >= min_similarity:
+            yield i, j, similarity
+
+
+def _groups(copies, pairs):
+    """
+    Group copies around the ones worth keeping.
+
+    Copies are taken best first (by _keep_score); each one not yet in a group
+    keeps the ungrouped copies similar enough to it. Every member of a group is
+    compared with its kept copy directly, so A~B and B~C never puts A and C
+    together unless A~C too.
+
+    Returns:
+        list[tuple]: (kept index, [(member index, similarity to the kept copy)])
+    """
+    similar = defaultdict(dict)
+    for i, j, similarity in pairs:
+        similar[i][j] = similar[j][i] = similarity
+    grouped = set()
+    groups = []
+    for keep in sorted(range(len(copies)), key=lambda i: _keep_score(copies[i]), reverse=True):
+        if keep in grouped:
+            continue
+        members = [(i, similarity) for i, similarity in similar[keep].items() if i not in grouped]
+        if members:
+            grouped.add(keep)
+            grouped.update(i for i, _ in members)
+            groups.append((keep, members))
+    return groups
+
+
+def find_duplicates(inventory, min_similarity=0.5):
+    """
+    Group duplicate weapons and pick which copy of each to keep.
+
+    Args:
+        inventory: Inventory built from the current snapshot
+        min_similarity: Jaccard similarity over equipped perks (0-1) for two
+            copies of a weapon to count as duplicates; 1 means identical rolls
+
+    Returns:
+        list[dict]: One dict per group, most shard candidates first, with the
+        "keep" Item and "shard" as [(Item, similarity to the kept copy)],
+        most redundant first. Items tagged favorite or keep are never shard
+        candidates.
+    """
+    if not 0 <= min_similarity <= 1:
+        raise ValueError("min_similarity must be between 0 and 1")
+
+    by_name = defaultdict(list)
+    for weapon in inventory.iter_select(kind="weapon"):
+        by_name[weapon.name].append(weapon)
+
+    groups = []
+    for name, copies in by_name.items():
+        if len(copies) < 2:
+            continue
+        perk_sets = [_equipped_perks(w) for w in copies]
+        for keep, members in _groups(copies, similar_pairs(perk_sets, min_similarity)):
+            shard = [(copies[i], similarity) for i, similarity in members if copies[i].tag not in PROTECTED_TAGS]
+            if shard:
+                # Junk-tagged first, then the copies closest to the one kept
+                shard.sort(key=lambda pair: (pair[0].tag != "junk", -pair[1], pair[0].power or 0))
+                groups.append({"name": name, "keep": copies[keep], "shard": shard})
+    groups.sort(key=lambda g: (-len(g["shard"]), g["name"] or ""))
+    return groups
@@ -0,0 +1,285 @@
+"""Scripted stand-in for the DIM browser tab, for benchmarks and offline testing.
+
+FakeDim connects to the websocket server like mcp-websocket.ts does and answers
+ping and transfer_items with a synthetic inventory of configurable size and
+latency. It speaks the same protocol as DIM: request IDs are echoed, pings with
+a matching sinceVersion get a delta pong, pings asking for the "strings"
+encoding get a string table, pings with a chunkSize get their items in
+pong_chunk messages, and transfers stream progress. Once the server subscribes,
+changes (from transfers, or made to .inventory followed by push()) are pushed
+as delta pongs.
+
+Run as a script it serves make_inventory(--items) until killed, so a benchmark
+can keep the fake's memory out of the process it measures:
+
+    python fake_dim.py --url wss://localhost:9131 --items 5000 --latency 20
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import ssl
+
+import websockets
+
+WEAPON_TYPES = ["Auto Rifle", "Hand Cannon", "Pulse Rifle", "Scout Rifle", "Sniper Rifle", "Shotgun", "Fusion Rifle", "Rocket Launcher", "Sword", "Submachine Gun"]
+ELEMENTS = ["Kinetic", "Arc", "Solar", "Void", "Stasis", "Strand"]
+ARMOR_SLOTS = ["Helmet", "Gauntlets", "Chest Armor", "Leg Armor", "Class Armor"]
+ARMOR_STATS = ["Mobility", "Resilience", "Recovery", "Discipline", "Intellect", "Strength"]
+PERKS = ["Outlaw", "Rapid Hit", "Kill Clip", "Rampage", "Incandescent", "Voltshot", "Frenzy", "Firefly", "Explosive Payload", "Dragonfly", "Headstone", "Demolitionist", "Feeding Frenzy", "Golden Tricorn", "Vorpal Weapon", "Zen Moment"]
+MODS = ["Firepower", "Ashes to Assets", "Harmonic Siphon", "Recuperation", "Heavy Handed", "Bomber", "Powerful Friends", "Time Dilation"]
+TAGS = [None, None, None, "favorite", "keep", "junk", "infuse", "archive"]
+
+# Item fields sent through the string table, as in mcp-websocket.ts
+TABLE_FIELDS = {"name", "type", "slot", "gearTier", "element", "owner", "ownerId", "tag", "masterworkType"}
+
+CHARACTERS = [
+    {"id": "2305843009000000001", "name": "Human Warlock", "isVault": False, "classType": 2, "className": "Warlock", "powerLevel": 2010, "lastPlayed": "2025-08-01T00:00:00.000Z"},
+    {"id": "2305843009000000002", "name": "Awoken Hunter", "isVault": False, "classType": 1, "className": "Hunter", "powerLevel": 2005, "lastPlayed": "2025-07-20T00:00:00.000Z"},
+    {"id": "2305843009000000003", "name": "Exo Titan", "isVault": False, "classType": 0, "className": "Titan", "powerLevel": 2000, "lastPlayed": "2025-07-01T00:00:00.000Z"},
+    {"id": "vault", "name": "Vault", "isVault": True, "classType": 3, "className": "Vault", "powerLevel": 0, "lastPlayed": None},
+]
+
+
+def make_inventory(size=600, seed=0):
+    """
+    Build a synthetic pong payload with roughly `size` items, split evenly
+    between weapons and armor, in the shape mcp-websocket.ts produces.
+    """
+    rng = random.Random(seed)
+    weapons, armor = [], []
+    for i in range(size):
+        owner = rng.choice(CHARACTERS) if rng.random() < 0.3 else CHARACTERS[-1]
+        tier = "Exotic" if rng.random() < 0.1 else "Legendary"
+        base = {
+            "id": str(6917529000000000000 + i),
+            "power": rng.randint(1900, 2010),
+            "owner": owner["name"],
+            "ownerId": owner["id"],
+            "gearTier": tier,
+            "tag": rng.choice(TAGS),
+            "notes": "pvp god roll" if rng.random() < 0.05 else None,
+        }
+        if i % 2 == 0:
+            perks = [
+                [f"{p}{' (Equipped)' if j == 0 else ''}{' (Enhanced)' if rng.random() < 0.1 else ''}" for j, p in enumerate(rng.sample(PERKS, 3))]
+                for _ in range(4)
+            ]
+            weapons.append({
+                **base,
+                "name": rng.choice(["Fatebringer", "Vision of Confluence", "Gjallarhorn", "Palindrome", "Austringer", "Funnelweb"]),
+                "type": rng.choice(WEAPON_TYPES),
+                "element": rng.choice(ELEMENTS),
+                "stats": {"Impact": rng.randint(20, 90), "Range": rng.randint(20, 90), "Stability": rng.randint(20, 90), "Handling": rng.randint(20, 90), "Reload Speed": rng.randint(20, 90)},
+                "perks": perks,
+                "craftedLevel": rng.randint(1, 30) if rng.random() < 0.2 else None,
+                "killTracker": rng.randint(0, 5000),
+                "masterworkType": rng.choice(["Range", "Stability", "Handling", "Reload Speed"]),
+                "masterworkTier": rng.randint(0, 10),
+            })
+        else:
+            stats = {name: rng.randint(2, 30) for name in ARMOR_STATS}
+            stats["Total"] = sum(stats.values())
+            slot = rng.choice(ARMOR_SLOTS)
+            character = rng.choice(CHARACTERS[:3])
+            armor.append({
+                **base,
+                "name": f"{rng.choice(['Iron', 'Reverie Dawn', 'Techsec', 'Collective Psyche'])} {slot}",
+                "type": slot if slot != "Class Armor" else {2: "Warlock Bond", 1: "Hunter Cloak", 0: "Titan Mark"}[character["classType"]],
+                "slot": slot,
+                "classType": character["classType"],
+                "element": None,
+                "stats": stats,
+                "mods": [f"{m}{'*' if j == 0 else ''}" for j, m in enumerate(rng.sample(MODS, 3))],
+            })
+    return {"weapons": weapons, "armor": armor, "stores": [dict(c) for c in CHARACTERS]}
+
+
+class FakeDim:
+    """A scripted DIM client for the MCP websocket server."""
+
+    def __init__(self, inventory, url="wss://localhost:9130", latency=0.0, account=None):
+        self.inventory = inventory
+        # Sent in hello, like DIM's current account
+        self.account = account or {"membershipId": "4611686018400000001", "platformType": 3, "displayName": "Guardian#0001", "destinyVersion": 2}
+        self.url = url
+        self.latency = latency
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.messages_received = 0
+        self._last_sent = None   # (version, {kind: {id: json}}) of the last inventory sent
+        self._version = 0
+        self._ws = None
+        # Whether pushed updates use the string table; None until the server subscribes
+        self._push_strings = None
+
+    async def run(self):
+        """Connect, say hello and answer requests until the connection closes."""
+        ssl_context = ssl.create_default_context()
+        ssl_context.check_hostname = False
+        ssl_context.verify_mode = ssl.CERT_NONE
+        async with websockets.connect(self.url, ssl=ssl_context, max_size=None) as ws:
+            self._ws = ws
+            await self._send({"type": "hello", "account": self.account})
+            async for raw in ws:
+                self.bytes_received += len(raw)
+                self.messages_received += 1
+                msg = json.loads(raw)
+                # Answer concurrently, like the browser's event loop would
+                asyncio.create_task(self._handle(msg))
+
+    async def _send(self, msg):
+        raw = json.dumps(msg)
+        self.bytes_sent += len(raw)
+        await self._ws.send(raw)
+
+    async def _handle(self, msg):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if msg.get("type") == "ping":
+            pong = self._pong(msg.get("requestId"), msg.get("sinceVersion"))
+            encoder = _StringEncoder() if msg.get("encoding") == "strings" else None
+            if msg.get("chunkSize"):
+                await self._send_chunks(pong, msg["chunkSize"], encoder)
+            elif encoder:
+                await self._send(encoder.encode_pong(pong))
+            else:
+                await self._send(pong)
+        elif msg.get("type") == "transfer_items":
+            await self._transfer(msg)
+            await self.push()
+        elif msg.get("type") == "subscribe":
+            self._push_strings = msg.get("encoding") == "strings"
+            await self._send({"type": "subscribed"})
+            await self.push()
+
+    async def push(self):
+        """Push what changed since the last send, if the server subscribed and anything did."""
+        if self._push_strings is None or self._last_sent is None:
+            return
+        pong = self._pong(None, self._last_sent[0])
+        if not any(pong[kind]["changed"] or pong[kind]["removed"] for kind in ("weapons", "armor")):
+            return
+        pong["push"] = True
+        await self._send(_StringEncoder().encode_pong(pong) if self._push_strings else pong)
+
+    def _pong(self, request_id, since_version):
+        serialized = {kind: {item["id"]: json.dumps(item) for item in self.inventory[kind]} for kind in ("weapons", "armor")}
+        stores = {"type": "stores", "data": self.inventory["stores"]}
+        if self._last_sent and since_version == self._last_sent[0]:
+            base_version, previous = self._last_sent
+            patch = {
+                kind: {
+                    "changed": [i for i in self.inventory[kind] if previous[kind].get(i["id"]) != serialized[kind][i["id"]]],
+                    "removed": [item_id for item_id in previous[kind] if item_id not in serialized[kind]],
+                }
+                for kind in ("weapons", "armor")
+            }
+            if any(p["changed"] or p["removed"] for p in patch.values()):
+                self._version += 1
+            self._last_sent = (self._version, serialized)
+            return {
+                "type": "pong",
+                "requestId": request_id,
+                "delta": True,
+                "baseVersion": base_version,
+                "version": self._version,
+                **patch,
+                "stores": stores,
+            }
+        self._version += 1
+        self._last_sent = (self._version, serialized)
+        return {
+            "type": "pong",
+            "requestId": request_id,
+            "version": self._version,
+            "weapons": {"type": "weapons", "data": self.inventory["weapons"]},
+            "armor": {"type": "armor", "data": self.inventory["armor"]},
+            "stores": stores,
+        }
+
+    async def _send_chunks(self, pong, chunk_size, encoder=None):
+        key = "changed" if pong.get("delta") else "data"
+        chunks = 0
+        for kind in ("weapons", "armor"):
+            items = pong[kind][key]
+            for start in range(0, len(items), chunk_size):
+                chunk = {"type": "pong_chunk", "requestId": pong["requestId"], "seq": chunks, "kind": kind, "items": items[start:start + chunk_size]}
+                await self._send(encoder.encode_chunk(chunk) if encoder else chunk)
+                chunks += 1
+            pong[kind] = {k: v for k, v in pong[kind].items() if k != key}
+        await self._send({**pong, "chunks": chunks})
+
+    async def _transfer(self, msg):
+        request_id = msg.get("requestId")
+        instance_ids = msg.get("instanceIds", [])
+        target = next((s for s in self.inventory["stores"] if s["id"] == msg.get("targetStoreId")), None)
+        by_id = {item["id"]: item for kind in ("weapons", "armor") for item in self.inventory[kind]}
+        results = []
+        for completed, instance_id in enumerate(instance_ids, 1):
+            item = by_id.get(instance_id)
+            if target is None or item is None:
+                result = {"instanceId": instance_id, "success": False, "error": f"Item not found: {instance_id}"}
+            else:
+                item["owner"], item["ownerId"] = target["name"], target["id"]
+                result = {"instanceId": instance_id, "success": True}
+            results.append(result)
+            await self._send({"type": "transfer_items_progress", "requestId": request_id, **result, "completed": completed, "total": len(instance_ids)})
+        await self._send({"type": "transfer_items_response", "requestId": request_id, "success": True, "results": results})
+
+
+class _StringEncoder:
+    """Replaces TABLE_FIELDS, perks and mods with string table indexes, as mcp-websocket.ts does."""
+
+    def __init__(self):
+        self.strings = []
+        self._indexes = {}
+        self._sent = 0
+
+    def _ref(self, value):
+        if value not in self._indexes:
+            self._indexes[value] = len(self.strings)
+            self.strings.append(value)
+        return self._indexes[value]
+
+    def encode_item(self, item):
+        encoded = dict(item)
+        for key, value in item.items():
+            if key in TABLE_FIELDS and isinstance(value, str):
+                encoded[key] = self._ref(value)
+        if "perks" in item:
+            encoded["perks"] = [[self._ref(p) for p in column] for column in item["perks"]]
+        if "mods" in item:
+            encoded["mods"] = [self._ref(m) for m in item["mods"]]
+        return encoded
+
+    def _new_strings(self):
+        strings = self.strings[self._sent:]
+        self._sent = len(self.strings)
+        return strings
+
+    def encode_chunk(self, chunk):
+        items = [self.encode_item(item) for item in chunk["items"]]
+        return {**chunk, "items": items, "encoding": "strings", "strings": self._new_strings()}
+
+    def encode_pong(self, pong):
+        key = "changed" if pong.get("delta") else "data"
+        for kind in ("weapons", "armor"):
+            section = dict(pong[kind])
+            section[key] = [self.encode_item(item) for item in section[key]]
+            pong[kind] = section
+        return {**pong, "encoding": "strings", "strings": self._new_strings()}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Serve a synthetic inventory to the MCP websocket server.")
+    parser.add_argument("--url", default="wss://localhost:9130", help="websocket server to connect to")
+    parser.add_argument("--items", type=int, default=600, help="inventory size")
+    parser.add_argument("--latency", type=float, default=0.0, help="response latency in ms")
+    args = parser.parse_args()
+    await FakeDim(make_inventory(args.items), url=args.url, latency=args.latency / 1000).run()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,277 @@
+"""Indexed in-memory model of a DIM inventory snapshot.
+
+An Inventory is built once per snapshot. Items are compact slotted records
+(decoded from DIM's messages by dim_messages) indexed by id, owner, kind, type,
+element, tier and tag so the parsing helpers can answer from the indexes instead
+of re-scanning raw JSON.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import itertools
+import json
+import sys
+import threading
+from typing import Iterable, Iterator, Optional
+
+import metrics
+
+
+def _intern(value):
+    # Names, types and owners repeat across thousands of items; share one copy
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class Item:
+    """One weapon or armor piece from a DIM summary."""
+
+    __slots__ = (
+        "id",
+        "kind",
+        "name",
+        "type",
+        "tier",
+        "element",
+        "power",
+        "owner",
+        "owner_id",
+        "tag",
+        "notes",
+        "stats",
+        "perks",
+        "mods",
+        "crafted_level",
+        "kill_tracker",
+        "masterwork_type",
+        "masterwork_tier",
+        "slot",
+        "class_type",
+    )
+
+    def __init__(self, kind: str, data: dict, strings: Optional[dict] = None):
+        """
+        Args:
+            kind: "weapon" or "armor"
+            data: The item's summary dict as DIM sends it
+            strings: The message's string table as {index: string, None: None},
+                if DIM sent names as indexes into it
+        """
+        if strings is None:
+            text, lookup = _intern, sys.intern
+        else:
+            text = lookup = strings.__getitem__
+
+        self.id = str(data.get("id"))
+        self.kind = kind
+        self.name = text(data.get("name"))
+        self.type = text(data.get("type"))
+        self.tier = text(data.get("gearTier"))
+        self.element = text(data.get("element"))
+        self.power = data.get("power")
+        self.owner = text(data.get("owner"))
+        self.owner_id = text(data.get("ownerId"))
+        self.tag = text(data.get("tag"))
+        self.notes = data.get("notes")
+        self.stats = data.get("stats") or {}
+        self.perks = tuple(tuple(map(lookup, column)) for column in data.get("perks") or ())
+        self.mods = tuple(map(lookup, data.get("mods") or ()))
+        self.crafted_level = data.get("craftedLevel")
+        self.kill_tracker = data.get("killTracker")
+        # DIM joins the masterworked stat names into one string, e.g. "Range"
+        self.masterwork_type = text(data.get("masterworkType"))
+        self.masterwork_tier = data.get("masterworkTier")
+        # Armor only: inventory bucket name ("Helmet", ...) and DestinyClass (3 = any class)
+        self.slot = text(data.get("slot"))
+        self.class_type = data.get("classType")
+
+    def to_dict(self) -> dict:
+        """The item in DIM's summary shape (camelCase keys), leaving out unset fields."""
+        fields = {
+            "id": self.id,
+            "name": self.name,
+            "type": self.type,
+            "gearTier": self.tier,
+            "element": self.element,
+            "power": self.power,
+            "stats": self.stats,
+            "owner": self.owner,
+            "ownerId": self.owner_id,
+            "tag": self.tag,
+            "notes": self.notes,
+        }
+        if self.kind == "weapon":
+            fields.update(
+                perks=self.perks,
+                craftedLevel=self.crafted_level,
+                killTracker=self.kill_tracker,
+                masterworkType=self.masterwork_type,
+                masterworkTier=self.masterwork_tier,
+            )
+        else:
+            fields.update(mods=self.mods, slot=self.slot, classType=self.class_type)
+        return {key: value for key, value in fields.items() if value is not None}
+
+    def perk_names(self, equipped_only: bool = False) -> list[str]:
+        """Perk names across all columns, without DIM's "(Enhanced)"/"(Equipped)" markers."""
+        names = []
+        for column in self.perks:
+            for perk in column:
+                if equipped_only and "(Equipped)" not in perk:
+                    continue
+                names.append(_strip_markers(perk))
+        return names
+
+    def mod_names(self) -> list[str]:
+        """Socket plug names, without the "*" DIM uses to mark the plugged option."""
+        return [m.rstrip("*") for m in self.mods]
+
+    def __repr__(self):
+        return f"Item({self.kind}, {self.id}, {self.name!r})"
+
+
+def _strip_markers(perk: str) -> str:
+    return perk.replace(" (Equipped)", "").replace(" (Enhanced)", "")
+
+
+# Serial numbers for Inventory objects
+_serials = itertools.count(1)
+
+# Per account fingerprint: (content hash of the newest Inventory built, its revision)
+_revisions = {}
+_revisions_lock = threading.Lock()
+
+# Attribute name on Item for each index
+_INDEXED_FIELDS = ("owner", "owner_id", "kind", "type", "element", "tier", "tag")
+
+
+class Inventory:
+    """All items in one snapshot plus hash indexes over them."""
+
+    __slots__ = ("version", "serial", "revision", "saved_at", "items", "stores", "by_id", "_indexes", "_current_character")
+
+    def __init__(self, weapons: Iterable[Item], armor: Iterable[Item], stores: list[dict], version=None, saved_at=None):
+        self.version = version
+        # Unique per Inventory, unlike DIM's version, which restarts when the tab reconnects
+        self.serial = next(_serials)
+        # Set when the snapshot came from disk rather than a live DIM connection
+        self.saved_at = saved_at
+        self.items = [*weapons, *armor]
+        self.stores = stores
+        self.by_id = {item.id: item for item in self.items}
+        self._indexes = {field: {} for field in _INDEXED_FIELDS}
+        for item in self.items:
+            for field in _INDEXED_FIELDS:
+                self._indexes[field].setdefault(getattr(item, field), []).append(item)
+
+        characters = [s for s in stores if not s.get("isVault")]
+        self._current_character = max(characters, key=lambda c: c.get("lastPlayed") or "") if characters else None
+        # Counts content changes for this account, so it survives DIM reconnects
+        # and is the same for a live snapshot and its copy on disk
+        self.revision = _revision(self.account_fingerprint, self._content_hash())
+
+    def _content_hash(self) -> int:
+        """Hash of every item's fields and the stores; only meaningful within this process."""
+        items = hash(tuple(
+            (
+                item.id, item.kind, item.name, item.type, item.tier, item.element, item.power,
+                item.owner, item.owner_id, item.tag, item.notes, tuple(item.stats.items()),
+                item.perks, item.mods, item.crafted_level, item.kill_tracker,
+                item.masterwork_type, item.masterwork_tier, item.slot, item.class_type,
+            )
+            for item in self.items
+        ))
+        return hash((items, json.dumps(self.stores, sort_keys=True, default=str)))
+
+    @classmethod
+    def from_snapshot(cls, full_data: dict) -> "Inventory":
+        """Build an Inventory from a decoded pong-shaped snapshot (see dim_messages)."""
+        return cls(
+            full_data.get("weapons", {}).get("data", []),
+            full_data.get("armor", {}).get("data", []),
+            full_data.get("stores", {}).get("data", []),
+            version=full_data.get("version"),
+            saved_at=full_data.get("savedAt") if full_data.get("source") == "disk" else None,
+        )
+
+    def get(self, item_id) -> Optional[Item]:
+        """Return the item with this instance id, if any."""
+        return self.by_id.get(str(item_id))
+
+    def iter_select(self, **criteria) -> Iterator[Item]:
+        """
+        Yield items matching every given indexed field, in snapshot order.
+
+        Starts from the smallest matching index bucket, so the cost is O(k) in
+        the size of that bucket rather than the whole inventory.
+
+        Example:
+            inventory.iter_select(kind="weapon", owner="Human Warlock")
+        """
+        if not criteria:
+            yield from self.items
+            return
+
+        buckets = []
+        for field, value in criteria.items():
+            if field not in self._indexes:
+                raise ValueError(f"Unknown index: {field}")
+            buckets.append(self._indexes[field].get(value, []))
+        smallest = min(buckets, key=len)
+        for item in smallest:
+            if all(getattr(item, f) == v for f, v in criteria.items()):
+                yield item
+
+    def select(self, **criteria) -> list[Item]:
+        """List form of iter_select()."""
+        return list(self.iter_select(**criteria))
+
+    def values(self, field: str) -> list:
+        """Return the distinct values present for an indexed field."""
+        return list(self._indexes[field].keys())
+
+    @property
+    def account_fingerprint(self) -> tuple:
+        """The character and vault ids, which identify the account this inventory belongs to."""
+        return tuple(sorted(str(store.get("id")) for store in self.stores))
+
+    @property
+    def account_id(self) -> str:
+        """Short stable id for the account, derived from account_fingerprint."""
+        return hashlib.sha1("|".join(self.account_fingerprint).encode("utf-8")).hexdigest()[:12]
+
+    @property
+    def current_character(self) -> Optional[dict]:
+        """The most recently played character store."""
+        return self._current_character
+
+
+def _revision(fingerprint: tuple, content: int) -> int:
+    """Return the account's content revision, bumping it if the content differs from last time."""
+    with _revisions_lock:
+        last_content, revision = _revisions.get(fingerprint, (None, 0))
+        if content != last_content:
+            revision += 1
+            _revisions[fingerprint] = (content, revision)
+        return revision
+
+
+# Recently used (snapshot, Inventory) pairs, newest last; one per account in use
+_cached = []
+CACHED_INVENTORIES = 4
+# Held while building, so tool calls on worker threads share one build per snapshot
+_cache_lock = threading.Lock()
+
+
+def inventory_for(full_data: dict) -> Inventory:
+    """Return the Inventory for a snapshot, building it only once per snapshot object."""
+    with _cache_lock:
+        for i, (snapshot, inventory) in enumerate(_cached):
+            if snapshot is full_data:
+                _cached.append(_cached.pop(i))
+                return inventory
+        with metrics.span("index_build"):
+            inventory = Inventory.from_snapshot(full_data)
+        _cached.append((full_data, inventory))
+        del _cached[:-CACHED_INVENTORIES]
+        return inventory
@@ -0,0 +1,307 @@
+"""Small filter language for narrowing the inventory server-side.
+
+A query is a list of terms joined by "and" (implicit), "or" and "not", with
+parentheses for grouping:
+
+    kind:weapon element:solar tier=legendary stats.Total>=65
+    type:"hand cannon" (perk~outlaw or perk~"kill clip") not tag:junk
+    kind:armor owner=vault stats.Discipline>20 mod~incandescent
+
+Operators:
+    : or =      equals (case-insensitive); for perk/mod, the item has that perk/mod
+    !=          not equals
+    ~           contains (case-insensitive substring)
+    > >= < <=   numeric comparison (power, crafted and stats.<Stat Name> only)
+
+Fields: kind, name, type, slot, element, tier, owner, tag, notes, perk, mod,
+crafted (crafted level), power and stats.<Stat Name> (use "_" for spaces).
+
+Queries are compiled once into a predicate. Top-level equality terms on
+indexed fields are answered from the Inventory indexes and only the remaining
+terms are evaluated per item.
+"""
+
+from __future__ import annotations
+
+import re
+from functools import lru_cache
+from typing import Callable, Iterator
+
+from inventory_model import Inventory, Item
+
+_TOKEN_RE = re.compile(
+    r'\s*(?:(?P<paren>[()])|(?P<op>>=|<=|!=|[:=~<>])|"(?P<quoted>[^"]*)"|(?P<word>[^\s()<>=!:~"]+))'
+)
+
+# Query field -> Item attribute for simple scalar fields
+_SCALAR_FIELDS = {
+    "kind": "kind",
+    "name": "name",
+    "type": "type",
+    "slot": "slot",
+    "element": "element",
+    "tier": "tier",
+    "owner": "owner",
+    "tag": "tag",
+    "notes": "notes",
+    "crafted": "crafted_level",
+    "power": "power",
+}
+
+# Scalar fields holding numbers, the only ones > >= < <= apply to (besides stats)
+_NUMERIC_FIELDS = {"crafted", "power"}
+
+# Query fields that can be answered from an Inventory index
+_INDEXED = {"kind", "type", "element", "tier", "owner", "tag"}
+
+_NUMERIC_OPS = {
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+}
+
+
+class QueryError(ValueError):
+    """Raised when a query can't be parsed."""
+
+
+def _tokenize(query: str) -> list[tuple[str, str]]:
+    tokens = []
+    pos = 0
+    query = query.strip()
+    while pos < len(query):
+        match = _TOKEN_RE.match(query, pos)
+        if not match or match.end() == pos:
+            raise QueryError(f"Unexpected character at position {pos}: {query[pos:pos + 10]!r}")
+        pos = match.end()
+        kind = match.lastgroup
+        tokens.append((kind, match.group(kind)))
+    return tokens
+
+
+def _normalize(value) -> str:
+    return str(value).casefold()
+
+
+def _as_number(value: str, field: str) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        raise QueryError(f"{field} needs a numeric value, got {value!r}") from None
+
+
+def _stat_value(item: Item, stat: str):
+    value = item.stats.get(stat)
+    if value is None:
+        # Stat names are matched case-insensitively, with "_" standing in for spaces
+        wanted = stat.replace("_", " ").casefold()
+        value = next((v for k, v in item.stats.items() if k.casefold() == wanted), None)
+    return value
+
+
+def item_field(item: Item, field: str):
+    """
+    Return the value of a query field (e.g. "power", "stats.Total") for an item.
+
+    Raises:
+        QueryError: For perk/mod (multi-valued) or unknown fields
+    """
+    if field.casefold().startswith("stats."):
+        return _stat_value(item, field[len("stats."):])
+    attr = _SCALAR_FIELDS.get(field.casefold())
+    if attr is None:
+        raise QueryError(f"Unknown field {field!r}. Expected one of: {', '.join(_SCALAR_FIELDS)}, stats.<name>")
+    return getattr(item, attr)
+
+
+def _compile_term(field: str, op: str, value: str) -> Callable[[Item], bool]:
+    field_key = field.casefold()
+
+    if field_key.startswith("stats."):
+        stat = field[len("stats."):]
+        if op in _NUMERIC_OPS:
+            number = _as_number(value, field)
+            compare = _NUMERIC_OPS[op]
+            return lambda item: (v := _stat_value(item, stat)) is not None and compare(v, number)
+        if op in (":", "="):
+            number = _as_number(value, field)
+            return lambda item: _stat_value(item, stat) == number
+        if op == "!=":
+            number = _as_number(value, field)
+            return lambda item: _stat_value(item, stat) != number
+        raise QueryError(f"Operator {op!r} is not supported for stats")
+
+    wanted = _normalize(value)
+
+    if field_key in ("perk", "mod"):
+        names = (lambda item: item.perk_names()) if field_key == "perk" else (lambda item: item.mod_names())
+        if op in (":", "="):
+            return lambda item: any(_normalize(n) == wanted for n in names(item))
+        if op == "~":
+            return lambda item: any(wanted in _normalize(n) for n in names(item))
+        if op == "!=":
+            return lambda item: all(_normalize(n) != wanted for n in names(item))
+        raise QueryError(f"Operator {op!r} is not supported for {field_key}")
+
+    if field_key not in _SCALAR_FIELDS:
+        raise QueryError(
+            f"Unknown field {field!r}. Expected one of: {', '.join(_SCALAR_FIELDS)}, perk, mod, stats.<name>"
+        )
+    attr = _SCALAR_FIELDS[field_key]
+
+    if op in _NUMERIC_OPS:
+        if field_key not in _NUMERIC_FIELDS:
+            raise QueryError(f"Operator {op!r} needs a numeric field ({', '.join(sorted(_NUMERIC_FIELDS))} or stats.<name>)")
+        number = _as_number(value, field)
+        compare = _NUMERIC_OPS[op]
+        return lambda item: (v := getattr(item, attr)) is not None and compare(v, number)
+    if op in (":", "="):
+        return lambda item: (v := getattr(item, attr)) is not None and _normalize(v) == wanted
+    if op == "!=":
+        return lambda item: (v := getattr(item, attr)) is None or _normalize(v) != wanted
+    # op == "~"
+    return lambda item: (v := getattr(item, attr)) is not None and wanted in _normalize(v)
+
+
+class _Parser:
+    """Recursive-descent parser producing a predicate plus index-friendly equality terms."""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def take(self):
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def is_keyword(self, word):
+        kind, value = self.peek()
+        next_kind = self.tokens[self.pos + 1][0] if self.pos + 1 < len(self.tokens) else None
+        return kind == "word" and value.casefold() == word and next_kind != "op"
+
+    def parse(self):
+        if not self.tokens:
+            raise QueryError("Empty query")
+        predicate, terms = self.parse_or()
+        if self.pos < len(self.tokens):
+            raise QueryError(f"Unexpected {self.peek()[1]!r}")
+        return predicate, terms
+
+    def parse_or(self):
+        predicate, terms = self.parse_and()
+        alternatives = [predicate]
+        while self.is_keyword("or"):
+            self.take()
+            alternatives.append(self.parse_and()[0])
+        if len(alternatives) == 1:
+            return predicate, terms
+        return (lambda item: any(p(item) for p in alternatives)), []
+
+    def at_term_end(self):
+        kind, value = self.peek()
+        return kind is None or (kind == "paren" and value == ")") or self.is_keyword("or")
+
+    def parse_and(self):
+        predicates = []
+        terms = []
+        while not self.at_term_end():
+            # An explicit "and" only joins two terms, so it can't start one
+            if self.is_keyword("and"):
+                raise QueryError("Expected a term")
+            predicate, unary_terms = self.parse_unary()
+            predicates.append(predicate)
+            terms.extend(unary_terms)
+            if self.is_keyword("and"):
+                self.take()
+                if self.at_term_end():
+                    raise QueryError("Expected a term")
+        if not predicates:
+            raise QueryError("Expected a term")
+        if len(predicates) == 1:
+            return predicates[0], terms
+        return (lambda item: all(p(item) for p in predicates)), terms
+
+    def parse_unary(self):
+        if self.is_keyword("not"):
+            self.take()
+            inner, _ = self.parse_unary()
+            return (lambda item: not inner(item)), []
+
+        kind, value = self.take()
+        if kind == "paren" and value == "(":
+            predicate, terms = self.parse_or()
+            if self.take() != ("paren", ")"):
+                raise QueryError("Missing closing parenthesis")
+            return predicate, terms
+
+        if kind != "word":
+            raise QueryError(f"Expected a field name, got {value!r}")
+        field = value
+        op_kind, op = self.take()
+        if op_kind != "op":
+            raise QueryError(f"Expected an operator after {field!r}")
+        value_kind, operand = self.take()
+        if value_kind not in ("word", "quoted"):
+            raise QueryError(f"Expected a value after {field}{op}")
+
+        # Equality on an indexed field can narrow candidates via the index
+        terms = [(field.casefold(), operand)] if op in (":", "=") and field.casefold() in _INDEXED else []
+        return _compile_term(field, op, operand), terms
+
+
+class CompiledQuery:
+    """A parsed query, reusable across snapshots."""
+
+    __slots__ = ("text", "predicate", "index_terms")
+
+    def __init__(self, text: str, predicate: Callable[[Item], bool], index_terms: list[tuple[str, str]]):
+        self.text = text
+        self.predicate = predicate
+        self.index_terms = index_terms
+
+    def candidates(self, inventory: Inventory) -> list[Item]:
+        """Narrow the inventory using indexed equality terms from the top-level AND."""
+        criteria = {}
+        for field, value in self.index_terms:
+            wanted = _normalize(value)
+            # Index keys are exact, so resolve the case-insensitive value to the stored key
+            key = next((k for k in inventory.values(field) if k is not None and _normalize(k) == wanted), None)
+            if key is None:
+                return []
+            if field in criteria and criteria[field] != key:
+                return []
+            criteria[field] = key
+        return inventory.select(**criteria)
+
+    def iter_matches(self, inventory: Inventory) -> Iterator[Item]:
+        """Yield matching items in snapshot order."""
+        predicate = self.predicate
+        for item in self.candidates(inventory):
+            if predicate(item):
+                yield item
+
+    def run(self, inventory: Inventory) -> list[Item]:
+        """Return all matching items in snapshot order."""
+        return list(self.iter_matches(inventory))
+
+
+@lru_cache(maxsize=128)
+def compile_query(text: str) -> CompiledQuery:
+    """Parse a query into a CompiledQuery. Raises QueryError on bad syntax."""
+    predicate, terms = _Parser(_tokenize(text)).parse()
+    return CompiledQuery(text, predicate, terms)
+
+
+def run_query(text: str, inventory: Inventory) -> list[Item]:
+    """Compile (cached) and run a query against an inventory."""
+    return compile_query(text).run(inventory)
+
+
+def iter_query(text: str, inventory: Inventory) -> Iterator[Item]:
+    """Compile (cached) and lazily run a query against an inventory."""
+    return compile_query(text).iter_matches(inventory)
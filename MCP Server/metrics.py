@@ -0,0 +1,204 @@
+"""In-process metrics for the MCP and websocket servers.
+
+Counters and latency histograms are recorded from the hot path (tool dispatch,
+websocket send/wait, JSON decode, filtering, serialization) and exposed through
+the server_stats MCP tool and, optionally, a Prometheus text endpoint:
+
+    DIM_MCP_METRICS_PORT=9464 python MCP_server.py
+    curl http://localhost:9464/metrics
+"""
+
+import asyncio
+import functools
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import traffic_log
+
+logger = logging.getLogger(__name__)
+
+METRICS_PORT = int(os.environ.get("DIM_MCP_METRICS_PORT", "0"))
+
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Recent samples kept per histogram for percentile estimates
+SAMPLE_WINDOW = 1024
+
+_lock = threading.Lock()
+_counters = {}      # (name, labels) -> value
+_histograms = {}    # (name, labels) -> _Histogram
+_started_at = time.time()
+# Startup stage -> seconds from this module's import (the first thing MCP_server does) to reaching it
+_startup = {}
+_startup_origin = time.perf_counter()
+
+
+class _Histogram:
+    __slots__ = ("bucket_counts", "count", "total", "samples")
+
+    def __init__(self):
+        self.bucket_counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.samples = deque(maxlen=SAMPLE_WINDOW)
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        self.samples.append(value)
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.bucket_counts[i] += 1
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def incr(name, value=1, **labels):
+    """Add to a counter, e.g. incr("ws_bytes_in", len(message))."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, seconds, **labels):
+    """Record a duration in a histogram."""
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = _Histogram()
+        histogram.observe(seconds)
+
+
+@contextmanager
+def span(stage, **labels):
+    """Time a block as one stage of a tool call: `with span("serialize"): ...`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe("stage_seconds", time.perf_counter() - start, stage=stage, **labels)
+
+
+def mark_startup(stage):
+    """Record when startup first reached a stage, e.g. mark_startup("tools_listed")."""
+    elapsed = time.perf_counter() - _startup_origin
+    with _lock:
+        _startup.setdefault(stage, round(elapsed, 4))
+
+
+def startup():
+    """Startup stages reached so far, as {stage: seconds since launch}, in order."""
+    with _lock:
+        return dict(_startup)
+
+
+def timed_tool(fn):
+    """Wrap an async MCP tool to record its latency and outcome (and the call, when recording traffic). Apply below @mcp.tool."""
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        traffic_log.record_tool_call(fn.__name__, kwargs)
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            result = await fn(*args, **kwargs)
+            outcome = "ok"
+            return result
+        finally:
+            observe("tool_seconds", time.perf_counter() - start, tool=fn.__name__)
+            incr("tool_calls", tool=fn.__name__, outcome=outcome)
+    return wrapper
+
+
+def _percentile(ordered, pct):
+    return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+
+def snapshot():
+    """Return all metrics as a JSON-friendly dict, with p50/p95/p99 from recent samples."""
+    def label_str(labels):
+        return ",".join(f"{k}={v}" for k, v in labels) or "-"
+
+    with _lock:
+        counters = {}
+        for (name, labels), value in sorted(_counters.items()):
+            counters.setdefault(name, {})[label_str(labels)] = value
+        histograms = {}
+        for (name, labels), h in sorted(_histograms.items()):
+            ordered = sorted(h.samples)
+            histograms.setdefault(name, {})[label_str(labels)] = {
+                "count": h.count,
+                "mean_ms": round(1000 * h.total / h.count, 2),
+                "p50_ms": round(1000 * _percentile(ordered, 50), 2),
+                "p95_ms": round(1000 * _percentile(ordered, 95), 2),
+                "p99_ms": round(1000 * _percentile(ordered, 99), 2),
+            }
+    return {
+        "uptime_s": round(time.time() - _started_at, 1),
+        "startup_s": startup(),
+        "counters": counters,
+        "latency": histograms,
+    }
+
+
+def render_prometheus():
+    """Render all metrics in the Prometheus text exposition format."""
+    def fmt_labels(labels, extra=()):
+        pairs = [f'{k}="{v}"' for k, v in (*labels, *extra)]
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    lines = []
+    with _lock:
+        seen = set()
+        for (name, labels), value in sorted(_counters.items()):
+            metric = f"dim_mcp_{name}_total"
+            if metric not in seen:
+                lines.append(f"# TYPE {metric} counter")
+                seen.add(metric)
+            lines.append(f"{metric}{fmt_labels(labels)} {value}")
+        for (name, labels), h in sorted(_histograms.items()):
+            metric = f"dim_mcp_{name}"
+            if metric not in seen:
+                lines.append(f"# TYPE {metric} histogram")
+                seen.add(metric)
+            for bound, count in zip(BUCKETS, h.bucket_counts):
+                lines.append(f"{metric}_bucket{fmt_labels(labels, [('le', bound)])} {count}")
+            lines.append(f"{metric}_bucket{fmt_labels(labels, [('le', '+Inf')])} {h.count}")
+            lines.append(f"{metric}_sum{fmt_labels(labels)} {h.total}")
+            lines.append(f"{metric}_count{fmt_labels(labels)} {h.count}")
+    return "\n".join(lines) + "\n"
+
+
+async def _handle_http(reader, writer):
+    try:
+        request_line = await reader.readline()
+        # Drain the headers; we only care about the path
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        path = request_line.split()[1].decode() if len(request_line.split()) > 1 else "/"
+        if path == "/metrics":
+            body, status = render_prometheus().encode(), "200 OK"
+        else:
+            body, status = b"Not found\n", "404 Not Found"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    finally:
+        writer.close()
+
+
+async def start_http_server(port=None):
+    """Serve /metrics on localhost:port (defaults to DIM_MCP_METRICS_PORT) until cancelled."""
+    port = port or METRICS_PORT
+    server = await asyncio.start_server(_handle_http, "localhost", port)
+    logger.info(f"📈 Metrics available at http://localhost:{port}/metrics")
+    async with server:
+        await server.serve_forever()
@@ -1,5 +1,6 @@
 import json
 import asyncio
+from dim_messages import encode_record
 from websocket_server import request_inventory, transfer_items, main as start_websocket_server
 
 async def test_inventory():
@@ -17,11 +18,11 @@ async def test_inventory():
         # Show some sample items
         if weapons:
             sample_weapon = weapons[0]
-            print(f"   🔫 Sample weapon: {sample_weapon.get('name', 'Unknown')} (ID: {sample_weapon.get('id', 'Unknown')})")
+            print(f"   🔫 Sample weapon: {sample_weapon.name} (ID: {sample_weapon.id})")
         
         if armor:
             sample_armor = armor[0]
-            print(f"   🛡️ Sample armor: {sample_armor.get('name', 'Unknown')} (ID: {sample_armor.get('id', 'Unknown')})")
+            print(f"   🛡️ Sample armor: {sample_armor.name} (ID: {sample_armor.id})")
             
         return weapons, armor
         
@@ -101,7 +102,7 @@ async def handle_user_input():
             try:
                 print("[DEBUG] Calling request_inventory...")
                 response = await request_inventory()
-                pretty_response = json.dumps(response, indent=2)
+                pretty_response = json.dumps(response, indent=2, default=encode_record)
                 print("[DEBUG] Inventory response (pretty):")
                 print(pretty_response)
             except Exception as e:
@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+"""
+Replay a recorded DIM session against the MCP server, as a repeatable load test.
+
+Record a session by running the server with DIM_MCP_RECORD set (see traffic_log),
+then play it back offline:
+
+    DIM_MCP_RECORD=session.dimrec.gz python MCP_server.py
+    python replay.py session.dimrec.gz              # at the recorded pace
+    python replay.py session.dimrec.gz --speed 10   # ten times faster
+    python replay.py session.dimrec.gz --speed max  # no waits at all
+
+Like benchmark.py, the websocket server runs in this process with a throwaway
+certificate. Each recorded DIM connection is reopened and plays DIM's part:
+frames DIM sent on its own (hello, summaries, pushed updates) go out at their
+recorded times, and each request the server makes is answered with DIM's next
+recorded reply of that type on that connection, requestId rewritten, after
+DIM's recorded response time. MCP tool calls are reissued at their recorded
+times through an in-process client, so the server pings and transfers for the
+same reasons it did while recording.
+
+Times are divided by --speed, and idle gaps are capped at --max-gap seconds.
+The current DIM_MCP_* settings apply; with different ones (e.g. a shorter
+snapshot TTL) the server may ask for more than was recorded, and requests with
+no recorded reply left are reported as unanswered.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import re
+import ssl
+import time
+from collections import defaultdict, deque
+
+# Sets DIM_MCP_DATA_DIR to a scratch directory before the server modules read it
+from benchmark import MemorySampler, _scratch_dir, _wait_for_port, format_memory, make_certificate, percentile
+
+import traffic_log
+
+# Server request type -> DIM's final reply type
+REQUEST_TYPES = {"ping": "pong", "transfer_items": "transfer_items_response"}
+# How long a frame DIM sent on its own waits for the replies recorded before it
+REPLY_WAIT = 10.0
+# The first requestId in a frame: replies carry theirs at the top level
+_REQUEST_ID_RE = re.compile(r'("requestId"\s*:\s*"?)([^",}\s]+)')
+
+
+class Session:
+    """A recording split into timed events and, per connection, DIM's replies."""
+
+    def __init__(self):
+        # (seconds from the start, kind, connection, payload, reply frames
+        # recorded before it on the connection) for connects, disconnects,
+        # frames DIM sent on its own and tool calls
+        self.events = []
+        # connection -> request type -> deque of replies in request order, each a
+        # list of (seconds after the request, text before the requestId, text after)
+        self.replies = defaultdict(lambda: defaultdict(deque))
+        self.frames_in = 0
+        self.bytes_in = 0
+
+
+def load_session(path, max_gap):
+    """
+    Read a traffic log into a Session.
+
+    Connections are renumbered, since a log appended to by several server runs
+    reuses connection numbers, and idle gaps longer than max_gap are shortened.
+    """
+    session = Session()
+    current = {}            # connection number in the log -> renumbered connection
+    numbers = iter(range(1, 1 << 31))
+    requests = {}           # (connection, recorded requestId) -> (request type, time)
+    reply_groups = {}       # (connection, recorded requestId) -> reply frames
+    reply_frames = defaultdict(int)     # connection -> reply frames so far
+    offset = 0.0
+    previous = None
+
+    for record in traffic_log.read(path):
+        if previous is not None:
+            offset += min(max(0.0, record.time - previous), max_gap)
+        previous = record.time
+
+        if record.kind == traffic_log.CONNECT:
+            current[record.connection] = next(numbers)
+        connection = current.get(record.connection, 0)
+
+        if record.kind == traffic_log.FRAME_OUT:
+            message = json.loads(record.payload)
+            request_type = message.get("type")
+            if request_type in REQUEST_TYPES and "requestId" in message:
+                key = (connection, str(message["requestId"]))
+                requests[key] = (request_type, offset)
+                group = reply_groups[key] = []
+                session.replies[connection][request_type].append(group)
+            continue
+
+        if record.kind == traffic_log.FRAME_IN:
+            session.frames_in += 1
+            session.bytes_in += len(record.payload)
+            match = _REQUEST_ID_RE.search(record.payload) if isinstance(record.payload, str) else None
+            key = (connection, match.group(2)) if match else None
+            if key in reply_groups:
+                _, requested_at = requests[key]
+                reply_groups[key].append((offset - requested_at, record.payload[:match.end(1)], record.payload[match.end(2):]))
+                reply_frames[connection] += 1
+                continue
+
+        session.events.append((offset, record.kind, connection, record.payload, reply_frames[connection]))
+    return session
+
+
+class ReplayConnection:
+    """One reopened DIM connection, answering the server from the recording."""
+
+    def __init__(self, replay, replies):
+        self.replay = replay
+        self.replies = replies
+        self.websocket = None
+        self.reply_frames_sent = 0
+        self._replied = asyncio.Condition()
+        self._reader = None
+
+    async def open(self, url):
+        import websockets
+
+        ssl_context = ssl.create_default_context()
+        ssl_context.check_hostname = False
+        ssl_context.verify_mode = ssl.CERT_NONE
+        self.websocket = await websockets.connect(url, ssl=ssl_context, max_size=None)
+        self._reader = asyncio.create_task(self._read())
+
+    async def _read(self):
+        import websockets
+
+        try:
+            async for raw in self.websocket:
+                self.replay.bytes_received += len(raw)
+                message = json.loads(raw)
+                if message.get("type") in REQUEST_TYPES:
+                    self.replay.track(self._reply(message["type"], str(message["requestId"])))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    async def _reply(self, request_type, request_id):
+        queue = self.replies[request_type]
+        if not queue:
+            self.replay.unanswered[request_type] += 1
+            return
+        requested_at = time.monotonic()
+        for delay, before, after in queue.popleft():
+            await self.replay.sleep_until(requested_at, delay)
+            await self.send(before + request_id + after)
+            async with self._replied:
+                self.reply_frames_sent += 1
+                self._replied.notify_all()
+
+    async def wait_for_replies(self, count):
+        """
+        Wait until `count` reply frames have been sent, so frames DIM sent on its
+        own (e.g. pushed updates, which build on the replies) keep their order.
+
+        Returns:
+            bool: False if the server didn't ask for them within REPLY_WAIT
+        """
+        async with self._replied:
+            try:
+                await asyncio.wait_for(self._replied.wait_for(lambda: self.reply_frames_sent >= count), REPLY_WAIT)
+                return True
+            except asyncio.TimeoutError:
+                return False
+
+    async def send(self, payload):
+        self.replay.bytes_sent += len(payload)
+        await self.websocket.send(payload)
+
+    async def close(self):
+        if self.websocket is not None:
+            await self.websocket.close()
+        if self._reader is not None:
+            await asyncio.gather(self._reader, return_exceptions=True)
+
+
+class Replay:
+    """Plays a Session against the in-process server."""
+
+    def __init__(self, session, url, speed):
+        self.session = session
+        self.url = url
+        self.speed = speed          # None for max speed
+        self.connections = {}
+        self.tool_latencies = defaultdict(list)
+        self.tool_errors = defaultdict(int)
+        self.unanswered = defaultdict(int)
+        self.out_of_order = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self._tasks = set()
+
+    def track(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def settle(self):
+        """Wait for every tool call and reply in progress."""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    async def sleep_until(self, start, offset):
+        if self.speed is not None:
+            delay = start + offset / self.speed - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+    async def _call_tool(self, client, payload):
+        call = json.loads(payload)
+        start = time.perf_counter()
+        try:
+            await client.call_tool(call["tool"], call["arguments"])
+        except Exception:
+            self.tool_errors[call["tool"]] += 1
+        self.tool_latencies[call["tool"]].append(time.perf_counter() - start)
+
+    async def run(self, client):
+        start = time.monotonic()
+        for offset, kind, number, payload, replies_before in self.session.events:
+            await self.sleep_until(start, offset)
+            connection = self.connections.get(number)
+            if kind == traffic_log.CONNECT:
+                connection = self.connections[number] = ReplayConnection(self, self.session.replies[number])
+                await connection.open(self.url)
+            elif kind == traffic_log.DISCONNECT:
+                # The log doesn't say which tool calls DIM stayed connected for, so
+                # let those already issued (and their replies) finish first
+                await self.settle()
+                if connection is not None:
+                    await connection.close()
+            elif kind == traffic_log.FRAME_IN:
+                if connection is not None:
+                    if not await connection.wait_for_replies(replies_before):
+                        self.out_of_order += 1
+                    await connection.send(payload)
+            elif kind == traffic_log.TOOL_CALL:
+                self.track(self._call_tool(client, payload))
+        await self.settle()
+        elapsed = time.monotonic() - start
+        for connection in self.connections.values():
+            await connection.close()
+        return elapsed
+
+
+def _stage_name(labels):
+    # "format=json,stage=serialize" -> "serialize{format=json}"
+    pairs = dict(pair.split("=", 1) for pair in labels.split(","))
+    stage = pairs.pop("stage", "")
+    return stage + ("{" + ",".join(f"{k}={v}" for k, v in pairs.items()) + "}" if pairs else "")
+
+
+def print_report(report):
+    print(f"\n=== replay of {report['path']} at {report['speed']} speed ===")
+    print(
+        f"{report['frames_in']} DIM frames, {report['tool_calls']} tool calls in {report['elapsed_s']:.1f} s; "
+        f"{report['bytes_sent']} bytes to the server, {report['bytes_received']} back; {format_memory(report)}"
+    )
+    print(f"{'tool':<32}{'calls':>7}{'err':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for row in report["tools"]:
+        print(f"{row['tool']:<32}{row['calls']:>7}{row['errors']:>5}{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}")
+    print(f"{'server stage':<32}{'count':>7}{'':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for stage, row in report["stages"].items():
+        print(f"{stage:<32}{row['count']:>7}{'':>5}{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}")
+    for request_type, count in report["unanswered"].items():
+        print(f"⚠️ {count} {request_type} requests had no recorded reply left")
+    if report["unused_replies"]:
+        print(f"ℹ️ {report['unused_replies']} recorded replies went unused (the server asked for less than it did while recording)")
+    if report["out_of_order"]:
+        print(f"⚠️ {report['out_of_order']} DIM frames went out before the replies recorded ahead of them")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("recording", help="traffic log written with DIM_MCP_RECORD")
+    parser.add_argument("--speed", default="1", help='playback speed: 1 as recorded, N times faster, or "max"')
+    parser.add_argument("--max-gap", type=float, default=5.0, help="cap on recorded idle gaps, in seconds")
+    parser.add_argument("--port", type=int, default=9132, help="websocket port for the replay server")
+    parser.add_argument("--json", help="also write the report to this JSON file")
+    parser.add_argument("--verbose", action="store_true", help="keep the server's INFO logging")
+    args = parser.parse_args()
+    speed = None if args.speed == "max" else float(args.speed)
+    if speed is not None and speed <= 0:
+        parser.error("--speed must be positive or max")
+
+    import metrics
+    import websocket_server
+    from fastmcp import Client
+    from MCP_server import mcp
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    session = load_session(args.recording, args.max_gap)
+    cert_path, key_path = make_certificate(_scratch_dir)
+    server_task = asyncio.create_task(
+        websocket_server.start_websocket_server(cert_path, key_path, args.port), name="websocket-server"
+    )
+    try:
+        await _wait_for_port(args.port)
+        replay = Replay(session, f"wss://localhost:{args.port}", speed)
+        # Sampled from after the recording is loaded, so only the server's growth counts
+        async with MemorySampler() as memory, Client(mcp) as client:
+            elapsed = await replay.run(client)
+    finally:
+        server_task.cancel()
+        await asyncio.gather(server_task, return_exceptions=True)
+
+    stages = metrics.snapshot()["latency"].get("stage_seconds", {})
+    report = {
+        "path": args.recording,
+        "speed": args.speed if speed is None else f"{speed:g}x",
+        "elapsed_s": elapsed,
+        "frames_in": session.frames_in,
+        "tool_calls": sum(len(v) for v in replay.tool_latencies.values()),
+        "bytes_sent": replay.bytes_sent,
+        "bytes_received": replay.bytes_received,
+        **memory.report(),
+        "tools": [
+            {
+                "tool": tool,
+                "calls": len(latencies),
+                "errors": replay.tool_errors[tool],
+                "p50_ms": percentile(latencies, 50) * 1000,
+                "p95_ms": percentile(latencies, 95) * 1000,
+                "p99_ms": percentile(latencies, 99) * 1000,
+            }
+            for tool, latencies in sorted(replay.tool_latencies.items())
+        ],
+        "stages": {_stage_name(labels): row for labels, row in sorted(stages.items())},
+        "unanswered": dict(replay.unanswered),
+        "out_of_order": replay.out_of_order,
+        "unused_replies": sum(len(queue) for replies in session.replies.values() for queue in replies.values()),
+    }
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n📁 Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,122 @@
+"""LRU cache of rendered tool output, bounded by size in bytes.
+
+Entries are keyed by (account, snapshot, tool name, normalized arguments),
+where the snapshot is the Inventory's serial number. When an account moves to a
+new snapshot, its entries for older ones are dropped, so a cached answer is
+never served for data that changed. With pushed updates a snapshot lives until
+DIM reports a change; otherwise, until the snapshot TTL runs out.
+
+Concurrent misses for the same entry share one render, the way get_inventory
+shares one fetch. Hits and misses are counted in metrics as result_cache{result=...} and
+summarized by stats() for server_stats.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+from collections import OrderedDict
+
+import metrics
+import workers
+
+MAX_BYTES = int(os.environ.get("DIM_MCP_RESULT_CACHE_BYTES", str(8 * 1024 * 1024)))
+
+
+def _normalize(args):
+    # Sorted, compact JSON so equivalent calls (e.g. reordered kwargs) share an entry
+    return json.dumps(args, sort_keys=True, separators=(",", ":"), default=str)
+
+
+class ResultCache:
+    """Rendered strings, least recently used first, evicted once over max_bytes."""
+
+    def __init__(self, max_bytes=MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()   # (account, serial, tool, args) -> str
+        self._serials = {}              # account -> serial of its latest snapshot
+        self._inflight = {}             # key -> future of the render in progress
+
+    def _drop(self, key):
+        self.bytes -= len(self._entries.pop(key).encode("utf-8"))
+
+    def _invalidate_older(self, account, serial):
+        if self._serials.get(account) == serial:
+            return
+        self._serials[account] = serial
+        for key in [k for k in self._entries if k[0] == account and k[1] != serial]:
+            self._drop(key)
+
+    async def get_or_render(self, inventory, tool, args, render):
+        """
+        Return the cached output of tool(args) for this inventory's snapshot, calling render() on a miss.
+
+        render runs on a worker thread (see workers). Snapshots loaded from disk
+        are never cached, since their output includes their age.
+        """
+        if inventory.saved_at is not None:
+            return await workers.run(render)
+        account = inventory.account_fingerprint
+        self._invalidate_older(account, inventory.serial)
+        key = (account, inventory.serial, tool, _normalize(args))
+        text = self._entries.get(key)
+        if text is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            metrics.incr("result_cache", result="hit", tool=tool)
+            return text
+
+        future = self._inflight.get(key)
+        if future is None:
+            self.misses += 1
+            metrics.incr("result_cache", result="miss", tool=tool)
+            future = asyncio.ensure_future(self._render(key, render))
+            self._inflight[key] = future
+        else:
+            self.hits += 1
+            metrics.incr("result_cache", result="coalesced", tool=tool)
+        # Shield so a cancelled tool call does not cancel the render other callers share
+        return await asyncio.shield(future)
+
+    async def _render(self, key, render):
+        try:
+            text = await workers.run(render)
+        finally:
+            self._inflight.pop(key, None)
+        account, serial = key[0], key[1]
+        if self._serials.get(account) != serial:
+            # A newer snapshot arrived while rendering; don't cache for an old one
+            return text
+        size = len(text.encode("utf-8"))
+        if size <= self.max_bytes:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = text
+            self.bytes += size
+            while self.bytes > self.max_bytes and self._entries:
+                self._drop(next(iter(self._entries)))
+                metrics.incr("result_cache_evictions")
+        return text
+
+    def clear(self):
+        self._entries.clear()
+        self._serials.clear()
+        self.bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+        }
+
+
+results = ResultCache()
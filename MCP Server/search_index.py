@@ -0,0 +1,209 @@
+"""Typo-tolerant full-text search over weapons and armor.
+
+Each item is indexed as the tokens of its name, type, perks, mods, tag and
+notes, weighted by field. A token -> {item id: weight} inverted index answers
+exact and prefix matches. A trigram -> tokens index over the vocabulary finds
+misspellings: query tokens are matched to vocabulary tokens by the share of
+trigrams they have in common.
+
+Indexes are kept per account and updated in place when a new snapshot arrives.
+Items the inventory model kept from the previous snapshot are the same objects,
+so only new or changed items are re-tokenized.
+"""
+
+from __future__ import annotations
+
+import re
+import threading
+from collections import defaultdict
+from typing import Iterable, Optional
+
+import metrics
+
+_TOKEN_RE = re.compile(r"[^\W_]+")
+
+# Field -> weight of a match in that field
+FIELD_WEIGHTS = {"name": 3.0, "perks": 2.0, "mods": 2.0, "type": 1.5, "tag": 1.5, "notes": 1.0}
+
+# Match quality: exact token, query token is a prefix, or misspelled (scaled by
+# trigram similarity, which must reach FUZZY_THRESHOLD)
+PREFIX_MATCH = 0.8
+FUZZY_MATCH = 0.6
+FUZZY_THRESHOLD = 0.45
+# Shorter query tokens only match exactly or as prefixes
+MIN_FUZZY_LENGTH = 4
+
+
+def tokenize(text) -> list[str]:
+    return _TOKEN_RE.findall(text.casefold()) if text else []
+
+
+def _trigrams(token):
+    padded = f"^{token}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _item_fields(item):
+    yield "name", item.name
+    yield "type", item.type
+    yield "tag", item.tag
+    yield "notes", item.notes
+    for perk in item.perk_names():
+        yield "perks", perk
+    for mod in item.mod_names():
+        yield "mods", mod
+
+
+def _item_tokens(item):
+    """Token -> weight of the best field it appears in."""
+    tokens = {}
+    for field, text in _item_fields(item):
+        weight = FIELD_WEIGHTS[field]
+        for token in tokenize(text):
+            if tokens.get(token, 0) < weight:
+                tokens[token] = weight
+    return tokens
+
+
+class SearchIndex:
+    """Inverted token and trigram indexes over one account's items."""
+
+    def __init__(self):
+        self._items = {}                          # item id -> Item indexed
+        self._doc_tokens = {}                     # item id -> {token: weight}
+        self._postings = defaultdict(dict)        # token -> {item id: weight}
+        self._trigrams = defaultdict(set)         # trigram -> tokens
+        self.lock = threading.Lock()
+
+    def _add(self, item):
+        tokens = _item_tokens(item)
+        self._items[item.id] = item
+        self._doc_tokens[item.id] = tokens
+        for token, weight in tokens.items():
+            posting = self._postings[token]
+            if not posting:
+                for trigram in _trigrams(token):
+                    self._trigrams[trigram].add(token)
+            posting[item.id] = weight
+
+    def _remove(self, item_id):
+        del self._items[item_id]
+        for token in self._doc_tokens.pop(item_id):
+            posting = self._postings[token]
+            del posting[item_id]
+            if not posting:
+                del self._postings[token]
+                for trigram in _trigrams(token):
+                    tokens = self._trigrams[trigram]
+                    tokens.discard(token)
+                    if not tokens:
+                        del self._trigrams[trigram]
+
+    def update(self, items: Iterable) -> int:
+        """
+        Make the index hold exactly these items, re-indexing only new or changed ones.
+
+        Returns:
+            int: Number of items added, replaced or removed
+        """
+        current = {item.id: item for item in items}
+        changes = 0
+        for item_id in [i for i in self._items if i not in current]:
+            self._remove(item_id)
+            changes += 1
+        for item_id, item in current.items():
+            indexed = self._items.get(item_id)
+            if indexed is item:
+                continue
+            if indexed is not None:
+                self._remove(item_id)
+            self._add(item)
+            changes += 1
+        return changes
+
+    def _matches(self, token):
+        """Vocabulary tokens matching a query token, with match quality."""
+        matches = {}
+        if token in self._postings:
+            matches[token] = 1.0
+        if len(token) >= 3:
+            for candidate in self._postings:
+                if candidate != token and candidate.startswith(token):
+                    matches[candidate] = PREFIX_MATCH
+        if len(token) >= MIN_FUZZY_LENGTH:
+            query = _trigrams(token)
+            shared = defaultdict(int)
+            for trigram in query:
+                for candidate in self._trigrams.get(trigram, ()):
+                    shared[candidate] += 1
+            for candidate, count in shared.items():
+                similarity = 2 * count / (len(query) + len(candidate) + 2)
+                if similarity >= FUZZY_THRESHOLD and candidate not in matches:
+                    matches[candidate] = FUZZY_MATCH * similarity
+        return matches
+
+    def search(self, text: str, kind: Optional[str] = None) -> list:
+        """
+        Return (Item, score) for items matching every word of `text`, best first.
+
+        Each word matches exactly, as a prefix or with typos; its score is the
+        match quality times the weight of the field it was found in.
+        """
+        scores = None
+        for token in dict.fromkeys(tokenize(text)):
+            token_scores = {}
+            for candidate, quality in self._matches(token).items():
+                for item_id, weight in self._postings[candidate].items():
+                    score = quality * weight
+                    if token_scores.get(item_id, 0) < score:
+                        token_scores[item_id] = score
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {item_id: s + token_scores[item_id] for item_id, s in scores.items() if item_id in token_scores}
+            if not scores:
+                return []
+        if scores is None:
+            return []
+        results = [(self._items[item_id], score) for item_id, score in scores.items()]
+        if kind is not None:
+            results = [(item, score) for item, score in results if item.kind == kind]
+        results.sort(key=lambda pair: (-pair[1], pair[0].name or ""))
+        return results
+
+    def __len__(self):
+        return len(self._items)
+
+
+# Recently used (account key, SearchIndex) pairs, newest last
+_indexes = []
+CACHED_INDEXES = 4
+_indexes_lock = threading.Lock()
+
+
+def _index_for(key):
+    with _indexes_lock:
+        for i, (cached_key, index) in enumerate(_indexes):
+            if cached_key == key:
+                _indexes.append(_indexes.pop(i))
+                return index
+        index = SearchIndex()
+        _indexes.append((key, index))
+        del _indexes[:-CACHED_INDEXES]
+        return index
+
+
+def search(inventory, text: str, kind: Optional[str] = None) -> list:
+    """
+    Search an inventory through its account's index, brought up to date with it first.
+
+    The update and the search happen under the index's lock, so concurrent
+    calls for different snapshots of one account each see their own items.
+    """
+    index = _index_for(inventory.account_fingerprint)
+    with index.lock:
+        with metrics.span("search_index_update"):
+            changes = index.update(inventory.items)
+        if changes:
+            metrics.incr("search_index_changes", changes)
+        return index.search(text, kind)
@@ -0,0 +1,167 @@
+"""On-disk store of recent inventory snapshots.
+
+Every live snapshot fetched from DIM is saved to a small SQLite database as
+zlib-compressed JSON with a SHA-256 checksum. When DIM is not connected (or
+still booting), tools fall back to the newest snapshot that passes its
+checksum, marked with its age, instead of failing outright.
+
+Snapshots are kept per account (the key websocket_server derives from DIM's
+hello). All database work happens on one dedicated thread; the latest snapshot
+of each account is loaded lazily the first time it is needed and then kept in
+memory.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import dim_messages
+from snapshot_writer import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = Path(os.environ.get("DIM_MCP_SNAPSHOT_DB", str(DATA_DIR / "dim_snapshots.sqlite3")))
+KEEP_SNAPSHOTS = 3
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="snapshot-store")
+_conn = None
+_latest = {}            # account -> newest verified snapshot, in pong shape plus "source"/"savedAt"
+_save_pending = {}      # account -> newest snapshot waiting to be saved
+_save_task = None
+
+
+def _connect():
+    global _conn
+    if _conn is None:
+        DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+        _conn = sqlite3.connect(DB_PATH)
+        _conn.execute(
+            "CREATE TABLE IF NOT EXISTS snapshots ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " version TEXT,"
+            " saved_at REAL NOT NULL,"
+            " sha256 TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " payload BLOB NOT NULL)"
+        )
+        # Databases from before snapshots were kept per account lack the column
+        columns = [row[1] for row in _conn.execute("PRAGMA table_info(snapshots)")]
+        if "account" not in columns:
+            _conn.execute("ALTER TABLE snapshots ADD COLUMN account TEXT")
+        _conn.commit()
+    return _conn
+
+
+def _save(full_data, account):
+    raw = json.dumps(full_data, separators=(",", ":"), default=dim_messages.encode_record).encode("utf-8")
+    digest = hashlib.sha256(raw).hexdigest()
+    conn = _connect()
+    with conn:
+        conn.execute(
+            "INSERT INTO snapshots (account, version, saved_at, sha256, size, payload) VALUES (?, ?, ?, ?, ?, ?)",
+            (account, str(full_data.get("version")), time.time(), digest, len(raw), zlib.compress(raw, 6)),
+        )
+        conn.execute(
+            "DELETE FROM snapshots WHERE account IS ? AND id NOT IN"
+            " (SELECT id FROM snapshots WHERE account IS ? ORDER BY id DESC LIMIT ?)",
+            (account, account, KEEP_SNAPSHOTS),
+        )
+    return len(raw)
+
+
+def _newest_account():
+    """Return the account of the newest stored snapshot, or None if there is none."""
+    if not DB_PATH.exists():
+        return None
+    row = _connect().execute("SELECT account FROM snapshots ORDER BY id DESC LIMIT 1").fetchone()
+    return row[0] if row is not None else None
+
+
+def _load_latest(account):
+    """Return the newest snapshot of an account whose checksum verifies, or None."""
+    if not DB_PATH.exists():
+        return None
+    rows = _connect().execute(
+        "SELECT id, saved_at, sha256, payload FROM snapshots WHERE account IS ? ORDER BY id DESC", (account,)
+    ).fetchall()
+    for row_id, saved_at, digest, payload in rows:
+        try:
+            raw = zlib.decompress(payload)
+        except zlib.error:
+            raw = b""
+        if hashlib.sha256(raw).hexdigest() != digest:
+            logger.warning(f"⚠️ Stored snapshot {row_id} failed its checksum, skipping")
+            continue
+        try:
+            full_data = dim_messages.decode(raw)
+        except ValueError as e:
+            logger.warning(f"⚠️ Stored snapshot {row_id} could not be decoded ({e}), skipping")
+            continue
+        full_data["source"] = "disk"
+        full_data["savedAt"] = saved_at
+        return full_data
+    return None
+
+
+async def _drain_saves():
+    loop = asyncio.get_running_loop()
+    while _save_pending:
+        account = next(iter(_save_pending))
+        full_data = _save_pending.pop(account)
+        try:
+            size = await loop.run_in_executor(_executor, _save, full_data, account)
+            logger.info(f"💾 Stored inventory snapshot v{full_data.get('version')} ({size} bytes)")
+        except Exception as e:
+            logger.error(f"❌ Failed to store inventory snapshot: {e}")
+
+
+def save(full_data, account=None):
+    """
+    Save a live snapshot of an account in the background.
+
+    Only one save runs at a time; if several snapshots of the same account
+    arrive meanwhile, only the newest is written.
+    """
+    global _save_task
+    _latest[account] = {**full_data, "source": "disk", "savedAt": time.time()}
+    _save_pending[account] = full_data
+    if _save_task is None or _save_task.done():
+        _save_task = asyncio.create_task(_drain_saves(), name="snapshot-store")
+
+
+async def load_latest(account=None):
+    """
+    Return the newest stored snapshot (loading it on first use), or None if there is none.
+
+    Args:
+        account: Account key; None means the account that was stored last, so a
+            server that no DIM has connected to yet can answer for the last user
+    """
+    if account is None:
+        known = [snapshot for snapshot in _latest.values() if snapshot is not None]
+        if known:
+            return max(known, key=lambda snapshot: snapshot["savedAt"])
+        try:
+            account = await asyncio.get_running_loop().run_in_executor(_executor, _newest_account)
+        except Exception as e:
+            logger.error(f"❌ Failed to read stored snapshots: {e}")
+            return None
+        # Still None for snapshots saved before they were kept per account
+    if account not in _latest:
+        try:
+            latest = await asyncio.get_running_loop().run_in_executor(_executor, _load_latest, account)
+        except Exception as e:
+            logger.error(f"❌ Failed to read stored snapshots: {e}")
+            latest = None
+        # A save may have landed while we were reading
+        _latest.setdefault(account, latest)
+        if latest is not None:
+            logger.info(f"📀 Loaded stored inventory snapshot v{latest.get('version')}")
+    return _latest[account]
@@ -0,0 +1,119 @@
+"""Asynchronous persistence of DIM summaries to disk.
+
+handle_client hands each summary to persist() and moves on. A single writer
+task drains a bounded queue and does the serialization and file I/O on a
+worker thread, so multi-MB dumps never stall the event loop. Writes for the
+same file are coalesced (the latest snapshot wins) and land atomically via a
+temp file + rename.
+"""
+
+import asyncio
+import gzip
+import json
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from dim_messages import encode_record
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = Path(os.environ.get("DIM_MCP_DATA_DIR", str(Path.home() / "Desktop")))
+# "json" writes compact JSON, "json.gz" writes gzip-compressed compact JSON
+FILE_FORMAT = os.environ.get("DIM_MCP_FILE_FORMAT", "json")
+MAX_QUEUED_WRITES = 16
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="snapshot-writer")
+_pending = {}      # path -> latest data waiting to be written
+_queue = None
+_writer_task = None
+
+
+def snapshot_path(name: str) -> Path:
+    """Path of the on-disk file for a summary, e.g. "weapons" -> dim_weapons.json."""
+    return DATA_DIR / f"dim_{name}.{FILE_FORMAT}"
+
+
+def _write_atomic(path: Path, data) -> int:
+    """Serialize data and atomically replace path with it. Runs on the writer thread."""
+    payload = json.dumps(data, separators=(",", ":"), default=encode_record).encode("utf-8")
+    if path.suffix == ".gz":
+        payload = gzip.compress(payload, compresslevel=5)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        # mkstemp creates 0600 files; match what a plain open() would have produced
+        os.fchmod(fd, 0o644)
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    return len(payload)
+
+
+def _read(path: Path):
+    with open(path, "rb") as f:
+        payload = f.read()
+    if path.suffix == ".gz":
+        payload = gzip.decompress(payload)
+    return json.loads(payload)
+
+
+async def _writer():
+    loop = asyncio.get_running_loop()
+    while True:
+        path = await _queue.get()
+        data = _pending.pop(path, None)
+        try:
+            if data is not None:
+                size = await loop.run_in_executor(_executor, _write_atomic, path, data)
+                logger.info(f"📁 Saved {path.name} ({size} bytes)")
+        except Exception as e:
+            logger.error(f"❌ Failed to save {path}: {e}")
+        finally:
+            _queue.task_done()
+
+
+async def persist(name: str, data):
+    """
+    Queue a summary to be written to disk in the background.
+
+    If a write for the same file is still queued, its data is replaced rather
+    than written twice. Waits only when the queue is full.
+    """
+    global _queue, _writer_task
+    if _writer_task is None or _writer_task.done():
+        _queue = asyncio.Queue(maxsize=MAX_QUEUED_WRITES)
+        _writer_task = asyncio.create_task(_writer(), name="snapshot-writer")
+
+    path = snapshot_path(name)
+    already_queued = path in _pending
+    _pending[path] = data
+    if not already_queued:
+        await _queue.put(path)
+
+
+async def flush():
+    """Wait until every queued write has landed on disk."""
+    if _queue is not None:
+        await _queue.join()
+
+
+async def load(name: str, default=None):
+    """Read a persisted summary on the writer thread; returns default if it can't be read."""
+    path = snapshot_path(name)
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_executor, _read, path)
+    except Exception as e:
+        logger.error(f"❌ Failed to load {path.name}: {e}")
+        return default
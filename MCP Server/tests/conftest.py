@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The server is a flat set of modules run from "MCP Server"; make them importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
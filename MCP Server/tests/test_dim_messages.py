@@ -0,0 +1,132 @@
+import json
+
+import pytest
+
+import dim_messages
+from dim_messages import ChunkedPong, MessageError
+from websocket_server import Connection, _apply_pong
+
+STORES = [{"id": "2305843009000000001", "name": "Human Warlock", "isVault": False, "emblemPath": "/img.png"}]
+
+
+def weapon(item_id, name="Fatebringer", power=2000, **fields):
+    return {"id": item_id, "name": name, "type": "Hand Cannon", "power": power, "perks": [["Firefly (Equipped)"]], **fields}
+
+
+def pong(weapons, version=1, **extra):
+    return {"type": "pong", "requestId": "1", "version": version, "weapons": {"data": weapons}, "armor": {"data": []}, "stores": {"data": STORES}, **extra}
+
+
+def delta(changed, removed, base_version, version):
+    return {
+        "type": "pong", "requestId": "2", "delta": True, "baseVersion": base_version, "version": version,
+        "weapons": {"changed": changed, "removed": removed}, "armor": {"changed": [], "removed": []},
+        "stores": {"data": STORES},
+    }
+
+
+def test_full_pong_decodes_items_and_trims_stores():
+    msg = dim_messages.decode(json.dumps(pong([weapon("1"), weapon(2, name="Palindrome")])))
+    items = msg["weapons"]["data"]
+    assert [(item.id, item.name, item.kind) for item in items] == [("1", "Fatebringer", "weapon"), ("2", "Palindrome", "weapon")]
+    assert items[0].perk_names() == ["Firefly"]
+    assert "emblemPath" not in msg["stores"]["data"][0]
+
+
+def test_string_table_pong_resolves_indexes():
+    encoded = {"id": "1", "name": 0, "type": 1, "perks": [[2]], "owner": 3}
+    msg = dim_messages.decode(json.dumps(pong(
+        [encoded], encoding="strings", strings=["Fatebringer", "Hand Cannon", "Firefly (Equipped)", "Human Warlock"],
+    )))
+    item = msg["weapons"]["data"][0]
+    assert (item.name, item.type, item.owner, item.perk_names()) == ("Fatebringer", "Hand Cannon", "Human Warlock", ["Firefly"])
+
+
+def test_bad_string_index_is_rejected():
+    msg = pong([{"id": "1", "name": 5}], encoding="strings", strings=["Fatebringer"])
+    with pytest.raises(MessageError, match=r"weapons.data\[0\]: expected string table indexes"):
+        dim_messages.decode_object(msg)
+
+
+@pytest.mark.parametrize("msg, error", [
+    ({**pong([]), "weapons": []}, "weapons: expected an object"),
+    (pong([{"name": "Fatebringer"}]), r"weapons.data\[0\].id: expected a string id"),
+    (pong([weapon("1", perks="Firefly")]), r"weapons.data\[0\].perks: expected a list of perk columns"),
+    ({**pong([]), "stores": {"data": [{"id": 7}]}}, r"stores.data\[0\].id: expected a string id"),
+    (pong([], encoding="gzip"), "encoding: expected 'strings'"),
+])
+def test_malformed_pongs_are_rejected(msg, error):
+    with pytest.raises(MessageError, match=error) as caught:
+        dim_messages.decode_object(msg)
+    assert caught.value.message_type == "pong"
+    assert caught.value.request_id == "1"
+
+
+def test_delta_pong_decodes_changes_and_removals():
+    msg = dim_messages.decode_object(delta([weapon("1", power=2010)], [3], base_version=1, version=2))
+    assert [item.power for item in msg["weapons"]["changed"]] == [2010]
+    assert msg["weapons"]["removed"] == ["3"]
+    assert (msg["baseVersion"], msg["version"]) == (1, 2)
+
+
+def chunk(seq, items, **extra):
+    return dim_messages.decode_object({"type": "pong_chunk", "requestId": "1", "seq": seq, "kind": "weapons", "items": items, **extra})
+
+
+def committing_pong(chunks):
+    msg = pong([], chunks=chunks)
+    del msg["weapons"]["data"]
+    return dim_messages.decode_object(msg)
+
+
+def test_chunked_pong_reassembles_with_a_growing_string_table():
+    upload = ChunkedPong("1", max_bytes=10_000)
+    upload.add(chunk(0, [{"id": "1", "name": 0}], encoding="strings", strings=["Fatebringer"]), 100)
+    # The second chunk refers to the first chunk's string as well as its own
+    upload.add(chunk(1, [{"id": "2", "name": 1}, {"id": "3", "name": 0}], encoding="strings", strings=["Palindrome"]), 100)
+    msg = upload.commit(committing_pong(2))
+    assert [(item.id, item.name) for item in msg["weapons"]["data"]] == [("1", "Fatebringer"), ("2", "Palindrome"), ("3", "Fatebringer")]
+
+
+def test_chunk_sequence_gap_is_rejected():
+    upload = ChunkedPong("1", max_bytes=10_000)
+    upload.add(chunk(0, [weapon("1")]), 100)
+    with pytest.raises(MessageError, match="got chunk 2, expected 1"):
+        upload.add(chunk(2, [weapon("2")]), 100)
+
+
+def test_missing_chunks_and_oversized_uploads_are_rejected():
+    upload = ChunkedPong("1", max_bytes=150)
+    upload.add(chunk(0, [weapon("1")]), 100)
+    with pytest.raises(MessageError, match="committed 2 chunks but 1 arrived"):
+        upload.commit(committing_pong(2))
+    with pytest.raises(MessageError, match="exceeds 150 bytes"):
+        upload.add(chunk(1, [weapon("2")]), 100)
+
+
+def test_chunk_with_a_bad_string_index_is_rejected():
+    upload = ChunkedPong("1", max_bytes=10_000)
+    with pytest.raises(MessageError, match="chunked pong chunk 0 items"):
+        upload.add(chunk(0, [{"id": "1", "name": 3}], encoding="strings", strings=["Fatebringer"]), 100)
+
+
+def test_apply_pong_patches_the_model_with_a_matching_delta():
+    connection = Connection(websocket=None)
+    assert _apply_pong(connection, dim_messages.decode_object(pong([weapon("1"), weapon("2"), weapon("3")], version=1)))
+    assert _apply_pong(connection, dim_messages.decode_object(delta([weapon("1", power=2010), weapon("4")], ["3"], base_version=1, version=2)))
+
+    model = connection.inventory_model
+    assert model["version"] == 2
+    assert sorted(model["weapons"]) == ["1", "2", "4"]
+    assert model["weapons"]["1"].power == 2010
+
+
+def test_apply_pong_rejects_a_delta_against_another_version():
+    connection = Connection(websocket=None)
+    # No base at all, e.g. right after a reconnect
+    assert not _apply_pong(connection, dim_messages.decode_object(delta([], [], base_version=1, version=2)))
+    _apply_pong(connection, dim_messages.decode_object(pong([weapon("1")], version=5)))
+    assert not _apply_pong(connection, dim_messages.decode_object(delta([weapon("1", power=2010)], [], base_version=4, version=6)))
+    # The model is left alone, so the caller can resync with a full ping
+    assert connection.inventory_model["version"] == 5
+    assert connection.inventory_model["weapons"]["1"].power == 2000
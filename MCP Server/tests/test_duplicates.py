@@ -0,0 +1,53 @@
+from duplicates import find_duplicates
+from inventory_model import Inventory, Item
+
+
+def weapon(item_id, perks, power=2000, tag=None):
+    return Item("weapon", {
+        "id": item_id,
+        "name": "Fatebringer",
+        "type": "Hand Cannon",
+        "power": power,
+        "tag": tag,
+        "perks": [[f"{perk} (Equipped)"] for perk in perks],
+    })
+
+
+def test_copies_are_compared_with_the_kept_copy_not_chained():
+    # A~B (0.6) and B~C (0.6), but A and C only share 2 of 6 perks (0.33)
+    a = weapon("1", ["Explosive Payload", "Firefly", "Opening Shot", "Ricochet"], power=2010)
+    b = weapon("2", ["Firefly", "Opening Shot", "Ricochet", "Outlaw"])
+    c = weapon("3", ["Opening Shot", "Ricochet", "Outlaw", "Kill Clip"])
+    groups = find_duplicates(Inventory([a, b, c], [], []), min_similarity=0.5)
+
+    assert len(groups) == 1
+    assert groups[0]["keep"] is a
+    assert [item.id for item, _ in groups[0]["shard"]] == ["2"]
+
+
+def test_every_shard_candidate_meets_min_similarity():
+    rolls = [
+        ["Explosive Payload", "Firefly", "Opening Shot", "Ricochet"],
+        ["Firefly", "Opening Shot", "Ricochet", "Outlaw"],
+        ["Opening Shot", "Ricochet", "Outlaw", "Kill Clip"],
+        ["Ricochet", "Outlaw", "Kill Clip", "Rampage"],
+        ["Explosive Payload", "Firefly", "Opening Shot", "Ricochet"],
+    ]
+    copies = [weapon(str(i), perks, power=2000 + i) for i, perks in enumerate(rolls)]
+    for group in find_duplicates(Inventory(copies, [], []), min_similarity=0.5):
+        keep = set(group["keep"].perk_names(equipped_only=True))
+        for item, similarity in group["shard"]:
+            perks = set(item.perk_names(equipped_only=True))
+            assert similarity == len(keep & perks) / len(keep | perks)
+            assert similarity >= 0.5
+
+
+def test_protected_copies_are_never_shard_candidates():
+    kept = weapon("1", ["Firefly", "Outlaw"], power=2010)
+    favorite = weapon("2", ["Firefly", "Outlaw"], tag="favorite")
+    junk = weapon("3", ["Firefly", "Outlaw"], tag="junk")
+    groups = find_duplicates(Inventory([kept, favorite, junk], [], []), min_similarity=1.0)
+
+    # Tagged copies are kept first; junk-tagged copies are listed first
+    assert groups[0]["keep"] is favorite
+    assert [item.id for item, _ in groups[0]["shard"]] == ["3", "1"]
@@ -0,0 +1,60 @@
+import pytest
+
+from inventory_model import Inventory, Item
+from inventory_query import QueryError, compile_query, run_query
+
+
+def make_inventory():
+    weapons = [
+        Item("weapon", {"id": "1", "name": "Fatebringer", "type": "Hand Cannon", "element": "Kinetic", "power": 2010, "tag": "favorite",
+                        "perks": [["Explosive Payload (Equipped)"], ["Firefly (Equipped)"]]}),
+        Item("weapon", {"id": "2", "name": "Gjallarhorn", "type": "Rocket Launcher", "element": "Solar", "power": 2000, "tag": "junk"}),
+    ]
+    armor = [Item("armor", {"id": "3", "name": "Iron Helmet", "type": "Helmet", "stats": {"Discipline": 25, "Total": 68}})]
+    return Inventory(weapons, armor, [])
+
+
+def ids(query):
+    return [item.id for item in run_query(query, make_inventory())]
+
+
+def test_implicit_and_explicit_and():
+    assert ids("kind:weapon element:solar") == ["2"]
+    assert ids("kind:weapon and element:solar") == ["2"]
+
+
+def test_or_not_and_parentheses():
+    assert ids("kind:weapon and (perk~firefly or tag:junk)") == ["1", "2"]
+    assert ids("kind:weapon not tag:junk") == ["1"]
+
+
+def test_numeric_and_stat_comparisons():
+    assert ids("power>=2005") == ["1"]
+    assert ids("kind:weapon crafted<5") == []
+    assert ids("stats.Total>=65 stats.Discipline>20") == ["3"]
+
+
+@pytest.mark.parametrize("query", [
+    "kind:weapon and",
+    "and kind:weapon",
+    "kind:weapon and and element:solar",
+    "(kind:weapon and) or tag:junk",
+    "kind:weapon and or tag:junk",
+    "kind:weapon or",
+])
+def test_dangling_operator_is_rejected(query):
+    with pytest.raises(QueryError, match="Expected a term"):
+        compile_query(query)
+
+
+@pytest.mark.parametrize("query", ["tier>3", "name>=5", "tag<2", "owner<=vault", "kind>weapon"])
+def test_numeric_operator_on_text_field_is_rejected(query):
+    with pytest.raises(QueryError, match="needs a numeric field"):
+        compile_query(query)
+
+
+def test_malformed_terms_are_rejected():
+    with pytest.raises(QueryError, match="Missing closing parenthesis"):
+        compile_query("(kind:weapon")
+    with pytest.raises(QueryError, match="Expected a value"):
+        compile_query("power>=")
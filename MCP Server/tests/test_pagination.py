@@ -0,0 +1,38 @@
+import pytest
+
+from Data_Parsing import iter_weapons_all, render_page
+from inventory_model import Inventory, Item
+
+STORES = [{"id": "2305843009000000001", "name": "Warlock"}, {"id": "vault", "isVault": True}]
+OTHER_STORES = [{"id": "2305843009000000002", "name": "Hunter"}, {"id": "vault", "isVault": True}]
+
+
+def inventory(stores=STORES, version=1, power=2000):
+    weapons = [Item("weapon", {"id": str(i), "name": f"Weapon {i}", "power": power}) for i in range(5)]
+    return Inventory(weapons, [], stores, version=version)
+
+
+def next_cursor(text):
+    return text.rsplit("cursor=", 1)[1]
+
+
+def page(inv, cursor=None):
+    return render_page(iter_weapons_all(inv), inv, "weapons_all|None", limit=2, cursor=cursor)
+
+
+def test_cursor_survives_dim_reconnect_with_same_content():
+    cursor = next_cursor(page(inventory(version=7)))
+    # DIM's version counter restarts when the tab reconnects
+    assert '"Weapon 2"' in page(inventory(version=1), cursor)
+
+
+def test_cursor_rejected_after_content_changes():
+    cursor = next_cursor(page(inventory()))
+    with pytest.raises(ValueError, match="Inventory changed"):
+        page(inventory(power=2010), cursor)
+
+
+def test_cursor_rejected_for_another_account():
+    cursor = next_cursor(page(inventory()))
+    with pytest.raises(ValueError, match="different listing"):
+        page(inventory(stores=OTHER_STORES), cursor)
@@ -0,0 +1,61 @@
+"""The resource subscription hook reaches into FastMCP's low-level server; these
+tests fail if an SDK upgrade stops it from working."""
+
+import asyncio
+
+import pytest
+
+pytest.importorskip("fastmcp")
+
+from fastmcp import Client  # noqa: E402
+from fastmcp.client.messages import MessageHandler  # noqa: E402
+
+import MCP_server  # noqa: E402
+import websocket_server  # noqa: E402
+
+
+class Updates(MessageHandler):
+    def __init__(self):
+        self.uris = []
+
+    async def on_resource_updated(self, message):
+        self.uris.append(str(message.params.uri))
+
+
+@pytest.fixture
+def accounts(monkeypatch):
+    monkeypatch.setitem(websocket_server._known_accounts, "3:111", {"membershipId": "111"})
+    monkeypatch.setitem(websocket_server._known_accounts, "3:222", {"membershipId": "222"})
+    monkeypatch.setattr(MCP_server, "_resource_subscribers", {})
+
+
+def test_subscribe_is_advertised_and_updates_reach_only_the_changed_account(accounts):
+    updates = Updates()
+
+    async def main():
+        async with Client(MCP_server.mcp, message_handler=updates) as client:
+            assert client.initialize_result.capabilities.resources.subscribe is True
+            await client.session.subscribe_resource("dim://inventory/111/armor")
+            await client.session.subscribe_resource("dim://inventory/3:222/weapons")
+            assert set(MCP_server._resource_subscribers) == {"dim://inventory/111/armor", "dim://inventory/3:222/weapons"}
+
+            MCP_server._on_inventory_change("3:222")
+            for _ in range(50):
+                if updates.uris:
+                    break
+                await asyncio.sleep(0.01)
+
+            await client.session.unsubscribe_resource("dim://inventory/3:222/weapons")
+            assert not MCP_server._resource_subscribers["dim://inventory/3:222/weapons"]
+
+    asyncio.run(main())
+    assert updates.uris == ["dim://inventory/3:222/weapons"]
+
+
+def test_invalidating_a_snapshot_notifies_listeners(monkeypatch):
+    seen = []
+    monkeypatch.setattr(websocket_server, "_inventory_listeners", [seen.append])
+    state = websocket_server._account_state("3:111")
+    monkeypatch.setattr(state, "snapshot", {"version": 1})
+    websocket_server.invalidate_inventory("3:111")
+    assert seen == ["3:111"]
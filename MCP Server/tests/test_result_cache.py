@@ -0,0 +1,51 @@
+import asyncio
+import time
+
+from inventory_model import Inventory
+from result_cache import ResultCache
+
+
+def slow_render(text, calls):
+    def render():
+        calls.append(text)
+        time.sleep(0.01)
+        return text
+    return render
+
+
+def accounted(cache):
+    return sum(len(text.encode("utf-8")) for text in cache._entries.values())
+
+
+def test_concurrent_identical_misses_render_once():
+    cache = ResultCache(max_bytes=1000)
+    inventory = Inventory([], [], [])
+    calls = []
+
+    async def main():
+        for _ in range(5):
+            outputs = await asyncio.gather(*(
+                cache.get_or_render(inventory, "tool", {"a": 1}, slow_render("x" * 100, calls)) for _ in range(8)
+            ))
+            assert outputs == ["x" * 100] * 8
+
+    asyncio.run(main())
+    assert calls == ["x" * 100]
+    assert cache.bytes == accounted(cache) == 100
+
+
+def test_eviction_keeps_byte_count_exact():
+    cache = ResultCache(max_bytes=250)
+    inventory = Inventory([], [], [])
+    calls = []
+
+    async def main():
+        for round_ in range(3):
+            await asyncio.gather(*(
+                cache.get_or_render(inventory, "tool", {"n": n}, slow_render(str(n) * 100, calls))
+                for n in range(5) for _ in range(3)
+            ))
+            assert cache.bytes == accounted(cache) <= cache.max_bytes
+
+    asyncio.run(main())
+    assert cache.stats()["entries"] == 2
@@ -0,0 +1,77 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import time
+import zlib
+
+import pytest
+
+import snapshot_store
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshot_store, "DB_PATH", tmp_path / "snapshots.sqlite3")
+    monkeypatch.setattr(snapshot_store, "_conn", None)
+    monkeypatch.setattr(snapshot_store, "_latest", {})
+    return tmp_path / "snapshots.sqlite3"
+
+
+def run(fn, *args):
+    # The store's SQLite connection belongs to its own thread
+    return snapshot_store._executor.submit(fn, *args).result()
+
+
+def snapshot(version):
+    return {"type": "pong", "version": version, "weapons": {"data": [{"id": "1", "name": "Fatebringer"}]}, "armor": {"data": []}, "stores": {"data": []}}
+
+
+def rows(path, account):
+    with sqlite3.connect(path) as conn:
+        return [row[0] for row in conn.execute("SELECT version FROM snapshots WHERE account IS ? ORDER BY id", (account,))]
+
+
+def test_keeps_the_last_snapshots_per_account(store):
+    for version in range(1, 6):
+        run(snapshot_store._save, snapshot(version), "3:111")
+    run(snapshot_store._save, snapshot(9), "3:222")
+
+    assert rows(store, "3:111") == ["3", "4", "5"]
+    assert rows(store, "3:222") == ["9"]
+
+
+def test_corrupt_snapshot_is_skipped_for_the_newest_valid_one(store):
+    for version in (1, 2, 3):
+        run(snapshot_store._save, snapshot(version), "3:111")
+    with sqlite3.connect(store) as conn:
+        conn.execute("UPDATE snapshots SET payload = ? WHERE version = '3'", (zlib.compress(b'{"type":"pong","version":3}'),))
+        conn.execute("UPDATE snapshots SET payload = ? WHERE version = '2'", (b"not zlib",))
+
+    latest = run(snapshot_store._load_latest, "3:111")
+
+    assert latest["version"] == 1
+    assert latest["source"] == "disk"
+    assert latest["weapons"]["data"][0].name == "Fatebringer"
+
+
+def test_database_from_before_accounts_is_migrated(store):
+    raw = json.dumps(snapshot(7)).encode("utf-8")
+    with sqlite3.connect(store) as conn:
+        conn.execute(
+            "CREATE TABLE snapshots (id INTEGER PRIMARY KEY AUTOINCREMENT, version TEXT, saved_at REAL NOT NULL,"
+            " sha256 TEXT NOT NULL, size INTEGER NOT NULL, payload BLOB NOT NULL)"
+        )
+        conn.execute(
+            "INSERT INTO snapshots (version, saved_at, sha256, size, payload) VALUES (?, ?, ?, ?, ?)",
+            ("7", time.time(), hashlib.sha256(raw).hexdigest(), len(raw), zlib.compress(raw)),
+        )
+
+    # Snapshots saved before the migration still answer for "the account stored last"
+    assert asyncio.run(snapshot_store.load_latest())["version"] == 7
+    run(snapshot_store._save, snapshot(8), "3:111")
+
+    with sqlite3.connect(store) as conn:
+        assert "account" in [row[1] for row in conn.execute("PRAGMA table_info(snapshots)")]
+    assert rows(store, None) == ["7"]
+    assert rows(store, "3:111") == ["8"]
@@ -0,0 +1,39 @@
+import asyncio
+
+import pytest
+
+import snapshot_store
+import websocket_server
+
+
+@pytest.fixture
+def offline(tmp_path, monkeypatch):
+    """No DIM connected and no account seen since startup, with an empty snapshot store."""
+    monkeypatch.setattr(snapshot_store, "DB_PATH", tmp_path / "snapshots.sqlite3")
+    monkeypatch.setattr(snapshot_store, "_conn", None)
+    monkeypatch.setattr(snapshot_store, "_latest", {})
+    monkeypatch.setattr(websocket_server, "_accounts", {})
+    monkeypatch.setattr(websocket_server, "_connections", {})
+    monkeypatch.setattr(websocket_server, "_known_accounts", {})
+    monkeypatch.setattr(websocket_server, "_started_at", None)
+    monkeypatch.setattr(websocket_server, "_last_disconnect_at", None)
+
+
+def test_offline_answers_for_the_account_stored_last(offline):
+    snapshot = {"type": "pong", "version": 4, "weapons": {"data": []}, "armor": {"data": []}, "stores": {"data": []}}
+    # SQLite connections belong to the store's own thread
+    snapshot_store._executor.submit(snapshot_store._save, snapshot, "3:111").result()
+    snapshot_store._executor.submit(snapshot_store._save, {**snapshot, "version": 9}, "3:222").result()
+
+    stored = asyncio.run(websocket_server.get_inventory())
+
+    assert stored["source"] == "disk"
+    assert stored["version"] == 9
+    # No cache or single-flight state for an account that isn't known yet
+    assert websocket_server._accounts == {}
+
+
+def test_offline_with_nothing_stored_fails_without_creating_state(offline):
+    with pytest.raises(RuntimeError, match="No websocket connection"):
+        asyncio.run(websocket_server.get_inventory())
+    assert websocket_server._accounts == {}
@@ -10,6 +10,7 @@ import json
 import os
 from pathlib import Path
 
+from dim_messages import encode_record
 from websocket_server import request_inventory, start_websocket_server
 
 
@@ -38,7 +39,7 @@ async def handle_user_input():
                 # Save response to desktop
                 output_path = Path.home() / "Desktop" / "dim_inventory_response.json"
                 with open(output_path, "w") as f:
-                    json.dump(response, f, indent=2)
+                    json.dump(response, f, indent=2, default=encode_record)
                 
                 # Log summary
                 weapons = response.get('weapons', {}).get('data', [])
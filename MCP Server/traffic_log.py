@@ -0,0 +1,116 @@
+"""Append-only capture of websocket traffic, for replaying DIM sessions offline.
+
+With DIM_MCP_RECORD=<path> set, the server appends to that file every frame it
+receives from or sends to DIM, each connect and disconnect, and each MCP tool
+call (the cause of the server's pings and transfers). replay.py plays a
+recording back against the server.
+
+The file is a magic line followed by records. Each record is a fixed header
+(wall-clock time, kind, text/binary flag, connection number, payload length)
+and the raw payload: frames as sent on the wire, tool calls as compact JSON.
+A path ending in .gz is gzip-compressed; every run appends a new gzip member.
+
+Records are handed to a single writer thread, so they land in order and disk
+I/O never stalls the event loop. Records still buffered when the process is
+killed outright are lost.
+"""
+
+import atexit
+import gzip
+import json
+import os
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, NamedTuple, Union
+
+RECORD_PATH = os.environ.get("DIM_MCP_RECORD")
+
+MAGIC = b"DIMREC1\n"
+# Record kinds
+CONNECT, DISCONNECT, FRAME_IN, FRAME_OUT, TOOL_CALL = range(5)
+KIND_NAMES = ("connect", "disconnect", "in", "out", "tool")
+
+# time (s since epoch), kind, 1 if the payload is text, connection number, payload bytes
+_HEADER = struct.Struct("<dBBII")
+
+
+class Record(NamedTuple):
+    time: float
+    kind: int
+    connection: int
+    payload: Union[str, bytes]
+
+
+class Recorder:
+    """Appends records to one file from a dedicated writer thread."""
+
+    def __init__(self, path):
+        self.path = path
+        self.records = 0
+        self.bytes = 0
+        opener = gzip.open if path.endswith(".gz") else open
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = opener(path, "ab")
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="traffic-log")
+        if new:
+            self._executor.submit(self._file.write, MAGIC)
+
+    def record(self, kind, connection=0, payload=b""):
+        """Queue one record; returns immediately."""
+        is_text = isinstance(payload, str)
+        data = payload.encode("utf-8") if is_text else payload
+        header = _HEADER.pack(time.time(), kind, is_text, connection, len(data))
+        self.records += 1
+        self.bytes += len(header) + len(data)
+        self._executor.submit(self._file.write, header + data)
+
+    def close(self):
+        """Write out every queued record and close the file."""
+        self._executor.shutdown(wait=True)
+        self._file.close()
+
+
+_recorder = Recorder(RECORD_PATH) if RECORD_PATH else None
+if _recorder is not None:
+    atexit.register(_recorder.close)
+
+
+def recording() -> bool:
+    """Whether DIM_MCP_RECORD is set."""
+    return _recorder is not None
+
+
+def record(kind, connection=0, payload=b""):
+    """Append a record to the traffic log, if DIM_MCP_RECORD is set."""
+    if _recorder is not None:
+        _recorder.record(kind, connection, payload)
+
+
+def record_tool_call(tool, arguments):
+    """Append an MCP tool call, if DIM_MCP_RECORD is set."""
+    if _recorder is not None:
+        _recorder.record(TOOL_CALL, 0, json.dumps({"tool": tool, "arguments": arguments}, separators=(",", ":"), default=str))
+
+
+def read(path) -> Iterator[Record]:
+    """
+    Yield the records of a traffic log in the order they were written.
+
+    Raises:
+        ValueError: If the file isn't a traffic log
+    """
+    opener = gzip.open if str(path).endswith(".gz") else open
+    with opener(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a DIM MCP traffic log")
+        while True:
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                # End of file, or a record cut short by a crash
+                return
+            timestamp, kind, is_text, connection, length = _HEADER.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length:
+                return
+            yield Record(timestamp, kind, connection, payload.decode("utf-8") if is_text else payload)
@@ -1,134 +1,665 @@
 import asyncio
-import websockets
+import contextvars
+import itertools
 import json
 import logging
+import os
 import ssl
-from pathlib import Path
+import time
+
+import dim_messages
+import metrics
+import snapshot_store
+import snapshot_writer
+import traffic_log
+import workers
 
 # Global state - these need to be thread-safe for MCP integration
 import threading
 _state_lock = threading.Lock()
-response_futures = {}
-_current_ws = None
+response_futures = {}        # requestId -> future awaiting DIM's reply
+_pending_reply_types = {}    # requestId -> (reply message type, Connection), for replies without an ID
+_progress_updates = {}      # requestId -> progress messages received so far
+_last_progress_at = {}       # requestId -> time.monotonic() of the latest progress message
+_request_ids = itertools.count(1)
+# Connection numbers, for telling connections apart in the traffic log
+_connection_ids = itertools.count(1)
+
+# Connected DIM tabs by account key, newest last. Requests go to the newest one.
+_connections = {}
+# Snapshot cache per account key
+_accounts = {}
+# Account info from hello by account key, kept after the tab disconnects
+_known_accounts = {}
+# Callbacks run with an account key when DIM pushes a change to its inventory
+_inventory_listeners = []
+
+# Account key for DIM builds that don't say which account they are in hello
+DEFAULT_ACCOUNT = "default"
+
+# When DIM was last connected or the server started; tool calls only wait for DIM
+# to (re)connect shortly after one of those
+_started_at = time.monotonic()
+_last_disconnect_at = None
+
+# Seconds the current tool call spent waiting for DIM to connect
+connect_wait = contextvars.ContextVar("connect_wait", default=0.0)
 
 # Logging setup
 logging.basicConfig(level=logging.INFO, format='%(message)s')
 logger = logging.getLogger(__name__)
 
-PORT = 9130
-CERT_PATH = "/Users/maxschecter/Desktop/DIM-MCP/cert.pem"
-KEY_PATH = "/Users/maxschecter/Desktop/DIM-MCP/key.pem"
+PORT = int(os.environ.get("DIM_MCP_PORT", "9130"))
+CERT_PATH = os.environ.get("DIM_MCP_CERT_PATH", "/Users/maxschecter/Desktop/DIM-MCP/cert.pem")
+KEY_PATH = os.environ.get("DIM_MCP_KEY_PATH", "/Users/maxschecter/Desktop/DIM-MCP/key.pem")
+
+# How many bucket lanes DIM may transfer at once, and how long a transfer may go
+# without any progress before we give up on it
+TRANSFER_CONCURRENCY = int(os.environ.get("DIM_MCP_TRANSFER_CONCURRENCY", "3"))
+TRANSFER_IDLE_TIMEOUT = 30.0
+
+# Inventory snapshot cache - tool calls within the TTL share one DIM round trip
+SNAPSHOT_TTL = float(os.environ.get("DIM_MCP_SNAPSHOT_TTL", "15"))
+
+# Protocol-level heartbeat: a tab that misses a pong for HEARTBEAT_TIMEOUT is dropped
+HEARTBEAT_INTERVAL = float(os.environ.get("DIM_MCP_HEARTBEAT_INTERVAL", "20"))
+HEARTBEAT_TIMEOUT = 20.0
+
+# How long a request waits for DIM to (re)connect, e.g. across a page reload, and
+# how recently DIM must have been around for waiting to be worth it
+CONNECT_WAIT = float(os.environ.get("DIM_MCP_CONNECT_WAIT", "15"))
+RECONNECT_WINDOW = 60.0
+# Retries for idempotent requests (pings) whose connection closed before replying
+REQUEST_RETRIES = 2
+
+# Wire encoding. "deflate" negotiates permessage-deflate with the browser ("none"
+# turns it off), and with DIM_MCP_STRING_TABLE=1 pings ask DIM to send each
+# repeated name once in a string table instead of once per item.
+COMPRESSION = os.environ.get("DIM_MCP_COMPRESSION", "deflate")
+COMPRESSION_MODES = ("deflate", "none")
+if COMPRESSION not in COMPRESSION_MODES:
+    raise ValueError(f"DIM_MCP_COMPRESSION must be one of {', '.join(COMPRESSION_MODES)}, got {COMPRESSION!r}")
+STRING_TABLE = os.environ.get("DIM_MCP_STRING_TABLE", "1") == "1"
+
+# Ingestion limits. Pings ask DIM to split inventories into pong_chunk messages of
+# CHUNK_ITEMS items (0 asks for one message), which are decoded as they arrive; no
+# single frame may exceed MAX_MESSAGE_BYTES and no chunked upload MAX_UPLOAD_BYTES.
+# At most MAX_QUEUED_FRAMES received frames are buffered before reads pause, so a
+# fast sender is held back by TCP flow control rather than by our memory.
+CHUNK_ITEMS = int(os.environ.get("DIM_MCP_CHUNK_ITEMS", "500"))
+MAX_MESSAGE_BYTES = int(os.environ.get("DIM_MCP_MAX_MESSAGE_BYTES", str(16 * 1024 * 1024)))
+MAX_UPLOAD_BYTES = int(os.environ.get("DIM_MCP_MAX_UPLOAD_BYTES", str(64 * 1024 * 1024)))
+MAX_QUEUED_FRAMES = 16
+
+# After the first sync on a connection, ask DIM to push inventory changes as they
+# happen. While it does, tool calls read the live model without a round trip.
+PUSH_UPDATES = os.environ.get("DIM_MCP_PUSH_UPDATES", "1") == "1"
+
+
+class DisconnectedError(RuntimeError):
+    """DIM's connection closed before it replied."""
+
+
+class Connection:
+    """One DIM tab connected to the server."""
+
+    __slots__ = (
+        "id", "websocket", "account_key", "account", "connected_at", "last_seen", "inventory_model",
+        "subscribe_sent", "subscribed",
+    )
+
+    def __init__(self, websocket):
+        self.id = next(_connection_ids)
+        self.websocket = websocket
+        # Set by the client's hello; None until then
+        self.account_key = None
+        self.account = None
+        self.connected_at = time.time()
+        # time.monotonic() of the last message from this tab
+        self.last_seen = time.monotonic()
+        # DIM's inventory as last synced over this connection, patched by delta pongs:
+        # {"version": ..., "weapons": {id: Item}, "armor": {id: Item}, "stores": [...]}
+        self.inventory_model = None
+        # Whether we asked DIM to push changes, and whether it agreed
+        self.subscribe_sent = False
+        self.subscribed = False
+
+
+class _AccountState:
+    """Inventory snapshot cache for one account."""
+
+    __slots__ = ("snapshot", "version", "fetched_at", "generation", "inflight", "live")
+
+    def __init__(self):
+        self.snapshot = None
+        self.version = 0
+        self.fetched_at = 0.0
+        self.generation = 0
+        self.inflight = None
+        # Subscribed Connection whose pushes keep the snapshot current; the TTL
+        # doesn't apply while it is set
+        self.live = None
+
+
+def _account_state(account_key):
+    """Return the cache state for an account, creating it on first use. Call with _state_lock held."""
+    state = _accounts.get(account_key)
+    if state is None:
+        state = _accounts[account_key] = _AccountState()
+    return state
 
 async def getWeaponsSummary():
-    weapons_output_path = Path.home() / "Desktop" / "dim_weapons.json"
-    try:
-        with open(weapons_output_path, "r") as f:
-            weapons = json.load(f)
-        return weapons
-    except Exception as e:
-        logger.error(f"❌ Failed to load weapons summary: {e}")
-        return []
+    return await snapshot_writer.load("weapons", default=[])
 
 async def getArmorSummary():
-    armor_output_path = Path.home() / "Desktop" / "dim_armor.json"
-    try:
-        with open(armor_output_path, "r") as f:
-            armor = json.load(f)
-        return armor
-    except Exception as e:
-        logger.error(f"❌ Failed to load armor summary: {e}")
-        return []
+    return await snapshot_writer.load("armor", default=[])
 
 async def getStoresSummary():
-    stores_output_path = Path.home() / "Desktop" / "dim_stores.json"
+    return await snapshot_writer.load("stores", default=[])
+
+def _account_key_for(account):
+    """Registry key for the account a client sent in hello, e.g. "3:4611686018467284386"."""
+    if not isinstance(account, dict) or not account.get("membershipId"):
+        return DEFAULT_ACCOUNT
+    return f"{account.get('platformType')}:{account['membershipId']}"
+
+def _stop_live(connection):
+    """Stop treating a connection's pushes as keeping its account current. Call with _state_lock held."""
+    state = _accounts.get(connection.account_key)
+    if state is not None and state.live is connection:
+        state.live = None
+
+def _register(connection, account):
+    """Record which account a connection belongs to (again, if the user switched accounts)."""
+    key = _account_key_for(account)
+    with _state_lock:
+        if connection.account_key is not None:
+            _stop_live(connection)
+            peers = _connections.get(connection.account_key, [])
+            if connection in peers:
+                peers.remove(connection)
+            if not peers:
+                _connections.pop(connection.account_key, None)
+        connection.account_key = key
+        connection.account = account if isinstance(account, dict) else None
+        # A different account means a different inventory, so drop the delta base
+        connection.inventory_model = None
+        _connections.setdefault(key, []).append(connection)
+        _known_accounts[key] = connection.account or {}
+        tabs = len(_connections[key])
+    name = (connection.account or {}).get("displayName") or key
+    logger.info(f"👋 DIM identified as {name}" + (f" ({tabs} tabs for this account)" if tabs > 1 else ""))
+
+def _unregister(connection):
+    """Forget a closed connection and fail the requests still waiting on it."""
+    global _last_disconnect_at
+    with _state_lock:
+        _last_disconnect_at = time.monotonic()
+        _stop_live(connection)
+        peers = _connections.get(connection.account_key, [])
+        if connection in peers:
+            peers.remove(connection)
+        if not peers:
+            _connections.pop(connection.account_key, None)
+        orphaned = [
+            response_futures[rid] for rid, (_, conn) in _pending_reply_types.items()
+            if conn is connection and rid in response_futures
+        ]
+    for future in orphaned:
+        if not future.done():
+            future.set_exception(DisconnectedError("DIM disconnected before replying"))
+
+def connected_accounts():
+    """
+    Describe the accounts with a connected DIM tab.
+
+    Returns:
+        List of {"account", "displayName", "membershipId", "platformType", "tabs",
+        "idle_s", "latency_ms"} dicts. idle_s is the time since the newest tab last
+        sent a message, latency_ms its last heartbeat round trip.
+    """
+    now = time.monotonic()
+    with _state_lock:
+        return [
+            {
+                "account": key,
+                "displayName": (conns[-1].account or {}).get("displayName"),
+                "membershipId": (conns[-1].account or {}).get("membershipId"),
+                "platformType": (conns[-1].account or {}).get("platformType"),
+                "tabs": len(conns),
+                "idle_s": round(now - conns[-1].last_seen, 1),
+                "latency_ms": round(1000 * getattr(conns[-1].websocket, "latency", 0.0), 1),
+            }
+            for key, conns in _connections.items()
+        ]
+
+def resolve_account(account=None):
+    """
+    Map an account selector to a registry key.
+
+    Args:
+        account: Account key, membership ID or display name (case-insensitive).
+            May be omitted when only one account is connected.
+
+    Returns:
+        The account key, or None if no DIM is connected and no account was given
+
+    Raises:
+        LookupError: If the selector matches no known account, or is omitted
+            while several accounts are connected
+    """
+    with _state_lock:
+        if account is None:
+            keys = list(_connections)
+            if len(keys) > 1:
+                raise LookupError(f"Several DIM accounts are connected ({', '.join(keys)}); pass account= to pick one")
+            if not keys:
+                # Between reconnects, keep serving the only account we know about
+                keys = [key for key in _accounts if key is not None]
+            return keys[0] if len(keys) == 1 else None
+
+        wanted = str(account).casefold()
+        # Accounts that are not connected right now may still have a snapshot or be reconnecting
+        for key, info in _known_accounts.items():
+            if wanted in (key.casefold(), str(info.get("membershipId")).casefold(), str(info.get("displayName")).casefold()):
+                return key
+    raise LookupError(f"Unknown DIM account: {account}")
+
+def _select_connection(account_key):
+    """Return the newest connection for an account, or None."""
+    with _state_lock:
+        conns = _connections.get(account_key)
+        return conns[-1] if conns else None
+
+def _connect_wait_budget():
+    """Seconds worth waiting for DIM: only right after startup or a disconnect, when it is likely reloading."""
+    now = time.monotonic()
+    recent = [t for t in (_started_at, _last_disconnect_at) if t is not None and now - t <= RECONNECT_WINDOW]
+    return CONNECT_WAIT if recent else 0.0
+
+async def wait_for_connection(account=None, timeout=None):
+    """
+    Wait, with backoff, until a DIM tab for the account is connected.
+
+    Args:
+        account: Account selector (see resolve_account)
+        timeout: Maximum seconds to wait (defaults to CONNECT_WAIT shortly after
+            startup or a disconnect, and to no wait otherwise)
+
+    Returns:
+        (account key, Connection or None if none connected in time, seconds waited)
+
+    Raises:
+        LookupError: If account is omitted while several accounts are connected
+    """
+    budget = _connect_wait_budget() if timeout is None else timeout
+    start = time.monotonic()
+    delay = 0.05
+    while True:
+        try:
+            account_key = resolve_account(account)
+            connection = _select_connection(account_key)
+        except LookupError:
+            # An explicitly named account may be the one that is reconnecting
+            if account is None or time.monotonic() - start >= budget:
+                raise
+            account_key, connection = None, None
+        waited = time.monotonic() - start
+        if connection is not None or waited >= budget:
+            if waited >= 0.05:
+                metrics.observe("connect_wait_seconds", waited)
+                status = "connected" if connection is not None else "gave up"
+                logger.info(f"⏳ Waited {waited:.1f}s for DIM to connect ({status})")
+            return account_key, connection, waited
+        await asyncio.sleep(min(delay, budget - waited))
+        delay = min(delay * 2, 1.0)
+
+def _resolve_response(response_futures, msg, reply_type, connection, error=None):
+    """Route a reply (or, if error is given, a failure) to the future waiting on its requestId."""
+    with _state_lock:
+        request_id = msg.get("requestId")
+        if request_id is None:
+            # Older DIM builds don't echo IDs - hand the reply to the oldest matching request on this socket
+            request_id = next(
+                (rid for rid, (rtype, conn) in _pending_reply_types.items() if rtype == reply_type and conn is connection),
+                None,
+            )
+        future = response_futures.get(str(request_id)) if request_id is not None else None
+
+    if future is not None and not future.done():
+        if error is not None:
+            future.set_exception(error)
+            return
+        logger.info(f"✅ Resolving {reply_type} for request {request_id}")
+        future.set_result(msg)
+    else:
+        logger.info(f"⚠️ No request waiting for {reply_type} (requestId={request_id})")
+
+def _record_progress(msg):
+    """Collect a progress message for its request and push that request's deadline back."""
+    request_id = str(msg.get("requestId"))
+    with _state_lock:
+        updates = _progress_updates.get(request_id)
+        if updates is None:
+            logger.info(f"⚠️ No request waiting for progress (requestId={request_id})")
+            return
+        updates.append(msg)
+        _last_progress_at[request_id] = time.monotonic()
+
+def _touch_request(request_id):
+    """Push a pending request's idle deadline back; returns False if nothing is waiting on it."""
+    with _state_lock:
+        if request_id not in response_futures:
+            return False
+        _last_progress_at[request_id] = time.monotonic()
+        return True
+
+async def _send_request(connection, message, reply_type, timeout, progress=None):
+    """
+    Send a request to DIM tagged with a fresh requestId and wait for the matching reply.
+
+    Many requests can be in flight at once; each reply is routed by its requestId.
+
+    Args:
+        connection: Connection to send on (None if the account has no DIM connected)
+        message: Request body (requestId is added)
+        reply_type: Message type of the final reply
+        timeout: Seconds to wait for the reply
+        progress: Optional list that collects progress messages for this request.
+            When given, timeout is an idle timeout: each progress message restarts it.
+
+    Raises:
+        RuntimeError: If no websocket connection is available
+        DisconnectedError: If the connection closes before DIM replies
+        asyncio.TimeoutError: If DIM does not reply (or report progress) in time
+    """
+    from websockets.exceptions import ConnectionClosed
+
+    with _state_lock:
+        request_id = str(next(_request_ids))
+        future = asyncio.get_running_loop().create_future()
+        response_futures[request_id] = future
+        _pending_reply_types[request_id] = (reply_type, connection)
+        if progress is not None:
+            _progress_updates[request_id] = progress
+
+    request_type = message.get("type")
     try:
-        with open(stores_output_path, "r") as f:
-            stores = json.load(f)
-        return stores
-    except Exception as e:
-        logger.error(f"❌ Failed to load stores summary: {e}")
-        return []
+        if connection is None:
+            raise RuntimeError("No websocket connection available")
+        with metrics.span("ws_send", request=request_type):
+            payload = json.dumps({**message, "requestId": request_id})
+            traffic_log.record(traffic_log.FRAME_OUT, connection.id, payload)
+            await connection.websocket.send(payload)
+        metrics.incr("ws_bytes_out", len(payload))
+
+        deadline = time.monotonic() + timeout
+        with metrics.span("ws_wait", request=request_type):
+            while True:
+                try:
+                    return await asyncio.wait_for(asyncio.shield(future), timeout=max(0.0, deadline - time.monotonic()))
+                except asyncio.TimeoutError:
+                    last_progress = _last_progress_at.get(request_id)
+                    if last_progress is None or last_progress + timeout <= time.monotonic():
+                        metrics.incr("timeouts", request=request_type)
+                        raise
+                    deadline = last_progress + timeout
+    except ConnectionClosed:
+        raise DisconnectedError("DIM disconnected before replying")
+    finally:
+        with _state_lock:
+            response_futures.pop(request_id, None)
+            _pending_reply_types.pop(request_id, None)
+            _progress_updates.pop(request_id, None)
+            _last_progress_at.pop(request_id, None)
+
+def _apply_pong(connection, msg):
+    """
+    Merge a pong into a connection's in-memory inventory model.
 
-async def handle_client(websocket, response_futures):
-    global _current_ws
+    Full pongs replace the model; delta pongs patch it in place.
+
+    Returns:
+        False if the pong is a delta against a version we don't have
+    """
+    with _state_lock:
+        if not msg.get("delta"):
+            connection.inventory_model = {
+                "version": msg["version"],
+                "weapons": {w.id: w for w in msg["weapons"]["data"]},
+                "armor": {a.id: a for a in msg["armor"]["data"]},
+                "stores": msg["stores"]["data"],
+            }
+            return True
+
+        model = connection.inventory_model
+        if model is None or model["version"] != msg["baseVersion"]:
+            return False
+
+        for kind in ("weapons", "armor"):
+            patch = msg[kind]
+            items = model[kind]
+            for item_id in patch["removed"]:
+                items.pop(item_id, None)
+            for item in patch["changed"]:
+                items[item.id] = item
+        model["stores"] = msg["stores"]["data"]
+        model["version"] = msg["version"]
+        logger.info(
+            f"🧩 Applied inventory delta v{msg['baseVersion']} -> v{msg['version']} "
+            f"({len(msg['weapons']['changed']) + len(msg['armor']['changed'])} changed)"
+        )
+        return True
+
+def _model_as_response(connection):
+    """Render a connection's inventory model in the full pong shape the parsing helpers expect."""
+    with _state_lock:
+        model = connection.inventory_model
+        return {
+            "type": "pong",
+            "version": model["version"],
+            "weapons": {"type": "weapons", "data": list(model["weapons"].values())},
+            "armor": {"type": "armor", "data": list(model["armor"].values())},
+            "stores": {"type": "stores", "data": model["stores"]},
+        }
+
+def add_inventory_listener(callback):
+    """
+    Call callback(account_key) on the event loop whenever an account's snapshot
+    changes: DIM pushed a change, a ping brought a new version, or it was
+    invalidated (e.g. after a transfer) and the next read fetches a fresh one.
+    """
+    _inventory_listeners.append(callback)
+
+def _notify_listeners(key):
+    for callback in list(_inventory_listeners):
+        try:
+            callback(key)
+        except Exception as e:
+            logger.error(f"🚨 Inventory listener failed: {e}")
+
+def _publish_model(connection):
+    """Make a subscribed connection's model its account's live snapshot, and tell the listeners."""
+    if connection.inventory_model is None or connection.account_key is None:
+        return
+    snapshot = _model_as_response(connection)
+    key = connection.account_key
     with _state_lock:
-        _current_ws = websocket
+        state = _account_state(key)
+        state.snapshot = snapshot
+        state.version += 1
+        state.fetched_at = time.monotonic()
+        # A ping still in flight must not overwrite this with an older reply
+        state.generation += 1
+        state.inflight = None
+        state.live = connection
+    snapshot_store.save(snapshot, key)
+    _notify_listeners(key)
+
+def _apply_push(connection, msg):
+    """Apply a delta DIM pushed on its own, falling back to pings if it doesn't fit our model."""
+    with metrics.span("apply_pong"):
+        applied = _apply_pong(connection, msg)
+    if not applied:
+        # E.g. the push crossed a ping reply; the next tool call resyncs with a ping
+        logger.info("🔄 Pushed inventory delta doesn't apply, resyncing on the next request")
+        metrics.incr("delta_resyncs")
+        with _state_lock:
+            _stop_live(connection)
+        return
+    metrics.incr("pongs", kind="push")
+    _publish_model(connection)
+
+async def _subscribe(connection):
+    """Ask DIM to push inventory changes on this connection from now on."""
+    from websockets.exceptions import ConnectionClosed
+
+    connection.subscribe_sent = True
+    message = {"type": "subscribe"}
+    if STRING_TABLE:
+        message["encoding"] = dim_messages.STRING_TABLE_ENCODING
+    payload = json.dumps(message)
+    try:
+        traffic_log.record(traffic_log.FRAME_OUT, connection.id, payload)
+        await connection.websocket.send(payload)
+    except ConnectionClosed:
+        pass
+
+async def handle_client(websocket, response_futures):
+    from websockets.exceptions import ConnectionClosed
+
+    # DIM starts every connection with a full send, so each connection keeps its own delta base
+    connection = Connection(websocket)
+    # requestId -> ChunkedPong for pongs still arriving in chunks on this connection
+    uploads = {}
     logger.info(f"✅ DIM connected from: {websocket.remote_address}")
+    metrics.incr("ws_connections")
+    traffic_log.record(traffic_log.CONNECT, connection.id)
     try:
         async for message in websocket:
+            traffic_log.record(traffic_log.FRAME_IN, connection.id, message)
+            connection.last_seen = time.monotonic()
+            metrics.incr("ws_bytes_in", len(message))
             try:
-                msg = json.loads(message)
+                with metrics.span("json_decode"):
+                    if len(message) >= workers.OFFLOAD_MIN_BYTES:
+                        # Awaited before the next frame is read, so messages stay in order
+                        msg = await workers.run(dim_messages.decode, message)
+                    else:
+                        msg = dim_messages.decode(message)
+                mtype = msg.get("type")
+
+                if mtype == "pong_chunk":
+                    request_id = str(msg.get("requestId"))
+                    if not _touch_request(request_id):
+                        # The ping gave up; don't hold the rest of its upload
+                        uploads.pop(request_id, None)
+                        continue
+                    upload = uploads.get(request_id)
+                    if upload is None:
+                        upload = uploads[request_id] = dim_messages.ChunkedPong(request_id, MAX_UPLOAD_BYTES)
+                    upload.add(msg, len(message))
+                    metrics.incr("pong_chunks")
+                    continue
+
+                if mtype == "pong" and "chunks" in msg:
+                    request_id = str(msg.get("requestId"))
+                    upload = uploads.pop(request_id, None) or dim_messages.ChunkedPong(request_id, MAX_UPLOAD_BYTES)
+                    msg = upload.commit(msg)
+                    logger.info(f"🧱 Reassembled pong from {msg['chunks']} chunks ({upload.bytes} bytes)")
             except json.JSONDecodeError:
                 logger.info(f"📝 Received non-JSON message: {message}")
                 continue
-
-            if not isinstance(msg, dict):
+            except dim_messages.MessageError as e:
+                logger.warning(f"⚠️ Dropping malformed message from DIM: {e}")
+                metrics.incr("malformed_messages", type=e.message_type or "unknown")
+                if e.message_type in ("pong", "pong_chunk", "transfer_items_response"):
+                    # Fail the waiting request now rather than letting it time out
+                    reply_type = "pong" if e.message_type == "pong_chunk" else e.message_type
+                    uploads.pop(str(e.request_id), None)
+                    error = RuntimeError(f"DIM sent a malformed {reply_type}: {e}")
+                    _resolve_response(response_futures, {"requestId": e.request_id}, reply_type, connection, error=error)
                 continue
 
-            mtype = msg.get("type")
-
             if mtype == "hello":
                 logger.info("👋 Client said hello")
+                _register(connection, msg.get("account"))
                 continue
 
             if mtype == "weapons":
-                weapons = msg.get("data")
-                weapons_output_path = Path.home() / "Desktop" / "dim_weapons.json"
-                with open(weapons_output_path, "w") as f:
-                    json.dump(weapons, f, indent=2)
-                logger.info(f"📁 Saved weapons summary to: {weapons_output_path}")
                 logger.info("🗃️ Weapons summary received")
+                await snapshot_writer.persist("weapons", msg["data"])
                 continue
 
             if mtype == "armor":
-                armor = msg.get("data")
-                armor_output_path = Path.home() / "Desktop" / "dim_armor.json"
-                with open(armor_output_path, "w") as f:
-                    json.dump(armor, f, indent=2)
-                logger.info(f"📁 Saved armor summary to: {armor_output_path}")
                 logger.info("🦺 Armor summary received")
+                await snapshot_writer.persist("armor", msg["data"])
                 continue
 
             if mtype == "stores":
-                stores = msg.get("data")
-                stores_output_path = Path.home() / "Desktop" / "dim_stores.json"
-                with open(stores_output_path, "w") as f:
-                    json.dump(stores, f, indent=2)
-                logger.info(f"📁 Saved stores summary to: {stores_output_path}")
                 logger.info("🏪 Stores summary received")
+                await snapshot_writer.persist("stores", msg["data"])
+                continue
+
+            if mtype == "subscribed":
+                # Older DIM builds never answer, and keep being pinged on every TTL miss
+                logger.info("📬 DIM will push inventory changes")
+                connection.subscribed = True
+                _publish_model(connection)
+                continue
+
+            if mtype == "pong" and msg.get("push"):
+                logger.info("📬 Received pushed inventory update")
+                _apply_push(connection, msg)
                 continue
 
             if mtype == "pong":
                 logger.info("🔁 Received pong from client")
-                logger.info(f"📊 Pong data keys: {list(msg.keys())}")
-                if "pong" in response_futures:
-                    logger.info("✅ Setting pong future result")
-                    response_futures["pong"].set_result(msg)
-                else:
-                    logger.info("⚠️ No pong future waiting")
+                _resolve_response(response_futures, msg, "pong", connection)
                 continue
 
             if mtype == "transfer_items_response":
                 logger.info("📦 Received transfer items response from client")
-                if "transfer_items" in response_futures:
-                    logger.info("✅ Setting transfer items future result")
-                    response_futures["transfer_items"].set_result(msg)
-                else:
-                    logger.info("⚠️ No transfer items future waiting")
+                _resolve_response(response_futures, msg, "transfer_items_response", connection)
                 continue
-    except websockets.exceptions.ConnectionClosed as e:
+
+            if mtype == "transfer_items_progress":
+                status = "✅" if msg["success"] else f"❌ {msg['error']}"
+                logger.info(f"🚚 Transfer {msg['completed']}/{msg['total']}: {msg['instanceId']} {status}")
+                _record_progress(msg)
+                continue
+    except ConnectionClosed as e:
+        metrics.incr("ws_disconnects")
         logger.info(f"❌ DIM disconnected (code={getattr(e, 'code', '?')}, reason={getattr(e, 'reason', '')})")
     except Exception as e:
         logger.error(f"🚨 WebSocket error: {e}")
+    finally:
+        traffic_log.record(traffic_log.DISCONNECT, connection.id)
+        _unregister(connection)
 
-async def start_websocket_server():
-    """Start the WebSocket server and return the server coroutine."""
+def _ssl_context(cert_path, key_path):
     ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
     ssl_context.check_hostname = False
     ssl_context.verify_mode = ssl.CERT_NONE
+    ssl_context.load_cert_chain(cert_path, key_path)
+    return ssl_context
+
+async def start_websocket_server(cert_path=None, key_path=None, port=None):
+    """
+    Start the WebSocket server and return the server coroutine.
+
+    Args:
+        cert_path: TLS certificate (defaults to CERT_PATH)
+        key_path: TLS private key (defaults to KEY_PATH)
+        port: Port to listen on (defaults to PORT)
+    """
+    cert_path = cert_path or CERT_PATH
+    key_path = key_path or KEY_PATH
+    port = port or PORT
 
     try:
-        ssl_context.load_cert_chain(CERT_PATH, KEY_PATH)
+        # Reading and parsing the key happens on a thread, so the MCP handshake isn't held up
+        ssl_context = await asyncio.to_thread(_ssl_context, cert_path, key_path)
         logger.info("🔒 Using SSL certificates from DIM")
     except FileNotFoundError:
         logger.error("❌ SSL certificates not found. Run DIM to generate them.")
@@ -136,21 +667,34 @@ async def start_websocket_server():
     except Exception as e:
         logger.error(f"❌ SSL setup error: {e}")
         raise
+    metrics.mark_startup("tls_loaded")
 
-    logger.info(f"🚀 Secure WebSocket server started on wss://localhost:{PORT}")
+    if traffic_log.recording():
+        logger.info(f"🎙️ Recording websocket traffic to {traffic_log.RECORD_PATH}")
+    logger.info(f"🚀 Secure WebSocket server started on wss://localhost:{port}")
     logger.info("Waiting for DIM to connect...\n")
 
+    # Imported only now, like the handlers' ConnectionClosed, to keep it off the MCP startup path
+    import websockets
+
     try:
         server = await websockets.serve(
             lambda ws: handle_client(ws, response_futures),
             "localhost",
-            PORT,
+            port,
             ssl=ssl_context,
-            ping_interval=None,  # disable protocol pings
+            # Heartbeat pings (answered by the browser itself) detect dead tabs
+            ping_interval=HEARTBEAT_INTERVAL or None,
+            ping_timeout=HEARTBEAT_TIMEOUT,
             close_timeout=10,
-            max_size=None,       # accept messages of any size (our chunks are ~2 MB)
-            max_queue=64,        # buffer more frames if needed
+            compression=None if COMPRESSION == "none" else COMPRESSION,
+            # Bounded frames and a short receive queue: big inventories arrive in chunks
+            max_size=MAX_MESSAGE_BYTES,
+            max_queue=MAX_QUEUED_FRAMES,
         )
+        metrics.mark_startup("websocket_listening")
+        stages = ", ".join(f"{stage} {seconds * 1000:.0f} ms" for stage, seconds in metrics.startup().items())
+        logger.info(f"⏱️ Startup: {stages}")
 
         # Keep the server running
         await server.wait_closed()
@@ -165,26 +709,63 @@ async def main():
     except KeyboardInterrupt:
         logger.info("\n👋 Shutting down server...")
 
-async def request_inventory():
+async def _ping_inventory(connection):
+    """Ping one connection for its inventory, resyncing in full if the delta doesn't apply."""
     with _state_lock:
-        current_ws = _current_ws
-        if "pong" in response_futures:
-            del response_futures["pong"]
-        loop = asyncio.get_event_loop()
-        future = loop.create_future()
-        response_futures["pong"] = future
-
-    if current_ws is not None:
-        logger.info("📡 Sending ping to DIM")
-        await current_ws.send(json.dumps({"type": "ping"}))
-    else:
-        raise RuntimeError("No websocket connection available")
+        model = connection.inventory_model if connection is not None else None
+        since_version = model["version"] if model is not None else None
+    ping = {"type": "ping"}
+    if since_version is not None:
+        ping["sinceVersion"] = since_version
+    if STRING_TABLE:
+        # DIM builds without string tables ignore this and send plain names
+        ping["encoding"] = dim_messages.STRING_TABLE_ENCODING
+    if CHUNK_ITEMS:
+        # Likewise, DIM builds without chunking send the whole pong at once
+        ping["chunkSize"] = CHUNK_ITEMS
+
+    logger.info("📡 Sending ping to DIM, waiting for pong...")
+    response = await _send_request(connection, ping, "pong", timeout=10.0)
+    with metrics.span("apply_pong"):
+        applied = _apply_pong(connection, response)
+    if not applied:
+        logger.info("🔄 Inventory delta base mismatch, requesting full resync")
+        metrics.incr("delta_resyncs")
+        ping.pop("sinceVersion", None)
+        response = await _send_request(connection, ping, "pong", timeout=10.0)
+        with metrics.span("apply_pong"):
+            _apply_pong(connection, response)
+    logger.info("✅ Received pong response")
+    metrics.incr("pongs", kind="delta" if response.get("delta") else "full")
+    if connection.subscribed:
+        with _state_lock:
+            _account_state(connection.account_key).live = connection
+    elif PUSH_UPDATES and not connection.subscribe_sent:
+        await _subscribe(connection)
+    return _model_as_response(connection)
+
+async def _fetch_inventory(account=None):
+    """
+    Fetch an account's inventory, waiting for DIM to connect and retrying if it reconnects mid-request.
 
+    Returns:
+        (snapshot in full pong shape, seconds spent waiting for DIM to connect)
+    """
+    waited_total = 0.0
+    attempt = 0
     try:
-        logger.info("⏳ Waiting for pong response...")
-        response = await asyncio.wait_for(future, timeout=10.0)
-        logger.info("✅ Received pong response")
-        return response
+        while True:
+            _, connection, waited = await wait_for_connection(account)
+            waited_total += waited
+            try:
+                return await _ping_inventory(connection), waited_total
+            except DisconnectedError:
+                # A ping has no side effects, so it is safe to ask the next connection
+                if attempt >= REQUEST_RETRIES:
+                    raise
+                attempt += 1
+                metrics.incr("request_retries", request="ping")
+                logger.info(f"🔁 DIM disconnected mid-request, retrying ({attempt}/{REQUEST_RETRIES})")
     except asyncio.TimeoutError:
         logger.error("⏰ Timeout waiting for pong response")
         raise RuntimeError("Timeout waiting for inventory data")
@@ -192,67 +773,232 @@ async def request_inventory():
         logger.error(f"❌ Error waiting for pong: {e}")
         raise
 
-async def transfer_items(instance_ids: list[str], target_store_id: str):
+async def request_inventory(account=None):
+    """
+    Ping DIM for an account's inventory and return it in full pong shape.
+
+    Once a snapshot has been synced, DIM only sends the items that changed since
+    that version; a full resync is requested if the delta doesn't apply. If DIM
+    is reconnecting (e.g. reloading), waits up to CONNECT_WAIT for it and
+    retries a ping whose connection closed.
+
+    Args:
+        account: Account selector (see resolve_account)
+    """
+    response, _ = await _fetch_inventory(account)
+    return response
+
+async def _refresh_snapshot(account_key, generation):
+    """Fetch a fresh inventory from DIM and store it unless it was invalidated meanwhile."""
+    state = _accounts[account_key]
+    try:
+        response, waited = await _fetch_inventory(account_key)
+        changed = False
+        with _state_lock:
+            if generation == state.generation:
+                previous = state.snapshot
+                # An unchanged inventory comes back with the same DIM version
+                changed = previous is None or previous.get("version") != response.get("version")
+                state.snapshot = response
+                state.version += 1
+                state.fetched_at = time.monotonic()
+                logger.info(f"🗂️ Cached inventory snapshot v{state.version} for {account_key}")
+        snapshot_store.save(response, account_key)
+        if changed:
+            _notify_listeners(account_key)
+        return response, waited
+    finally:
+        with _state_lock:
+            if generation == state.generation:
+                state.inflight = None
+
+def _discard_result(future):
+    """Retrieve a background fetch's outcome so an unawaited failure isn't reported as unhandled."""
+    if not future.cancelled():
+        future.exception()
+
+async def get_inventory(max_age: float | None = None, account: str | None = None):
+    """
+    Return an account's inventory snapshot, fetching from DIM only when the cache is stale.
+
+    While DIM pushes changes to the account (see PUSH_UPDATES), the snapshot is
+    kept current and returned whatever its age. Concurrent callers that miss the
+    cache share a single in-flight fetch. If DIM can't be reached, the newest snapshot saved to disk is returned instead, with
+    "source": "disk" and its "savedAt" timestamp. While no DIM tab for the
+    account is connected, that stored snapshot is returned straight away and the
+    fetch (including the wait for DIM to reconnect) carries on in the background;
+    only an account with nothing stored waits for DIM. Before any DIM has
+    connected, the account stored last is answered for; no cache state is kept
+    until a connected tab says which account it is.
+
+    Args:
+        max_age: Maximum acceptable snapshot age in seconds (defaults to SNAPSHOT_TTL)
+        account: Account selector (see resolve_account); may be omitted when only
+            one account is connected
+
+    Returns:
+        Dict in the same shape as request_inventory(). Time spent waiting for DIM
+        to connect is added to the connect_wait context variable.
+
+    Raises:
+        LookupError: If the account selector is unknown or ambiguous
+    """
+    account_key = resolve_account(account)
+    if account_key is None:
+        # No DIM has connected since startup, so there is no account to keep a cache
+        # for yet: answer for the account stored last, or wait for a tab to connect
+        stored = await snapshot_store.load_latest()
+        if stored is not None:
+            logger.info(f"📀 DIM not connected yet; answering from stored snapshot v{stored.get('version')}")
+            metrics.incr("snapshot_cache", result="stored")
+            return stored
+        account_key, connection, waited = await wait_for_connection(account)
+        connect_wait.set(connect_wait.get() + waited)
+        if connection is None:
+            raise RuntimeError("No websocket connection available")
+    ttl = SNAPSHOT_TTL if max_age is None else max_age
+    with _state_lock:
+        state = _account_state(account_key)
+        if state.snapshot is not None and state.live is not None:
+            metrics.incr("snapshot_cache", result="live")
+            return state.snapshot
+        if state.snapshot is not None and time.monotonic() - state.fetched_at <= ttl:
+            logger.info(f"⚡ Serving cached inventory snapshot v{state.version}")
+            metrics.incr("snapshot_cache", result="hit")
+            return state.snapshot
+        future = state.inflight
+        metrics.incr("snapshot_cache", result="miss" if future is None else "coalesced")
+        if future is None:
+            future = asyncio.ensure_future(_refresh_snapshot(account_key, state.generation))
+            state.inflight = future
+    if _select_connection(account_key) is None:
+        # DIM may be reloading; rather than hold the call for CONNECT_WAIT, answer
+        # from the stored snapshot and let the fetch finish in the background
+        stored = await snapshot_store.load_latest(account_key)
+        if stored is not None:
+            future.add_done_callback(_discard_result)
+            logger.info(f"📀 DIM not connected; answering from stored snapshot v{stored.get('version')} while it reconnects")
+            metrics.incr("snapshot_cache", result="stored")
+            return stored
+    # Shield so a cancelled tool call does not cancel the fetch other callers share
+    try:
+        response, waited = await asyncio.shield(future)
+        connect_wait.set(connect_wait.get() + waited)
+        return response
+    except RuntimeError as e:
+        stored = await snapshot_store.load_latest(account_key)
+        if stored is None:
+            raise
+        logger.warning(f"📀 {e}; answering from stored snapshot v{stored.get('version')}")
+        metrics.incr("snapshot_cache", result="stored")
+        return stored
+
+def invalidate_inventory(account=None):
+    """
+    Drop cached snapshots so the next get_inventory() fetches from DIM.
+
+    Args:
+        account: Account key to invalidate (defaults to every account)
+    """
+    dropped = []
+    with _state_lock:
+        for key, state in _accounts.items():
+            if account is None or key == account:
+                if state.snapshot is not None:
+                    dropped.append(key)
+                state.snapshot = None
+                state.generation += 1
+                state.inflight = None
+    logger.info("🧹 Inventory snapshot invalidated")
+    for key in dropped:
+        _notify_listeners(key)
+
+def snapshot_version(account=None):
+    """Return the version number of an account's cached snapshot (0 if none has been fetched)."""
+    account_key = resolve_account(account)
+    with _state_lock:
+        state = _accounts.get(account_key)
+        return state.version if state is not None else 0
+
+async def transfer_items(instance_ids: list[str], target_store_id: str, account: str | None = None):
     """
     Transfer items by their instance IDs to a target character/store.
 
     Args:
         instance_ids: List of item instance IDs to transfer
         target_store_id: Character ID or 'vault' to transfer items to
+        account: Account selector (see resolve_account)
 
     Returns:
         Dict containing transfer results
 
     Raises:
         RuntimeError: If no websocket connection or timeout
+        LookupError: If the account selector is unknown or ambiguous
+
+    Waits for DIM to connect like request_inventory(), but a transfer whose
+    connection drops is not retried, since some items may already have moved.
     """
-    with _state_lock:
-        current_ws = _current_ws
-        if "transfer_items" in response_futures:
-            del response_futures["transfer_items"]
-        loop = asyncio.get_event_loop()
-        future = loop.create_future()
-        response_futures["transfer_items"] = future
-
-    if current_ws is not None:
-        message = {
-            "type": "transfer_items",
-            "instanceIds": instance_ids,
-            "targetStoreId": target_store_id
-        }
-        logger.info(f"📦 Sending transfer request for {len(instance_ids)} items to {target_store_id}")
-        await current_ws.send(json.dumps(message))
-    else:
-        raise RuntimeError("No websocket connection available")
+    account_key, connection, waited = await wait_for_connection(account)
+    connect_wait.set(connect_wait.get() + waited)
+    message = {
+        "type": "transfer_items",
+        "instanceIds": instance_ids,
+        "targetStoreId": target_store_id,
+        "concurrency": TRANSFER_CONCURRENCY,
+    }
+    progress = []
 
     try:
-        logger.info("⏳ Waiting for transfer response...")
-        response = await asyncio.wait_for(future, timeout=30.0)  # Longer timeout for transfers
+        logger.info(f"📦 Sending transfer request for {len(instance_ids)} items to {target_store_id}")
+        # DIM reports each item as it finishes, and each report extends the deadline
+        # Not retried: DIM may have moved some items before the connection dropped
+        response = await _send_request(
+            connection, message, "transfer_items_response",
+            timeout=TRANSFER_IDLE_TIMEOUT, progress=progress,
+        )
         logger.info("✅ Received transfer response")
 
-        if response.get("success"):
-            results = response.get("results", [])
-            success_count = len([r for r in results if r.get("success")])
-            fail_count = len([r for r in results if not r.get("success")])
+        if response["success"]:
+            results = response["results"]
+            success_count = len([r for r in results if r["success"]])
+            fail_count = len(results) - success_count
             logger.info(f"📊 Transfer completed: {success_count} successful, {fail_count} failed")
+            metrics.incr("transferred_items", success_count, outcome="success")
+            metrics.incr("transferred_items", fail_count, outcome="failed")
 
             # Log failed transfers for debugging
             for result in results:
-                if not result.get("success"):
-                    logger.warning(f"❌ Failed to transfer {result.get('instanceId')}: {result.get('error')}")
+                if not result["success"]:
+                    logger.warning(f"❌ Failed to transfer {result['instanceId']}: {result['error']}")
         else:
-            logger.error(f"❌ Transfer failed: {response.get('error')}")
+            logger.error(f"❌ Transfer failed: {response['error']}")
+            metrics.incr("transfer_requests_failed")
 
         return response
-    except asyncio.TimeoutError:
-        logger.error("⏰ Timeout waiting for transfer response")
-        raise RuntimeError("Timeout waiting for transfer completion")
+    except (asyncio.TimeoutError, DisconnectedError) as e:
+        reason = "Disconnected" if isinstance(e, DisconnectedError) else "Timed out"
+        logger.error(f"⏰ {reason} waiting for transfer response ({len(progress)}/{len(instance_ids)} items reported)")
+        if not progress:
+            if isinstance(e, DisconnectedError):
+                raise
+            raise RuntimeError("Timeout waiting for transfer completion")
+        return {
+            "success": False,
+            "error": f"{reason} after {len(progress)} of {len(instance_ids)} items were processed",
+            "results": [
+                {key: update.get(key) for key in ("instanceId", "success", "error")} for update in progress
+            ],
+        }
     except Exception as e:
         logger.error(f"❌ Error waiting for transfer response: {e}")
         raise
+    finally:
+        # Items may have moved even on failure or timeout
+        invalidate_inventory(account_key)
 
 if __name__ == "__main__":
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
-        logger.info("\n👋 Shutting down server...")
\ No newline at end of file
+        logger.info("\n👋 Shutting down server...")
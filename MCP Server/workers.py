@@ -0,0 +1,93 @@
+"""Worker pools for CPU-heavy stages, so the event loop stays free for I/O.
+
+DIM_MCP_WORKERS picks the mode:
+
+    thread   (default) Decoding large DIM messages, building inventory indexes,
+             filtering, search, the optimizers and rendering run in a thread
+             pool. The interpreter hands the event loop a turn every few
+             milliseconds, so websocket heartbeats, the stdio transport, the
+             orphan guard and other tool calls keep moving.
+    process  As "thread", and the armor optimizer's combination search (pure
+             NumPy) runs in a process pool, with its arrays passed through
+             shared memory instead of being pickled.
+    off      Everything runs inline on the event loop.
+
+Stages that build or read Item objects stay in threads even in process mode:
+those objects live in this process and would have to be pickled across.
+"""
+
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
+
+MODE = os.environ.get("DIM_MCP_WORKERS", "thread")
+WORKER_COUNT = int(os.environ.get("DIM_MCP_WORKER_COUNT", str(min(4, os.cpu_count() or 1))))
+# DIM messages smaller than this are decoded inline; handing them off costs more than it saves
+OFFLOAD_MIN_BYTES = 256 * 1024
+
+_threads = None
+_processes = None
+
+
+def _thread_pool():
+    global _threads
+    if _threads is None:
+        _threads = ThreadPoolExecutor(max_workers=WORKER_COUNT, thread_name_prefix="dim-worker")
+    return _threads
+
+
+def _process_pool():
+    global _processes
+    if _processes is None:
+        _processes = ProcessPoolExecutor(max_workers=WORKER_COUNT)
+    return _processes
+
+
+async def run(fn, *args):
+    """Run fn(*args) in the thread pool and await its result (inline when MODE is "off")."""
+    if MODE == "off":
+        return fn(*args)
+    return await asyncio.get_running_loop().run_in_executor(_thread_pool(), fn, *args)
+
+
+def _run_shared(fn, specs, args):
+    import numpy as np
+
+    blocks = [shared_memory.SharedMemory(name=name) for name, _, _ in specs]
+    arrays = None
+    try:
+        arrays = [np.ndarray(shape, dtype=dtype, buffer=block.buf) for block, (_, shape, dtype) in zip(blocks, specs)]
+        return fn(*arrays, *args)
+    finally:
+        # Views into a block must be gone before it can be closed
+        arrays = None
+        for block in blocks:
+            block.close()
+
+
+def call_shared(fn, arrays, *args):
+    """
+    Call fn(*arrays, *args), in a worker process when MODE is "process".
+
+    Each NumPy array is copied once into a shared memory block that the worker
+    maps, rather than being pickled. fn must be a module-level function with a
+    small, picklable result. Blocks until done, so call it from a worker thread.
+    """
+    if MODE != "process":
+        return fn(*arrays, *args)
+    import numpy as np
+
+    blocks = []
+    try:
+        specs = []
+        for array in arrays:
+            block = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+            blocks.append(block)
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+            specs.append((block.name, array.shape, array.dtype.str))
+        return _process_pool().submit(_run_shared, fn, specs, args).result()
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
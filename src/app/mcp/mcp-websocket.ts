@@ -1,4 +1,5 @@
 /* eslint-disable no-console */
+import type { DestinyAccount } from 'app/accounts/destiny-account';
 import { currentAccountSelector } from 'app/accounts/selectors';
 import { transfer } from 'app/bungie-api/destiny2-api';
 import type { TagValue } from 'app/inventory/dim-item-info';
@@ -15,19 +16,56 @@ import { getStore } from 'app/inventory/stores-helpers';
 import { showNotification } from 'app/notifications/notifications';
 import { D1_StatHashes } from 'app/search/d1-known-values';
 import { refresh } from 'app/shell/refresh-events';
+import { observe, unobserve } from 'app/store/observerMiddleware';
 import store from 'app/store/store';
 import {
   getItemKillTrackerInfo,
   getMasterworkStatNames,
   isKillTrackerSocket,
 } from 'app/utils/item-utils';
+import { delay } from 'app/utils/promises';
 import { getSocketsByIndexes, getWeaponSockets, isEnhancedPerk } from 'app/utils/socket-utils';
 import { StatHashes } from 'data/d2/generated-enums';
+import { debounce } from 'es-toolkit';
 
 const MCP_PORT = 9130;
 const MCP_URL = `wss://localhost:${MCP_PORT}`;
 let socket: WebSocket | null = null;
 
+/**
+ * The last inventory we sent over this connection, with each item serialized
+ * so the next ping can be answered with only what changed since then.
+ */
+interface SentInventory {
+  version: number;
+  weapons: Map<string, string>;
+  armor: Map<string, string>;
+  stores: string;
+}
+let lastSent: SentInventory | undefined;
+
+/**
+ * The account this tab last identified itself as in a hello. The server keys
+ * its connections and caches by account, so it must hear about account switches.
+ */
+let helloAccount: DestinyAccount | undefined;
+
+function sendHello() {
+  const account = currentAccountSelector(store.getState());
+  helloAccount = account;
+  socket?.send(
+    JSON.stringify({
+      type: 'hello',
+      account: account && {
+        membershipId: account.membershipId,
+        platformType: account.originalPlatformType,
+        displayName: account.displayName,
+        destinyVersion: account.destinyVersion,
+      },
+    }),
+  );
+}
+
 function buildBaseItemSummary(
   item: DimItem,
   getTag: (item: DimItem) => TagValue | undefined,
@@ -112,6 +150,8 @@ function buildArmorSummary(
   const base = buildBaseItemSummary(item, getTag, getNotes, statNames, stores);
   return {
     ...base,
+    slot: item.bucket.name,
+    classType: item.classType,
     mods: buildSocketNames(item),
   };
 }
@@ -129,7 +169,90 @@ function buildStoreInfo(stores: readonly DimStore[]) {
   }));
 }
 
-async function sendInventory() {
+/**
+ * Serialize each item and compare it to what was previously sent, returning the
+ * items that are new or changed and the IDs of items that are gone.
+ */
+function diffItems<T extends { id: string }>(items: T[], previous: Map<string, string> | undefined) {
+  const serialized = new Map<string, string>();
+  const changed: T[] = [];
+  for (const item of items) {
+    const json = JSON.stringify(item);
+    serialized.set(item.id, json);
+    if (previous?.get(item.id) !== json) {
+      changed.push(item);
+    }
+  }
+  const removed = previous ? [...previous.keys()].filter((id) => !serialized.has(id)) : [];
+  return { serialized, changed, removed };
+}
+
+/** Summary fields whose values repeat across items and are sent through the string table */
+const TABLE_FIELDS = new Set([
+  'name',
+  'type',
+  'slot',
+  'gearTier',
+  'element',
+  'owner',
+  'ownerId',
+  'tag',
+  'masterworkType',
+]);
+
+/**
+ * Each distinct string gets an index the first time it is seen. With the
+ * "strings" encoding, pongs send this table once and items refer to it.
+ */
+class StringTable {
+  readonly strings: string[] = [];
+  private readonly indexes = new Map<string, number>();
+
+  ref(value: string) {
+    let index = this.indexes.get(value);
+    if (index === undefined) {
+      index = this.strings.length;
+      this.strings.push(value);
+      this.indexes.set(value, index);
+    }
+    return index;
+  }
+}
+
+function encodeItem(item: object, table: StringTable) {
+  const encoded: Record<string, unknown> = {};
+  for (const [key, value] of Object.entries(item)) {
+    if (typeof value === 'string' && TABLE_FIELDS.has(key)) {
+      encoded[key] = table.ref(value);
+    } else if ((key === 'mods' || key === 'perks') && Array.isArray(value)) {
+      encoded[key] =
+        key === 'perks'
+          ? (value as string[][]).map((column) => column.map((perk) => table.ref(perk)))
+          : (value as string[]).map((mod) => table.ref(mod));
+    } else {
+      encoded[key] = value;
+    }
+  }
+  return encoded;
+}
+
+/** Pause sending chunks while this much is still waiting in the socket's send buffer. */
+const MAX_BUFFERED_BYTES = 4 * 1024 * 1024;
+
+async function sendWhenDrained(ws: WebSocket, message: object) {
+  while (ws.bufferedAmount > MAX_BUFFERED_BYTES && ws.readyState === WebSocket.OPEN) {
+    await delay(20);
+  }
+  ws.send(JSON.stringify(message));
+}
+
+async function sendInventory(
+  requestId?: string,
+  sinceVersion?: number,
+  encoding?: string,
+  chunkSize?: number,
+  push = false,
+) {
   const state = store.getState();
   const allItems = allItemsSelector(state);
   const getTag = getTagSelector(state);
@@ -153,19 +276,168 @@ async function sendInventory() {
 
   const storeInfo = buildStoreInfo(stores);
 
-  if (socket?.readyState === WebSocket.OPEN) {
-    socket.send(
-      JSON.stringify({
+  // Only send a delta if the server already has the version we last sent
+  const base = lastSent && sinceVersion === lastSent.version ? lastSent : undefined;
+  const weaponDiff = diffItems(weapons, base?.weapons);
+  const armorDiff = diffItems(armor, base?.armor);
+  const storesJson = JSON.stringify(storeInfo);
+  const unchanged =
+    base !== undefined &&
+    weaponDiff.changed.length === 0 &&
+    weaponDiff.removed.length === 0 &&
+    armorDiff.changed.length === 0 &&
+    armorDiff.removed.length === 0 &&
+    storesJson === base.stores;
+  // A push is a delta the server applies to what it has, so it needs a base and a change
+  if (push && (!base || unchanged)) {
+    return;
+  }
+  const version = base && unchanged ? base.version : (lastSent?.version ?? 0) + 1;
+  lastSent = {
+    version,
+    weapons: weaponDiff.serialized,
+    armor: armorDiff.serialized,
+    stores: storesJson,
+  };
+
+  // The server asks for the string table encoding in its ping when it can decode it
+  const table = encoding === 'strings' ? new StringTable() : undefined;
+  const encode = (items: object[]) => (table ? items.map((item) => encodeItem(item, table)) : items);
+  let sentStrings = 0;
+  const newStrings = () => {
+    const strings = table ? table.strings.slice(sentStrings) : [];
+    sentStrings += strings.length;
+    return strings;
+  };
+
+  const ws = socket;
+  if (ws?.readyState !== WebSocket.OPEN) {
+    return;
+  }
+
+  // When the server asks for chunks, items go out in numbered pong_chunk messages
+  // (each with the strings it adds to the table) and the pong itself commits them
+  const itemsPerChunk = chunkSize ?? 0;
+  const chunked = itemsPerChunk > 0;
+  let chunks = 0;
+  if (chunked) {
+    const sections = [
+      ['weapons', base ? weaponDiff.changed : weapons],
+      ['armor', base ? armorDiff.changed : armor],
+    ] as const;
+    for (const [kind, items] of sections) {
+      for (let start = 0; start < items.length; start += itemsPerChunk) {
+        const chunkItems = encode(items.slice(start, start + itemsPerChunk));
+        await sendWhenDrained(ws, {
+          type: 'pong_chunk',
+          requestId,
+          seq: chunks++,
+          kind,
+          items: chunkItems,
+          ...(table && { encoding: 'strings', strings: newStrings() }),
+        });
+        if (ws.readyState !== WebSocket.OPEN) {
+          return;
+        }
+      }
+    }
+  }
+
+  const pong = base
+    ? {
         type: 'pong',
-        weapons: { type: 'weapons', data: weapons },
-        armor: { type: 'armor', data: armor },
+        requestId,
+        delta: true,
+        baseVersion: base.version,
+        version,
+        weapons: chunked
+          ? { removed: weaponDiff.removed }
+          : { changed: encode(weaponDiff.changed), removed: weaponDiff.removed },
+        armor: chunked
+          ? { removed: armorDiff.removed }
+          : { changed: encode(armorDiff.changed), removed: armorDiff.removed },
         stores: { type: 'stores', data: storeInfo },
+      }
+    : {
+        type: 'pong',
+        requestId,
+        version,
+        weapons: chunked ? { type: 'weapons' } : { type: 'weapons', data: encode(weapons) },
+        armor: chunked ? { type: 'armor' } : { type: 'armor', data: encode(armor) },
+        stores: { type: 'stores', data: storeInfo },
+      };
+  await sendWhenDrained(ws, {
+    ...pong,
+    ...(table && { encoding: 'strings', strings: newStrings() }),
+    ...(chunked && { chunks }),
+    ...(push && { push: true }),
+  });
+}
+
+const INVENTORY_OBSERVER_ID = 'mcp-inventory-observer';
+/** Inventory changes within this window are pushed to the server as one update. */
+const PUSH_DEBOUNCE_MS = 500;
+
+/**
+ * Set once the server subscribes to pushed updates on this connection, with the
+ * encoding it asked for.
+ */
+let pushSubscription: { encoding?: string } | undefined;
+
+const pushInventory = debounce(() => {
+  if (pushSubscription && socket?.readyState === WebSocket.OPEN) {
+    sendInventory(undefined, lastSent?.version, pushSubscription.encoding, undefined, true);
+  }
+}, PUSH_DEBOUNCE_MS);
+
+function subscribeToInventory(encoding?: string) {
+  if (!pushSubscription) {
+    store.dispatch(
+      observe({
+        id: INVENTORY_OBSERVER_ID,
+        getObserved: (rootState) => [
+          allItemsSelector(rootState),
+          storesSelector(rootState),
+          getTagSelector(rootState),
+          getNotesSelector(rootState),
+        ],
+        equals: (a, b) =>
+          Array.isArray(a) && Array.isArray(b) && a.every((value, i) => Object.is(value, b[i])),
+        sideEffect: () => pushInventory(),
       }),
     );
   }
+  pushSubscription = { encoding };
+  socket?.send(JSON.stringify({ type: 'subscribed' }));
+  // Catch the server up on anything that changed since our last reply
+  pushInventory();
+}
+
+function unsubscribeFromInventory() {
+  if (pushSubscription) {
+    pushSubscription = undefined;
+    pushInventory.cancel();
+    store.dispatch(unobserve(INVENTORY_OBSERVER_ID));
+  }
 }
 
-async function transferItemsByInstanceIds(instanceIds: string[], targetStoreId: string) {
+interface TransferResult {
+  instanceId: string;
+  success: boolean;
+  error?: string;
+}
+
+/** How many bucket lanes may transfer at the same time, unless the server asks otherwise. */
+const DEFAULT_TRANSFER_CONCURRENCY = 3;
+/** Minimum spacing between the start of two transfers, to stay under Bungie's throttling. */
+const TRANSFER_MIN_INTERVAL_MS = 100;
+
+async function transferItemsByInstanceIds(
+  instanceIds: string[],
+  targetStoreId: string,
+  concurrency: number,
+  onProgress: (result: TransferResult, completed: number) => void,
+) {
   const state = store.getState();
   const allItems = allItemsSelector(state);
   const stores = storesSelector(state);
@@ -179,56 +451,77 @@ async function transferItemsByInstanceIds(instanceIds: string[], targetStoreId:
   if (!targetStore) {
     throw new Error(`Target store not found: ${targetStoreId}`);
   }
+  // Narrowed copies for use inside the lane runner below
+  const transferAccount: DestinyAccount = account;
+  const transferTarget: DimStore = targetStore;
+
+  const results: TransferResult[] = new Array<TransferResult>(instanceIds.length);
+  let completed = 0;
+  function finish(index: number, result: TransferResult) {
+    results[index] = result;
+    completed++;
+    onProgress(result, completed);
+  }
 
-  const results: { instanceId: string; success: boolean; error?: string }[] = [];
-
-  for (const instanceId of instanceIds) {
-    try {
-      const item = allItems.find((i) => i.id === instanceId);
-      if (!item) {
-        results.push({
-          instanceId,
-          success: false,
-          error: `Item not found: ${instanceId}`,
-        });
-        continue;
-      }
-
-      if (item.owner === targetStore.id && !item.location.inPostmaster) {
-        results.push({
-          instanceId,
-          success: true,
-        });
-        continue;
+  // Items in the same bucket move one at a time so they don't race each other for
+  // space; items in different buckets are independent and move concurrently.
+  const itemsById = new Map(allItems.map((i) => [i.id, i]));
+  const lanes = new Map<number, { index: number; item: DimItem }[]>();
+  instanceIds.forEach((instanceId, index) => {
+    const item = itemsById.get(instanceId);
+    if (!item) {
+      finish(index, { instanceId, success: false, error: `Item not found: ${instanceId}` });
+    } else if (item.owner === targetStore.id && !item.location.inPostmaster) {
+      finish(index, { instanceId, success: true });
+    } else if (item.notransfer && item.owner !== targetStore.id) {
+      finish(index, { instanceId, success: false, error: 'Item cannot be transferred' });
+    } else {
+      const lane = lanes.get(item.bucket.hash) ?? [];
+      lane.push({ index, item });
+      lanes.set(item.bucket.hash, lane);
+    }
+  });
+
+  let nextStart = 0;
+  async function runLane(lane: { index: number; item: DimItem }[]) {
+    for (const { index, item } of lane) {
+      const wait = nextStart - Date.now();
+      nextStart = Math.max(Date.now(), nextStart) + TRANSFER_MIN_INTERVAL_MS;
+      if (wait > 0) {
+        await delay(wait);
       }
-
-      if (item.notransfer && item.owner !== targetStore.id) {
-        results.push({
-          instanceId,
+      try {
+        await transfer(transferAccount, item, transferTarget, item.amount);
+        finish(index, { instanceId: item.id, success: true });
+      } catch (error) {
+        finish(index, {
+          instanceId: item.id,
           success: false,
-          error: 'Item cannot be transferred',
+          error: error instanceof Error ? error.message : String(error),
         });
-        continue;
       }
+    }
+  }
 
-      await transfer(account, item, targetStore, item.amount);
-      results.push({
-        instanceId,
-        success: true,
-      });
-    } catch (error) {
-      results.push({
-        instanceId,
-        success: false,
-        error: error instanceof Error ? error.message : String(error),
-      });
+  const pendingLanes = [...lanes.values()];
+  async function worker() {
+    for (let lane = pendingLanes.shift(); lane; lane = pendingLanes.shift()) {
+      await runLane(lane);
     }
   }
+  await Promise.all(
+    Array.from({ length: Math.min(Math.max(1, concurrency), pendingLanes.length) }, worker),
+  );
 
   return results;
 }
 
 function handleMessage(event: MessageEvent) {
+  // Re-identify before answering if the user switched accounts since the last hello
+  if (currentAccountSelector(store.getState()) !== helloAccount) {
+    sendHello();
+  }
+
   let message: any = null;
   try {
     // eslint-disable-next-line @typescript-eslint/no-unsafe-assignment
@@ -242,20 +535,38 @@ function handleMessage(event: MessageEvent) {
 
   // eslint-disable-next-line @typescript-eslint/no-unsafe-member-access
   if (message?.type === 'ping') {
-    sendInventory();
+    sendInventory(
+      // eslint-disable-next-line @typescript-eslint/no-unsafe-member-access
+      message.requestId as string | undefined,
+      // eslint-disable-next-line @typescript-eslint/no-unsafe-member-access
+      message.sinceVersion as number | undefined,
+      // eslint-disable-next-line @typescript-eslint/no-unsafe-member-access
+      message.encoding as string | undefined,
+      // eslint-disable-next-line @typescript-eslint/no-unsafe-member-access
+      message.chunkSize as number | undefined,
+    );
     // eslint-disable-next-line @typescript-eslint/no-unsafe-member-access
   } else if (message?.type === 'transfer_items') {
     handleTransferItems(message as TransferItemsMessage);
+    // eslint-disable-next-line @typescript-eslint/no-unsafe-member-access
+  } else if (message?.type === 'subscribe') {
+    // eslint-disable-next-line @typescript-eslint/no-unsafe-member-access
+    subscribeToInventory(message.encoding as string | undefined);
   }
 }
 
 interface TransferItemsMessage {
   type: 'transfer_items';
+  /** Correlation ID chosen by the MCP server, echoed back on the response. */
+  requestId?: string;
   instanceIds: string[];
   targetStoreId: string;
+  /** Maximum number of bucket lanes to transfer concurrently. */
+  concurrency?: number;
 }
 
 async function handleTransferItems(message: TransferItemsMessage) {
+  const { requestId } = message;
   try {
     const { instanceIds, targetStoreId } = message;
 
@@ -267,12 +578,30 @@ async function handleTransferItems(message: TransferItemsMessage) {
       throw new Error('targetStoreId must be a string');
     }
 
-    const results = await transferItemsByInstanceIds(instanceIds, targetStoreId);
+    const results = await transferItemsByInstanceIds(
+      instanceIds,
+      targetStoreId,
+      message.concurrency ?? DEFAULT_TRANSFER_CONCURRENCY,
+      (result, completed) => {
+        if (socket?.readyState === WebSocket.OPEN) {
+          socket.send(
+            JSON.stringify({
+              type: 'transfer_items_progress',
+              requestId,
+              ...result,
+              completed,
+              total: instanceIds.length,
+            }),
+          );
+        }
+      },
+    );
 
     if (socket?.readyState === WebSocket.OPEN) {
       socket.send(
         JSON.stringify({
           type: 'transfer_items_response',
+          requestId,
           results,
           success: true,
         }),
@@ -299,6 +628,7 @@ async function handleTransferItems(message: TransferItemsMessage) {
       socket.send(
         JSON.stringify({
           type: 'transfer_items_response',
+          requestId,
           success: false,
           error: error instanceof Error ? error.message : String(error),
         }),
@@ -315,11 +645,15 @@ async function handleTransferItems(message: TransferItemsMessage) {
 
 function connect() {
   socket = new WebSocket(MCP_URL);
+  // A new connection means a new server-side model, so the next ping gets a full send
+  lastSent = undefined;
+  helloAccount = undefined;
+  unsubscribeFromInventory();
 
   socket.onopen = async () => {
     console.log('MCP WebSocket connected');
     try {
-      socket?.send(JSON.stringify({ type: 'hello' }));
+      sendHello();
     } catch {}
   };
 
@@ -333,6 +667,7 @@ function connect() {
   };
 
   socket.onclose = () => {
+    unsubscribeFromInventory();
     console.warn('MCP WebSocket closed, retrying in 3s');
     setTimeout(connect, 3000);
   };